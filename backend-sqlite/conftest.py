@@ -0,0 +1,41 @@
+# backend-sqlite/conftest.py
+"""
+Configuración de pytest para las pruebas del backend FastAPI (test_*.py).
+
+src/models.py y los controladores importan src.database (motor, SessionLocal, Base, get_db)
+y src.schemas, que cada despliegue define por su cuenta. Si no están en el árbol, se
+registran versiones mínimas con una base SQLite en memoria; cada prueba crea además su
+propia base (ver la fixture db de test_importController.py).
+"""
+import importlib.util
+import sys
+import types
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+
+def _modulo_database() -> types.ModuleType:
+    database = types.ModuleType('src.database')
+    database.engine = create_engine(
+        'sqlite://', connect_args={'check_same_thread': False}, poolclass=StaticPool
+    )
+    database.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=database.engine)
+    database.Base = declarative_base()
+
+    def get_db():
+        db = database.SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    database.get_db = get_db
+    return database
+
+
+if importlib.util.find_spec('src.database') is None:
+    sys.modules['src.database'] = _modulo_database()
+if importlib.util.find_spec('src.schemas') is None:
+    sys.modules['src.schemas'] = types.ModuleType('src.schemas')
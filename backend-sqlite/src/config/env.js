@@ -68,6 +68,13 @@ export const config = {
     enabled: process.env.AUTO_BACKUP_ENABLED === 'true',
     intervalHours: parseInt(process.env.AUTO_BACKUP_INTERVAL_HOURS, 10) || 24,
   },
+
+  // Importación de productos (script Python)
+  importacion: {
+    // Mantener un proceso Python persistente (importProducts.py --serve) entre importaciones
+    workerPersistente: process.env.IMPORT_WORKER_PERSISTENTE !== 'false',
+    timeoutMs: parseInt(process.env.IMPORT_TIMEOUT_MS, 10) || 10 * 60 * 1000, // 10 minutos
+  },
 }
 
 export default config
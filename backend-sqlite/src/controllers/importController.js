@@ -1,4 +1,5 @@
-import { exec } from 'child_process'
+import { exec, spawn } from 'child_process'
+import readline from 'readline'
 import { promisify } from 'util'
 import path from 'path'
 import { fileURLToPath } from 'url'
@@ -7,6 +8,8 @@ import { existsSync } from 'fs'
 import ProductoGeneral from '../models/ProductoGeneral.js'
 import { respuestaExito } from '../utils/helpers.js'
 import { AppError } from '../middlewares/errorHandler.js'
+import importWorkerService from '../services/importWorkerService.js'
+import config from '../config/env.js'
 
 const execAsync = promisify(exec)
 const __filename = fileURLToPath(import.meta.url)
@@ -34,6 +37,53 @@ async function detectarComandoPython() {
   return null
 }
 
+/**
+ * Ejecuta el script con `--output ndjson`: llama a `alProducto` con cada producto a medida
+ * que llegan (sin esperar a que termine ni acumular toda la salida) y resuelve con
+ * { stdout, stderr } como execAsync, donde stdout es la línea del resumen final.
+ * Si el script termina con código distinto de 0, rechaza con error.stdout = resumen.
+ */
+function ejecutarScriptNdjson(pythonCommand, args, alProducto) {
+  return new Promise((resolve, reject) => {
+    const proceso = spawn(pythonCommand, args, {
+      env: { ...process.env, PYTHONIOENCODING: 'utf-8' },
+    })
+    let resumen = ''
+    let stderr = ''
+    proceso.stderr.setEncoding('utf8')
+    proceso.stderr.on('data', (texto) => {
+      // Conservar solo el final para mensajes de error
+      stderr = (stderr + texto).slice(-10000)
+    })
+    readline.createInterface({ input: proceso.stdout }).on('line', (linea) => {
+      const texto = linea.trim()
+      if (!texto) return
+      let registro
+      try {
+        registro = JSON.parse(texto)
+      } catch {
+        resumen = texto
+        return
+      }
+      if (registro.tipo === 'producto') {
+        alProducto(registro)
+      } else {
+        resumen = texto
+      }
+    })
+    proceso.on('error', reject)
+    proceso.on('close', (codigo) => {
+      if (codigo) {
+        const error = new Error(`El script de importación terminó con código ${codigo}`)
+        error.stdout = resumen
+        error.stderr = stderr
+        return reject(error)
+      }
+      resolve({ stdout: resumen, stderr })
+    })
+  })
+}
+
 /**
  * Procesa un archivo XLSX o PDF usando el script Python
  */
@@ -67,6 +117,9 @@ export const importarProductosDesdeArchivo = async (req, res) => {
     // Obtener API key de Gemini si está disponible (opcional para PDFs)
     const apiKey = req.body.apiKey || process.env.GEMINI_API_KEY || null
 
+    // El script guarda el resultado por contenido del archivo; esto obliga a volver a leerlo
+    const reparsear = req.get('x-import-reparsear') === '1' || ['1', 'true'].includes(String(req.body.reparsear))
+
     // Ruta del script Python
     const scriptPath = path.join(__dirname, '../utils/importProducts.py')
     
@@ -86,18 +139,130 @@ export const importarProductosDesdeArchivo = async (req, res) => {
       )
     }
 
-    // Ejecutar script Python
-    const comando = `${pythonCommand} "${scriptPath}" ${extension} "${archivo.path}" ${apiKey ? `"${apiKey}"` : ''}`
-    
-    console.log('Ejecutando comando:', comando.replace(apiKey || '', '***'))
+    // Validar y crear productos en la base de datos a medida que el script los entrega
+    // (salida NDJSON: la inserción avanza mientras Python sigue extrayendo)
+    const productosCreados = []
+    const productosConError = []
+    const usuarioId = req.usuario?.id || null
+    let registrosRecibidos = 0
+
+    const procesarProducto = (productoData) => {
+      registrosRecibidos++
+      try {
+        // Validar datos mínimos
+        if (!productoData.nombre || productoData.nombre.trim() === '') {
+          productosConError.push({
+            producto: productoData,
+            error: 'Nombre vacío'
+          })
+          return
+        }
+
+        // Preparar datos del producto (mapear campos del script Python)
+        const datosProducto = {
+          nombre: productoData.nombre.trim(),
+          codigoBarras: (productoData.codigoBarras && productoData.codigoBarras.trim() !== '') 
+            ? productoData.codigoBarras.trim() 
+            : null,
+          costoBase: Number.parseFloat(productoData.costoBase || productoData.precio || 0) || 0,
+          categoria: productoData.categoria || 'General',
+          unidad: productoData.unidad || 'unidad',
+          descripcion: productoData.descripcion || null,
+          proveedor: productoData.proveedor || null,
+          creadoPorId: usuarioId,
+          tipoCreacion: 'importacion'
+        }
+
+        // Verificar si el producto ya existe (por código de barras o nombre)
+        let productoExistente = null
+        if (datosProducto.codigoBarras) {
+          productoExistente = ProductoGeneral.buscarPorCodigoBarras(datosProducto.codigoBarras)
+        }
+        
+        if (!productoExistente) {
+          // Buscar por nombre (búsqueda aproximada)
+          const productos = ProductoGeneral.buscar({
+            buscar: datosProducto.nombre,
+            limite: 1
+          })
+          
+          if (productos.datos && productos.datos.length > 0) {
+            const productoSimilar = productos.datos[0]
+            // Si el nombre es muy similar, considerarlo duplicado
+            if (productoSimilar.nombre.toLowerCase() === datosProducto.nombre.toLowerCase()) {
+              productoExistente = productoSimilar
+            }
+          }
+        }
+
+        if (productoExistente) {
+          // Actualizar producto existente
+          ProductoGeneral.actualizar(productoExistente.id, {
+            costoBase: datosProducto.costoBase,
+            categoria: datosProducto.categoria
+          })
+          productosCreados.push({
+            ...productoExistente,
+            accion: 'actualizado'
+          })
+        } else {
+          // Crear nuevo producto
+          const nuevoProducto = ProductoGeneral.crear(datosProducto)
+          productosCreados.push({
+            ...nuevoProducto,
+            accion: 'creado'
+          })
+        }
+
+      } catch (error) {
+        console.error('Error al procesar producto:', productoData, error)
+        productosConError.push({
+          producto: productoData,
+          error: error.message || 'Error desconocido'
+        })
+      }
+    }
+
+    // Ejecutar script Python. Los .xlsx usan el motor 'streaming': cada producto sale apenas
+    // se lee su fila (con el motor por omisión el script arma toda la lista antes de emitir).
+    // Los PDF y .xls se emiten al terminar la extracción (la deduplicación necesita todo)
+    const motorStreaming = extension === 'xlsx'
+    const args = [
+      scriptPath, extension, archivo.path, ...(apiKey ? [apiKey] : []), ...(reparsear ? ['--sin-cache'] : []),
+      ...(motorStreaming ? ['--motor', 'streaming'] : []), '--output', 'ndjson'
+    ]
+    const comando = [pythonCommand, ...args].join(' ')
+
+    console.log('Ejecutando comando:', apiKey ? comando.replace(apiKey, '***') : comando)
     
     let stdout
     let stderr = ''
     try {
-      const result = await execAsync(comando, {
-        maxBuffer: 10 * 1024 * 1024, // 10MB
-        encoding: 'utf8'
-      })
+      let result = null
+      if (config.importacion.workerPersistente) {
+        try {
+          result = await importWorkerService.procesar({
+            pythonCommand,
+            scriptPath,
+            tipo: extension,
+            archivo: archivo.path,
+            apiKey,
+            opciones: {
+              ...(reparsear ? { 'sin-cache': true } : {}), ...(motorStreaming ? { motor: 'streaming' } : {}), output: 'ndjson'
+            },
+            alRegistro: procesarProducto,
+            timeoutMs: config.importacion.timeoutMs
+          })
+        } catch (workerError) {
+          // Solo se reintenta con el script si el worker no entregó ningún producto: los que ya
+          // se crearon aparecerían como 'actualizado' al volver a procesar el archivo
+          if (!workerError.workerNoDisponible || registrosRecibidos > 0) throw workerError
+          console.warn('Worker de importación no disponible, ejecutando script directamente:', workerError.message)
+        }
+      }
+      if (!result) {
+        result = await ejecutarScriptNdjson(pythonCommand, args, procesarProducto)
+      }
       stdout = result.stdout || ''
       stderr = result.stderr || ''
     } catch (execError) {
@@ -241,7 +406,7 @@ export const importarProductosDesdeArchivo = async (req, res) => {
       })
     }
 
-    if (!resultado.productos || !Array.isArray(resultado.productos)) {
+    if (!Number.isInteger(resultado.totalProductos)) {
       console.error('Formato de respuesta inválido:', resultado)
       return res.status(500).json({
         exito: false,
@@ -250,97 +415,16 @@ export const importarProductosDesdeArchivo = async (req, res) => {
     }
 
     // Validar que haya productos
-    if (resultado.productos.length === 0) {
+    if (resultado.totalProductos === 0) {
       return res.status(400).json({
         exito: false,
         mensaje: 'No se encontraron productos válidos en el archivo. Verifica que el archivo tenga al menos una columna con nombres de productos y que las filas contengan datos válidos.'
       })
     }
 
-    // Validar y crear productos en la base de datos
-    const productosCreados = []
-    const productosConError = []
-    const usuarioId = req.usuario?.id || null
-
-    for (const productoData of resultado.productos) {
-      try {
-        // Validar datos mínimos
-        if (!productoData.nombre || productoData.nombre.trim() === '') {
-          productosConError.push({
-            producto: productoData,
-            error: 'Nombre vacío'
-          })
-          continue
-        }
-
-        // Preparar datos del producto (mapear campos del script Python)
-        const datosProducto = {
-          nombre: productoData.nombre.trim(),
-          codigoBarras: (productoData.codigoBarras && productoData.codigoBarras.trim() !== '') 
-            ? productoData.codigoBarras.trim() 
-            : null,
-          costoBase: Number.parseFloat(productoData.costoBase || productoData.precio || 0) || 0,
-          categoria: productoData.categoria || 'General',
-          unidad: productoData.unidad || 'unidad',
-          descripcion: productoData.descripcion || null,
-          proveedor: productoData.proveedor || null,
-          creadoPorId: usuarioId,
-          tipoCreacion: 'importacion'
-        }
-
-        // Verificar si el producto ya existe (por código de barras o nombre)
-        let productoExistente = null
-        if (datosProducto.codigoBarras) {
-          productoExistente = ProductoGeneral.buscarPorCodigoBarras(datosProducto.codigoBarras)
-        }
-        
-        if (!productoExistente) {
-          // Buscar por nombre (búsqueda aproximada)
-          const productos = ProductoGeneral.buscar({
-            buscar: datosProducto.nombre,
-            limite: 1
-          })
-          
-          if (productos.datos && productos.datos.length > 0) {
-            const productoSimilar = productos.datos[0]
-            // Si el nombre es muy similar, considerarlo duplicado
-            if (productoSimilar.nombre.toLowerCase() === datosProducto.nombre.toLowerCase()) {
-              productoExistente = productoSimilar
-            }
-          }
-        }
-
-        if (productoExistente) {
-          // Actualizar producto existente
-          ProductoGeneral.actualizar(productoExistente.id, {
-            costoBase: datosProducto.costoBase,
-            categoria: datosProducto.categoria
-          })
-          productosCreados.push({
-            ...productoExistente,
-            accion: 'actualizado'
-          })
-        } else {
-          // Crear nuevo producto
-          const nuevoProducto = ProductoGeneral.crear(datosProducto)
-          productosCreados.push({
-            ...nuevoProducto,
-            accion: 'creado'
-          })
-        }
-
-      } catch (error) {
-        console.error('Error al procesar producto:', productoData, error)
-        productosConError.push({
-          producto: productoData,
-          error: error.message || 'Error desconocido'
-        })
-      }
-    }
-
     // Preparar respuesta
     const respuesta = {
-      totalProcesados: resultado.productos.length,
+      totalProcesados: resultado.totalProductos,
       totalCreados: productosCreados.filter(p => p.accion === 'creado').length,
       totalActualizados: productosCreados.filter(p => p.accion === 'actualizado').length,
       totalErrores: productosConError.length,
@@ -1,112 +1,1061 @@
 # backend-sqlite/src/controllers/importController.py
-from fastapi import APIRouter, UploadFile, HTTPException, Depends
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, UploadFile, HTTPException, Depends, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
 import pandas as pd
-import io
+import asyncio
+import functools
+import hashlib
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+import uuid
 import logging
-from typing import List
-from ..database import get_db
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from itertools import chain
+from typing import Callable, Iterable, Iterator, List, Optional
+from ..database import SessionLocal, engine, get_db
 from .. import models, schemas
+from ..utils import cacheImportacion, coincidenciaNombres, perfilSqlite
 
-router = APIRouter()
+
+@asynccontextmanager
+async def _ciclo_de_vida(app):
+    # PRAGMAs de rendimiento en las conexiones del motor compartido: se registran al iniciar
+    # la aplicación, antes de abrir conexiones, y no en medio del tráfico
+    perfilSqlite.aplicar_perfil(engine)
+    yield
+
+
+router = APIRouter(lifespan=_ciclo_de_vida)
 logger = logging.getLogger(__name__)
 
-@router.post("/api/import/productos")
-async def importar_productos(file: UploadFile, db: Session = Depends(get_db)):
+# Modos de escritura: "lote" escribe por lotes (una transacción por lote);
+# "filas" es el modo original, una consulta y un commit por producto;
+# "diferencial" escribe por lotes pero solo los productos nuevos o con valores distintos
+MODOS_IMPORTACION = ("lote", "filas", "diferencial")
+
+# Formatos de respuesta: "list" retorna cada producto importado (archivos chicos);
+# "summary" solo los totales; "ndjson" transmite una línea por producto al confirmarse
+FORMATOS_RESPUESTA = ("list", "summary", "ndjson")
+
+# Productos por lote en el modo "lote" (y filas por bloque al leer CSV)
+TAMANO_LOTE = int(os.environ.get("IMPORT_TAMANO_LOTE", "500"))
+
+# Bytes por lectura al copiar la subida a disco
+TAMANO_BLOQUE_SUBIDA = 1024 * 1024
+
+# El trabajo bloqueante no corre en el event loop: la lectura de Excel (CPU) va a un pool
+# de procesos y la lectura de CSV y las escrituras en la base a un pool de hilos
+PROCESOS_PARSEO = int(os.environ.get("IMPORT_PROCESOS_PARSEO", "2"))
+HILOS_ESCRITURA = int(os.environ.get("IMPORT_HILOS_ESCRITURA", "4"))
+
+# Importaciones en segundo plano: hilos que las ejecutan (SQLite serializa las escrituras,
+# así que más de uno solo ayuda con la lectura) y trabajos que pueden esperar en cola
+TRABAJOS_SIMULTANEOS = int(os.environ.get("IMPORT_TRABAJOS_SIMULTANEOS", "1"))
+TRABAJOS_EN_COLA = int(os.environ.get("IMPORT_TRABAJOS_EN_COLA", "20"))
+# Trabajos terminados que se conservan para consultar su resultado
+TRABAJOS_RETENIDOS = int(os.environ.get("IMPORT_TRABAJOS_RETENIDOS", "100"))
+
+# Columnas del modelo que una fila del archivo puede actualizar
+_COLUMNAS_ACTUALIZABLES = frozenset(
+    c.key for c in models.Producto.__table__.columns
+) - {"id", "fecha_creacion", "fecha_actualizacion"}
+
+# Tipo Python de cada columna actualizable, para comparar valores en el modo diferencial
+_TIPOS_COLUMNA = {
+    c.key: c.type.python_type for c in models.Producto.__table__.columns if c.key in _COLUMNAS_ACTUALIZABLES
+}
+
+
+class ArchivoSubido:
+    """Subida copiada a un archivo temporal, con el hash de su contenido"""
+
+    def __init__(self, ruta: str, nombre: str, huella: str):
+        self.ruta = ruta
+        self.nombre = nombre
+        self.huella = huella
+        self.desde_cache = False  # True si las filas se tomaron de la cache de resultados
+
+    def eliminar(self):
+        os.unlink(self.ruta)
+
+
+async def _guardar_en_temporal(file: UploadFile) -> ArchivoSubido:
+    """Copia la subida a un archivo temporal por bloques, sin cargarla completa en memoria"""
+    extension = os.path.splitext(file.filename or '')[1].lower()
+    descriptor, ruta = tempfile.mkstemp(prefix='importacion_', suffix=extension)
+    huella = hashlib.sha256()
+    try:
+        with os.fdopen(descriptor, 'wb') as destino:
+            while True:
+                bloque = await file.read(TAMANO_BLOQUE_SUBIDA)
+                if not bloque:
+                    break
+                huella.update(bloque)
+                await run_in_threadpool(destino.write, bloque)
+    except BaseException:
+        os.unlink(ruta)
+        raise
+    return ArchivoSubido(ruta, file.filename or '', huella.hexdigest())
+
+
+def _mapear_columnas(columnas) -> dict:
+    """Valida las columnas mínimas y retorna el renombrado para columnas similares"""
+    columnas = list(columnas)
+    renombrar = {}
+    # Validar columnas mínimas requeridas
+    required_columns = ['nombre', 'categoria', 'precio']
+    for col in required_columns:
+        if col not in columnas:
+            # Intentar mapear columnas similares
+            matching_cols = [c for c in columnas if col in str(c).lower()]
+            if matching_cols:
+                renombrar[matching_cols[0]] = col
+                columnas[columnas.index(matching_cols[0])] = col
+            else:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Columna requerida no encontrada: {col}"
+                )
+    return renombrar
+
+
+_pool_parseo = None
+_ejecutor_escritura = None
+
+
+def _obtener_pool_parseo() -> ProcessPoolExecutor:
+    global _pool_parseo
+    if _pool_parseo is None:
+        _pool_parseo = ProcessPoolExecutor(max_workers=PROCESOS_PARSEO)
+    return _pool_parseo
+
+
+def _obtener_ejecutor_escritura() -> ThreadPoolExecutor:
+    global _ejecutor_escritura
+    if _ejecutor_escritura is None:
+        _ejecutor_escritura = ThreadPoolExecutor(
+            max_workers=HILOS_ESCRITURA, thread_name_prefix="importacion_escritura"
+        )
+    return _ejecutor_escritura
+
+
+def _leer_excel(ruta: str):
+    """Corre en el pool de procesos: retorna las columnas y las filas como dicts"""
+    df = pd.read_excel(ruta)
+    return list(df.columns), df.to_dict('records')
+
+
+def _validar_formato(filename: str):
+    if not filename.endswith(('.xlsx', '.xls', '.csv')):
+        raise HTTPException(status_code=400, detail="Formato de archivo no soportado")
+
+
+def _leer_lotes(ruta: str, filename: str, tamano_lote: int = TAMANO_LOTE) -> Iterator[List[dict]]:
+    """
+    Lee el archivo y produce las filas como dicts en lotes de 'tamano_lote'.
+    Los CSV se leen por bloques (chunksize): cada bloque se escribe antes de leer el siguiente.
+    """
+    _validar_formato(filename)
+    # Determinar el tipo de archivo
+    if filename.endswith('.csv'):
+        renombrar = None
+        for df in pd.read_csv(ruta, chunksize=tamano_lote):
+            if renombrar is None:
+                renombrar = _mapear_columnas(df.columns)
+            if renombrar:
+                df = df.rename(columns=renombrar)
+            # Convertir a formato de salida
+            yield df.to_dict('records')
+        return
+
+    # openpyxl es lento y retiene el GIL: el Excel se lee en otro proceso
+    columnas, productos = _obtener_pool_parseo().submit(_leer_excel, ruta).result()
+    renombrar = _mapear_columnas(columnas)
+    if renombrar:
+        productos = [{renombrar.get(k, k): v for k, v in p.items()} for p in productos]
+    for inicio in range(0, len(productos), tamano_lote):
+        yield productos[inicio:inicio + tamano_lote]
+
+
+def _normalizar_nombre(nombre) -> str:
+    """Clave para comparar nombres: minúsculas y espacios simples"""
+    return ' '.join(str(nombre).split()).lower()
+
+
+def _normalizar_codigo(codigo):
+    """Código de barras como texto (pandas lee los códigos numéricos como int o float)"""
+    if codigo is None:
+        return None
+    if isinstance(codigo, float):
+        if math.isnan(codigo):
+            return None
+        if codigo.is_integer():
+            codigo = int(codigo)
+    texto = str(codigo).strip()
+    return texto or None
+
+
+def _valor_comparable(columna: str, valor):
+    """
+    Valor tal como queda guardado en la columna: NaN se guarda como NULL y SQLite
+    convierte al tipo de la columna (p. ej. una categoría numérica se guarda como texto)
+    """
+    if valor is None or (isinstance(valor, float) and math.isnan(valor)):
+        return None
     try:
-        # Leer el archivo
-        contents = await file.read()
-        
-        # Determinar el tipo de archivo
-        if file.filename.endswith(('.xlsx', '.xls')):
-            df = pd.read_excel(io.BytesIO(contents))
-        elif file.filename.endswith('.csv'):
-            df = pd.read_csv(io.BytesIO(contents))
+        return _TIPOS_COLUMNA[columna](valor)
+    except (TypeError, ValueError):
+        return valor
+
+
+# Marca de "clave sin valor" en el diario de IndiceCatalogo
+_AUSENTE = object()
+
+
+class IndiceCatalogo:
+    """
+    Índice en memoria del catálogo: código de barras -> id y nombre normalizado -> id.
+    Se carga con una sola consulta al inicio de cada importación; cada fila se busca
+    primero por código de barras, después por nombre y, si no hay y se pidió un umbral de
+    similitud, por el nombre más parecido (ver coincidenciaNombres), sin consultar la base.
+    Los productos aún no insertados se registran con ids temporales negativos.
+    Con con_valores también guarda los valores actuales de cada producto (modo diferencial).
+    """
+
+    def __init__(self, con_valores: bool = False, similitud_nombres: Optional[float] = None):
+        self.por_codigo = {}
+        self.por_nombre = {}
+        self.nombres = {}    # id -> nombre tal como está en el catálogo
+        # Nombre normalizado -> nombres parecidos; las claves que ya no están en por_nombre
+        # (producto renombrado o transacción deshecha) se descartan al buscar.
+        # Sin umbral (ni IMPORT_UMBRAL_SIMILITUD) solo se usan nombres iguales
+        if similitud_nombres is None:
+            similitud_nombres = coincidenciaNombres.UMBRAL_SIMILITUD
+        self.por_similitud = (
+            coincidenciaNombres.IndiceNombres(similitud_nombres) if similitud_nombres is not None else None
+        )
+        self.valores = {} if con_valores else None  # id -> valores actuales de las columnas actualizables
+        self._claves = {}    # id -> (nombre normalizado, código) registrados para ese producto
+        self._diario = None  # cambios a deshacer si falla la transacción en curso
+
+    @classmethod
+    def cargar(
+        cls, db: Session, con_valores: bool = False, similitud_nombres: Optional[float] = None
+    ) -> "IndiceCatalogo":
+        indice = cls(con_valores, similitud_nombres)
+        columnas = sorted(_COLUMNAS_ACTUALIZABLES) if con_valores else []
+        consulta = select(
+            models.Producto.id, models.Producto.nombre, models.Producto.codigo_barras,
+            *(getattr(models.Producto, columna) for columna in columnas)
+        ).order_by(models.Producto.id)
+        for id_producto, nombre, codigo, *valores in db.execute(consulta):
+            indice.registrar(id_producto, nombre, codigo)
+            if con_valores:
+                indice.valores[id_producto] = dict(zip(columnas, valores))
+        return indice
+
+    def _asignar(self, tabla: dict, clave, valor):
+        if self._diario is not None:
+            self._diario.append((tabla, clave, tabla.get(clave, _AUSENTE)))
+        if valor is _AUSENTE:
+            tabla.pop(clave, None)
         else:
-            raise HTTPException(status_code=400, detail="Formato de archivo no soportado")
-        
-        # Validar columnas mínimas requeridas
-        required_columns = ['nombre', 'categoria', 'precio']
-        for col in required_columns:
-            if col not in df.columns:
-                # Intentar mapear columnas similares
-                matching_cols = [c for c in df.columns if col in str(c).lower()]
-                if matching_cols:
-                    df.rename(columns={matching_cols[0]: col}, inplace=True)
-                else:
-                    raise HTTPException(
-                        status_code=400, 
-                        detail=f"Columna requerida no encontrada: {col}"
-                    )
-        
-        # Convertir a formato de salida
-        productos = df.to_dict('records')
-        productos_creados = []
-        
-        # Validar y guardar cada producto
-        for producto_data in productos:
-            try:
-                # Validar y limpiar datos
-                if 'precio' in producto_data:
-                    try:
-                        producto_data['precio'] = float(producto_data['precio'])
-                    except (ValueError, TypeError):
-                        producto_data['precio'] = 0.0
-                
-                # Asegurar que los campos requeridos tengan valores por defecto
-                producto_data['activo'] = producto_data.get('activo', True)
-                producto_data['stock'] = int(producto_data.get('stock', 0))
-                
-                # Verificar si el producto ya existe
-                db_producto = db.query(models.Producto).filter(
-                    models.Producto.nombre == str(producto_data['nombre'])
-                ).first()
-                
-                if db_producto:
-                    # Actualizar producto existente
-                    for key, value in producto_data.items():
-                        if hasattr(db_producto, key):
-                            setattr(db_producto, key, value)
+            tabla[clave] = valor
+
+    @contextmanager
+    def transaccion(self):
+        """Si el bloque lanza una excepción, el índice vuelve al estado anterior"""
+        self._diario = []
+        try:
+            yield
+        except BaseException:
+            for tabla, clave, valor in reversed(self._diario):
+                if valor is _AUSENTE:
+                    tabla.pop(clave, None)
                 else:
-                    # Crear nuevo producto
-                    db_producto = models.Producto(**{
-                        'nombre': str(producto_data['nombre']),
-                        'categoria': str(producto_data['categoria']),
-                        'precio': float(producto_data['precio']),
-                        'stock': int(producto_data.get('stock', 0)),
-                        'descripcion': str(producto_data.get('descripcion', '')),
-                        'codigo_barras': str(producto_data.get('codigo_barras', '')) if producto_data.get('codigo_barras') else None,
-                        'activo': bool(producto_data.get('activo', True))
-                    })
-                    db.add(db_producto)
-                
-                db.commit()
-                db.refresh(db_producto)
-                productos_creados.append(db_producto)
-                
-            except Exception as e:
-                db.rollback()
-                logger.error(f"Error al procesar producto {producto_data.get('nombre')}: {str(e)}")
-                continue
-        
+                    tabla[clave] = valor
+            raise
+        finally:
+            self._diario = None
+
+    def buscar(self, nombre, codigo):
+        """Id del producto con ese código de barras o, si no hay, con ese nombre o uno parecido"""
+        return self.ubicar(nombre, codigo)[0]
+
+    def ubicar(self, nombre, codigo) -> tuple:
+        """Como buscar, pero retorna (id, aproximado): aproximado si se encontró por un nombre parecido"""
+        codigo = _normalizar_codigo(codigo)
+        if codigo and codigo in self.por_codigo:
+            return self.por_codigo[codigo], False
+        clave_nombre = _normalizar_nombre(nombre)
+        if clave_nombre in self.por_nombre:
+            return self.por_nombre[clave_nombre], False
+        if self.por_similitud is None:
+            return None, False
+        parecido = self.por_similitud.buscar(clave_nombre, aceptar=self.por_nombre.__contains__)
+        return (self.por_nombre[parecido[0]], True) if parecido else (None, False)
+
+    def registrar(self, id_producto: int, nombre, codigo):
+        """Agrega o actualiza las claves de un producto (reemplaza las que tenía)"""
+        nombre_anterior, codigo_anterior = self._claves.get(id_producto, (None, None))
+        if nombre_anterior is not None and self.por_nombre.get(nombre_anterior) == id_producto:
+            self._asignar(self.por_nombre, nombre_anterior, _AUSENTE)
+        if codigo_anterior is not None and self.por_codigo.get(codigo_anterior) == id_producto:
+            self._asignar(self.por_codigo, codigo_anterior, _AUSENTE)
+
+        clave_nombre = _normalizar_nombre(nombre) if nombre is not None else None
+        codigo = _normalizar_codigo(codigo)
+        # Con nombres repetidos en el catálogo gana el de menor id
+        if clave_nombre and clave_nombre not in self.por_nombre:
+            self._asignar(self.por_nombre, clave_nombre, id_producto)
+            if self.por_similitud is not None:
+                self.por_similitud.agregar(clave_nombre, clave_nombre)
+        if codigo:
+            self._asignar(self.por_codigo, codigo, id_producto)
+        self._asignar(self._claves, id_producto, (clave_nombre, codigo))
+        self._asignar(self.nombres, id_producto, nombre)
+
+    def actualizar(self, id_producto: int, cambios: dict):
+        """Registra los cambios de nombre/código escritos en un producto"""
+        _, codigo_anterior = self._claves.get(id_producto, (None, None))
+        self.registrar(
+            id_producto,
+            cambios['nombre'] if 'nombre' in cambios else self.nombres.get(id_producto),
+            cambios['codigo_barras'] if 'codigo_barras' in cambios else codigo_anterior
+        )
+
+    def reemplazar_id(self, temporal: int, definitivo: int):
+        """Asigna el id real a un producto registrado con id temporal"""
+        nombre, codigo = self._claves.get(temporal, (None, None))
+        if nombre is not None and self.por_nombre.get(nombre) == temporal:
+            self._asignar(self.por_nombre, nombre, definitivo)
+        if codigo is not None and self.por_codigo.get(codigo) == temporal:
+            self._asignar(self.por_codigo, codigo, definitivo)
+        self._asignar(self._claves, temporal, _AUSENTE)
+        self._asignar(self._claves, definitivo, (nombre, codigo))
+        self._asignar(self.nombres, definitivo, self.nombres.get(temporal))
+        self._asignar(self.nombres, temporal, _AUSENTE)
+        if self.valores is not None and temporal in self.valores:
+            self._asignar(self.valores, definitivo, self.valores[temporal])
+            self._asignar(self.valores, temporal, _AUSENTE)
+
+    def fijar_valores(self, id_producto: int, cambios: dict):
+        """Registra los valores escritos en un producto (solo con con_valores)"""
+        if self.valores is not None:
+            self._asignar(self.valores, id_producto, dict(self.valores.get(id_producto, {}), **cambios))
+
+
+class ResumenCambios:
+    """Qué hizo una importación diferencial: filas insertadas, actualizadas, sin cambios, etc."""
+
+    def __init__(self):
+        self.insertados = 0
+        self.actualizados = 0
+        self.sin_cambios = 0
+        self.desactivados = 0
+        self.campos = {}  # columna -> filas en las que cambió
+
+    def sumar(self, otro: "ResumenCambios"):
+        self.insertados += otro.insertados
+        self.actualizados += otro.actualizados
+        self.sin_cambios += otro.sin_cambios
+        self.desactivados += otro.desactivados
+        for columna, veces in otro.campos.items():
+            self.campos[columna] = self.campos.get(columna, 0) + veces
+
+    def como_dict(self) -> dict:
         return {
+            "insertados": self.insertados,
+            "actualizados": self.actualizados,
+            "sinCambios": self.sin_cambios,
+            "desactivados": self.desactivados,
+            "camposActualizados": dict(sorted(self.campos.items()))
+        }
+
+
+def _limpiar_producto(producto_data: dict) -> dict:
+    """Valida y limpia los datos de una fila (en el mismo lugar) y la retorna"""
+    if 'codigo_barras' in producto_data:
+        producto_data['codigo_barras'] = _normalizar_codigo(producto_data['codigo_barras'])
+    if 'precio' in producto_data:
+        try:
+            producto_data['precio'] = float(producto_data['precio'])
+        except (ValueError, TypeError):
+            producto_data['precio'] = 0.0
+
+    # Asegurar que los campos requeridos tengan valores por defecto
+    producto_data['activo'] = producto_data.get('activo', True)
+    producto_data['stock'] = int(producto_data.get('stock', 0))
+    return producto_data
+
+
+def _valores_nuevo_producto(producto_data: dict) -> dict:
+    """Valores con los que se crea un producto que no existe"""
+    return {
+        'nombre': str(producto_data['nombre']),
+        'categoria': str(producto_data['categoria']),
+        'precio': float(producto_data['precio']),
+        'stock': int(producto_data.get('stock', 0)),
+        'descripcion': str(producto_data.get('descripcion', '')),
+        'codigo_barras': str(producto_data.get('codigo_barras', '')) if producto_data.get('codigo_barras') else None,
+        'activo': bool(producto_data.get('activo', True))
+    }
+
+
+def _valor_json(valor):
+    """Las celdas vacías de pandas llegan como NaN, que no es JSON válido"""
+    if isinstance(valor, float) and math.isnan(valor):
+        return None
+    return valor
+
+
+def _resumen_producto(id_producto: int, valores: dict) -> dict:
+    return {
+        "id": id_producto,
+        "nombre": _valor_json(valores.get('nombre')),
+        "categoria": _valor_json(valores.get('categoria')),
+        "precio": _valor_json(valores.get('precio')),
+        "stock": _valor_json(valores.get('stock'))
+    }
+
+
+def _error_fila(fila: int, producto_data: dict, error: Exception) -> dict:
+    # Para errores de base de datos basta el mensaje del driver, sin el SQL
+    error = getattr(error, 'orig', None) or error
+    logger.error(f"Error al procesar producto {producto_data.get('nombre')} (fila {fila}): {str(error)}")
+    return {"fila": fila, "nombre": _valor_json(producto_data.get('nombre')), "error": str(error)}
+
+
+def _importar_por_filas(db: Session, lotes: Iterable[List[dict]], indice: IndiceCatalogo) -> Iterator[tuple]:
+    """
+    Modo original: un commit y un refresh por producto.
+    Produce (filas, productos escritos, errores) después de cada fila.
+    """
+    # Validar y guardar cada producto (fila 1 = encabezados)
+    for fila, producto_data in enumerate(chain.from_iterable(lotes), start=2):
+        try:
+            _limpiar_producto(producto_data)
+
+            # Verificar si el producto ya existe (código de barras, luego nombre)
+            id_existente, aproximado = indice.ubicar(producto_data['nombre'], producto_data.get('codigo_barras'))
+            if aproximado:
+                # Nombre parecido pero no igual: el producto conserva el nombre del catálogo
+                producto_data['nombre'] = indice.nombres[id_existente]
+            db_producto = db.get(models.Producto, id_existente) if id_existente else None
+
+            if db_producto:
+                # Actualizar producto existente
+                for key, value in producto_data.items():
+                    if hasattr(db_producto, key):
+                        setattr(db_producto, key, value)
+            else:
+                # Crear nuevo producto
+                db_producto = models.Producto(**_valores_nuevo_producto(producto_data))
+                db.add(db_producto)
+
+            db.commit()
+            db.refresh(db_producto)
+            indice.registrar(db_producto.id, db_producto.nombre, db_producto.codigo_barras)
+            resumen = _resumen_producto(db_producto.id, {
+                'nombre': db_producto.nombre,
+                'categoria': db_producto.categoria,
+                'precio': db_producto.precio,
+                'stock': db_producto.stock
+            })
+
+        except Exception as e:
+            db.rollback()
+            yield 1, [], [_error_fila(fila, producto_data, e)]
+            continue
+
+        yield 1, [resumen], []
+
+
+def _escribir_filas(
+    db: Session,
+    preparadas: List[tuple],
+    indice: IndiceCatalogo,
+    cambios_diferencial: Optional[ResumenCambios] = None
+) -> List[dict]:
+    """
+    Escribe un grupo de filas ya limpias con un INSERT múltiple y un UPDATE múltiple.
+    Cada fila se busca en el índice del catálogo (código de barras, luego nombre): si el
+    producto existe se actualiza; si no, se crea. Si el mismo producto aparece otra vez
+    en el grupo, las filas posteriores actualizan el que creó la primera.
+    Con 'cambios_diferencial' (el índice debe tener valores) solo se escriben las columnas
+    cuyo valor cambia, y se cuenta cada fila en ese resumen.
+    Debe llamarse dentro de indice.transaccion(). Retorna el resumen de cada fila, en orden.
+    """
+    inserciones = []      # valores de productos nuevos; el id temporal de inserciones[i] es -1 - i
+    actualizaciones = []  # valores (con id) de productos existentes
+    destino = []          # por fila: (id o id temporal, valores tras esa fila)
+    for _, producto_data in preparadas:
+        id_producto, aproximado = indice.ubicar(producto_data['nombre'], producto_data.get('codigo_barras'))
+        if aproximado:
+            # Nombre parecido pero no igual: el producto conserva el nombre del catálogo
+            producto_data['nombre'] = indice.nombres[id_producto]
+        cambios = leidos = {k: v for k, v in producto_data.items() if k in _COLUMNAS_ACTUALIZABLES}
+        if cambios_diferencial is not None and id_producto is not None:
+            actuales = indice.valores.get(id_producto, {})
+            cambios = {
+                k: v for k, v in leidos.items()
+                if _valor_comparable(k, v) != _valor_comparable(k, actuales.get(k))
+            }
+            if not cambios:
+                cambios_diferencial.sin_cambios += 1
+                # El resumen muestra la fila leída, igual que en modo lote
+                destino.append((id_producto, leidos))
+                continue
+            cambios_diferencial.actualizados += 1
+            for columna in cambios:
+                cambios_diferencial.campos[columna] = cambios_diferencial.campos.get(columna, 0) + 1
+            indice.fijar_valores(id_producto, cambios)
+
+        if id_producto is None:
+            id_producto = -1 - len(inserciones)
+            inserciones.append(_valores_nuevo_producto(producto_data))
+            indice.registrar(id_producto, producto_data['nombre'], producto_data.get('codigo_barras'))
+            indice.fijar_valores(id_producto, inserciones[-1])
+            if cambios_diferencial is not None:
+                cambios_diferencial.insertados += 1
+            destino.append((id_producto, dict(inserciones[-1])))
+        elif id_producto < 0:
+            inserciones[-1 - id_producto].update(cambios)
+            indice.actualizar(id_producto, cambios)
+            destino.append((id_producto, dict(inserciones[-1 - id_producto])))
+        else:
+            actualizaciones.append(dict(cambios, id=id_producto))
+            indice.actualizar(id_producto, cambios)
+            destino.append((id_producto, leidos))
+
+    ids_nuevos = []
+    if inserciones:
+        ids_nuevos = db.scalars(
+            insert(models.Producto).returning(models.Producto.id, sort_by_parameter_order=True),
+            inserciones
+        ).all()
+        for i, id_nuevo in enumerate(ids_nuevos):
+            indice.reemplazar_id(-1 - i, id_nuevo)
+    if actualizaciones:
+        db.execute(update(models.Producto), actualizaciones)
+
+    return [
+        _resumen_producto(ids_nuevos[-1 - id_producto] if id_producto < 0 else id_producto, valores)
+        for id_producto, valores in destino
+    ]
+
+
+def _escribir_lote(
+    db: Session, lote: List[tuple], indice: IndiceCatalogo, cambios: Optional[ResumenCambios] = None
+):
+    """
+    Escribe un lote dentro de un SAVEPOINT. Si el lote falla (p. ej. un código de barras
+    duplicado), se reintenta fila por fila para reportar solo las filas con error sin
+    perder el resto del lote. Con 'cambios' la escritura es diferencial (ver _escribir_filas)
+    y solo se cuentan las filas que quedaron escritas.
+    """
+    preparadas = []
+    errores = []
+    for fila, producto_data in lote:
+        try:
+            _limpiar_producto(producto_data)
+            _valores_nuevo_producto(producto_data)  # Validar conversiones antes de escribir
+            preparadas.append((fila, producto_data))
+        except Exception as e:
+            errores.append(_error_fila(fila, producto_data, e))
+
+    if not preparadas:
+        return [], errores
+    try:
+        with db.begin_nested(), indice.transaccion():
+            parcial = ResumenCambios() if cambios is not None else None
+            escritos = _escribir_filas(db, preparadas, indice, parcial)
+        if cambios is not None:
+            cambios.sumar(parcial)
+        return escritos, errores
+    except SQLAlchemyError as e:
+        logger.warning(
+            f"Lote de {len(preparadas)} productos falló ({str(getattr(e, 'orig', None) or e)}); "
+            "reintentando fila por fila"
+        )
+
+    escritos = []
+    for preparada in preparadas:
+        try:
+            with db.begin_nested(), indice.transaccion():
+                parcial = ResumenCambios() if cambios is not None else None
+                escritos.extend(_escribir_filas(db, [preparada], indice, parcial))
+            if cambios is not None:
+                cambios.sumar(parcial)
+        except SQLAlchemyError as e:
+            errores.append(_error_fila(preparada[0], preparada[1], e))
+    errores.sort(key=lambda error: error['fila'])
+    return escritos, errores
+
+
+def _importar_por_lotes(
+    db: Session,
+    lotes: Iterable[List[dict]],
+    indice: IndiceCatalogo,
+    cambios: Optional[ResumenCambios] = None,
+    desactivar_ausentes: bool = False
+) -> Iterator[tuple]:
+    """
+    Escribe cada lote a medida que se lee, con un commit por lote.
+    Produce (filas, productos escritos, errores) después de cada commit.
+    Con 'cambios' la importación es diferencial; con desactivar_ausentes, al final se
+    marcan inactivos los productos del catálogo que no aparecieron en el archivo.
+    """
+    vistos = set()
+    fila_inicial = 2  # fila 1 = encabezados
+    for productos in lotes:
+        lote = list(enumerate(productos, start=fila_inicial))
+        escritos, errores_lote = _escribir_lote(db, lote, indice, cambios)
+        db.commit()
+        if desactivar_ausentes:
+            # Ids que quedaron asignados a las filas escritas: los productos creados en esta
+            # importación ya tienen su id real (antes de escribir no estaban en el índice)
+            vistos.update(resumen['id'] for resumen in escritos)
+            # Una fila con error igual cuenta como presente
+            for error in errores_lote:
+                producto_data = productos[error['fila'] - fila_inicial]
+                vistos.add(indice.buscar(producto_data.get('nombre'), producto_data.get('codigo_barras')))
+        fila_inicial += len(productos)
+        yield len(productos), escritos, errores_lote
+
+    if desactivar_ausentes:
+        ausentes = [
+            id_producto for id_producto, valores in indice.valores.items()
+            if id_producto not in vistos and valores.get('activo')
+        ]
+        for inicio in range(0, len(ausentes), TAMANO_LOTE):
+            db.execute(update(models.Producto), [
+                {'id': id_producto, 'activo': False} for id_producto in ausentes[inicio:inicio + TAMANO_LOTE]
+            ])
+            db.commit()
+        for id_producto in ausentes:
+            indice.fijar_valores(id_producto, {'activo': False})
+        cambios.desactivados += len(ausentes)
+
+
+def _lotes_archivo(archivo: ArchivoSubido, reparsear: bool = False) -> Iterator[List[dict]]:
+    """
+    Lotes del archivo desde la cache de resultados si ya se leyó un archivo con el mismo
+    contenido; si no (o con reparsear), se lee y el resultado se guarda mientras se importa.
+    """
+    cache = cacheImportacion.cache_resultados
+    clave = cache.clave(
+        archivo.huella, 'importController', os.path.splitext(archivo.nombre)[1].lower(),
+        TAMANO_LOTE, cacheImportacion.version_codigo(os.path.abspath(__file__))
+    )
+    guardados = None if reparsear else cache.leer(clave)
+    archivo.desde_cache = guardados is not None
+    if guardados is not None:
+        return guardados
+    return cache.escribir(clave, _leer_lotes(archivo.ruta, archivo.nombre))
+
+
+def _con_indices_diferidos(db: Session, eventos: Iterator[tuple]) -> Iterator[tuple]:
+    """Los índices secundarios de productos se reconstruyen una vez, al terminar la carga"""
+    with perfilSqlite.carga_masiva(db, models.Producto.__table__):
+        yield from eventos
+
+
+class OpcionesImportacion:
+    """Parámetros de una importación, tal como llegan en la query del endpoint"""
+
+    def __init__(
+        self,
+        modo: str = "lote",
+        respuesta: str = "list",
+        carga_masiva: bool = False,
+        reparsear: bool = False,
+        desactivar_ausentes: bool = False,
+        similitud_nombres: Optional[float] = None
+    ):
+        self.modo = modo
+        self.respuesta = respuesta
+        self.carga_masiva = carga_masiva
+        self.reparsear = reparsear
+        self.desactivar_ausentes = desactivar_ausentes
+        self.similitud_nombres = similitud_nombres
+
+    def validar(self, asincrono: bool = False):
+        if self.modo not in MODOS_IMPORTACION:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Modo de importación no soportado: {self.modo}. Use {', '.join(MODOS_IMPORTACION)}"
+            )
+        if self.respuesta not in FORMATOS_RESPUESTA or (asincrono and self.respuesta == "ndjson"):
+            formatos = [f for f in FORMATOS_RESPUESTA if not asincrono or f != "ndjson"]
+            raise HTTPException(
+                status_code=400,
+                detail=f"Formato de respuesta no soportado: {self.respuesta}. Use {', '.join(formatos)}"
+            )
+        if self.desactivar_ausentes and self.modo != "diferencial":
+            raise HTTPException(
+                status_code=400,
+                detail="desactivar_ausentes solo se puede usar con modo=diferencial"
+            )
+        if self.similitud_nombres is not None and not 0 < self.similitud_nombres <= 1:
+            raise HTTPException(
+                status_code=400,
+                detail="similitud_nombres debe ser mayor que 0 y hasta 1"
+            )
+
+    def nuevo_resumen_cambios(self) -> Optional[ResumenCambios]:
+        return ResumenCambios() if self.modo == "diferencial" else None
+
+
+def _iniciar_importacion(
+    db: Session,
+    archivo: ArchivoSubido,
+    opciones: OpcionesImportacion,
+    cambios: Optional[ResumenCambios] = None
+) -> Iterator[tuple]:
+    """
+    Valida el archivo, carga el índice del catálogo y retorna el iterador de escritura
+    (ver _importar_por_lotes). Los errores de formato o columnas se lanzan aquí, antes
+    de escribir nada. En modo diferencial, 'cambios' recibe el resumen de la importación.
+    """
+    lotes = _lotes_archivo(archivo, opciones.reparsear)
+    # Leer el primer lote antes de tocar la base valida formato y columnas
+    lotes = chain([next(lotes, [])], lotes)
+
+    # Una sola consulta para todo el catálogo; cada fila se busca en memoria
+    indice = IndiceCatalogo.cargar(db, con_valores=cambios is not None, similitud_nombres=opciones.similitud_nombres)
+    if opciones.modo == "filas":
+        eventos = _importar_por_filas(db, lotes, indice)
+    else:
+        eventos = _importar_por_lotes(db, lotes, indice, cambios, opciones.desactivar_ausentes)
+    if opciones.carga_masiva:
+        return _con_indices_diferidos(db, eventos)
+    return eventos
+
+
+def _mensaje_importacion(productos: int) -> str:
+    return f"Se importaron {productos} productos correctamente"
+
+
+def _importar_archivo(
+    db: Session,
+    archivo: ArchivoSubido,
+    opciones: OpcionesImportacion,
+    progreso: Optional[Callable[[int, List[dict]], None]] = None
+) -> dict:
+    """
+    Importa un archivo ya guardado en disco y retorna la respuesta del endpoint.
+    Con respuesta="summary" solo se cuentan los productos, sin conservar la lista.
+    """
+    productos_creados = []
+    errores = []
+    filas = productos = 0
+    cambios = opciones.nuevo_resumen_cambios()
+    for filas_evento, escritos, errores_evento in _iniciar_importacion(db, archivo, opciones, cambios):
+        filas += filas_evento
+        productos += len(escritos)
+        errores.extend(errores_evento)
+        if opciones.respuesta == "list":
+            productos_creados.extend(escritos)
+        if progreso:
+            progreso(filas_evento, errores_evento)
+
+    if opciones.respuesta == "summary":
+        resultado = {
+            "success": True,
+            "message": _mensaje_importacion(productos),
+            "data": {"filas": filas, "productos": productos, "errores": len(errores)},
+            "desdeCache": archivo.desde_cache
+        }
+    else:
+        resultado = {
             "success": True,
-            "message": f"Se importaron {len(productos_creados)} productos correctamente",
-            "data": [{
-                "id": p.id,
-                "nombre": p.nombre,
-                "categoria": p.categoria,
-                "precio": p.precio,
-                "stock": p.stock
-            } for p in productos_creados]
+            "message": _mensaje_importacion(productos),
+            "data": productos_creados,
+            "errores": errores,
+            "desdeCache": archivo.desde_cache
         }
-        
+    if cambios is not None:
+        resultado["cambios"] = cambios.como_dict()
+    return resultado
+
+
+def _linea_ndjson(registro: dict) -> bytes:
+    return (json.dumps(registro, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+
+
+async def _transmitir_importacion(
+    db: Session, archivo: ArchivoSubido, eventos: Iterator[tuple], cambios: Optional[ResumenCambios]
+):
+    """
+    Emite una línea JSON por producto o error a medida que se confirma cada lote y,
+    al final, una línea "resumen" con los totales. Cierra la sesión y borra el temporal.
+    """
+    loop = asyncio.get_running_loop()
+    ejecutor = _obtener_ejecutor_escritura()
+    filas = productos = errores = 0
+    try:
+        while True:
+            # Cada lote se escribe en el pool de hilos, no en el event loop
+            evento = await loop.run_in_executor(ejecutor, next, eventos, None)
+            if evento is None:
+                break
+            filas_evento, escritos, errores_evento = evento
+            filas += filas_evento
+            productos += len(escritos)
+            errores += len(errores_evento)
+            yield b"".join(
+                [_linea_ndjson({"tipo": "producto", **p}) for p in escritos] +
+                [_linea_ndjson({"tipo": "error", **e}) for e in errores_evento]
+            )
+        resumen = {
+            "tipo": "resumen", "success": True, "message": _mensaje_importacion(productos),
+            "filas": filas, "productos": productos, "errores": errores, "desdeCache": archivo.desde_cache
+        }
+        if cambios is not None:
+            resumen["cambios"] = cambios.como_dict()
+        yield _linea_ndjson(resumen)
+    except Exception as e:
+        await loop.run_in_executor(ejecutor, db.rollback)
+        logger.error(f"Error al procesar archivo: {str(e)}")
+        yield _linea_ndjson({
+            "tipo": "resumen", "success": False, "message": f"Error al procesar el archivo: {str(e)}",
+            "filas": filas, "productos": productos, "errores": errores
+        })
+    finally:
+        try:
+            # Cerrar el generador recrea los índices diferidos y cerrar la sesión hace rollback:
+            # ambos van al pool de hilos, no al event loop
+            await loop.run_in_executor(ejecutor, _cerrar_importacion, db, eventos)
+        finally:
+            archivo.eliminar()
+
+
+def _cerrar_importacion(db: Session, eventos: Iterator[tuple]):
+    try:
+        eventos.close()
+    finally:
+        db.close()
+
+
+async def _respuesta_ndjson(archivo: ArchivoSubido, opciones: OpcionesImportacion) -> StreamingResponse:
+    """
+    Valida el archivo y carga el índice antes de responder (así los errores siguen siendo
+    400) y transmite el resto. Usa su propia sesión porque vive mientras dure la respuesta.
+    """
+    db = SessionLocal()
+    cambios = opciones.nuevo_resumen_cambios()
+    try:
+        eventos = await asyncio.get_running_loop().run_in_executor(
+            _obtener_ejecutor_escritura(),
+            functools.partial(_iniciar_importacion, db, archivo, opciones, cambios)
+        )
+    except BaseException:
+        db.close()
+        archivo.eliminar()
+        raise
+    return StreamingResponse(
+        _transmitir_importacion(db, archivo, eventos, cambios), media_type="application/x-ndjson"
+    )
+
+
+class TrabajoImportacion:
+    """Estado de una importación en segundo plano, actualizado por el hilo que la ejecuta"""
+
+    def __init__(self, archivo: str, opciones: OpcionesImportacion):
+        self.id = uuid.uuid4().hex
+        self.archivo = archivo
+        self.opciones = opciones
+        self.estado = "en_cola"  # en_cola -> procesando -> completado | error
+        self.filas_procesadas = 0
+        self.errores = []
+        self.resultado = None
+        self.error = None
+        self.creado = time.time()
+        self.inicio = None
+        self.fin = None
+        self._lock = threading.Lock()
+
+    def iniciar(self):
+        with self._lock:
+            self.estado = "procesando"
+            self.inicio = time.time()
+
+    def avanzar(self, filas: int, errores: List[dict]):
+        with self._lock:
+            self.filas_procesadas += filas
+            self.errores.extend(errores)
+
+    def terminar(self, resultado: dict = None, error: str = None):
+        with self._lock:
+            self.estado = "error" if error else "completado"
+            self.resultado = resultado
+            self.error = error
+            self.fin = time.time()
+
+    @property
+    def terminado(self) -> bool:
+        return self.estado in ("completado", "error")
+
+    def resumen(self) -> dict:
+        with self._lock:
+            segundos = ((self.fin or time.time()) - self.inicio) if self.inicio else 0.0
+            return {
+                "id": self.id,
+                "archivo": self.archivo,
+                "modo": self.opciones.modo,
+                "estado": self.estado,
+                "filasProcesadas": self.filas_procesadas,
+                "filasPorSegundo": round(self.filas_procesadas / segundos, 1) if segundos > 0 else 0.0,
+                "segundos": round(segundos, 3),
+                "errores": list(self.errores),
+                "resultado": self.resultado,
+                "error": self.error
+            }
+
+
+# Registro en memoria de los trabajos (id -> trabajo), del más antiguo al más reciente
+_trabajos = OrderedDict()
+_trabajos_lock = threading.Lock()
+_ejecutor_trabajos = None
+
+
+def _obtener_ejecutor() -> ThreadPoolExecutor:
+    global _ejecutor_trabajos
+    if _ejecutor_trabajos is None:
+        _ejecutor_trabajos = ThreadPoolExecutor(
+            max_workers=TRABAJOS_SIMULTANEOS, thread_name_prefix="importacion"
+        )
+    return _ejecutor_trabajos
+
+
+def _registrar_trabajo(trabajo: TrabajoImportacion):
+    """Agrega el trabajo al registro; rechaza si la cola está llena y descarta terminados viejos"""
+    with _trabajos_lock:
+        pendientes = sum(1 for t in _trabajos.values() if not t.terminado)
+        if pendientes >= TRABAJOS_SIMULTANEOS + TRABAJOS_EN_COLA:
+            raise HTTPException(
+                status_code=503,
+                detail="Demasiadas importaciones en curso; intente de nuevo más tarde"
+            )
+        _trabajos[trabajo.id] = trabajo
+        terminados = [id_trabajo for id_trabajo, t in _trabajos.items() if t.terminado]
+        for id_trabajo in terminados[:max(0, len(terminados) - TRABAJOS_RETENIDOS)]:
+            del _trabajos[id_trabajo]
+
+
+def _ejecutar_trabajo(trabajo: TrabajoImportacion, archivo: ArchivoSubido):
+    """Corre en el pool: usa su propia sesión, la de la petición ya se cerró"""
+    trabajo.iniciar()
+    db = SessionLocal()
+    try:
+        trabajo.terminar(resultado=_importar_archivo(db, archivo, trabajo.opciones, progreso=trabajo.avanzar))
+    except HTTPException as e:
+        db.rollback()
+        trabajo.terminar(error=str(e.detail))
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error en importación en segundo plano {trabajo.id}: {str(e)}")
+        trabajo.terminar(error=f"Error al procesar el archivo: {str(e)}")
+    finally:
+        db.close()
+        archivo.eliminar()
+
+
+@router.post("/api/import/productos")
+async def importar_productos(
+    file: UploadFile,
+    modo: str = Query(
+        "lote",
+        description="lote: escritura por lotes; filas: un commit por producto; "
+                    "diferencial: solo productos nuevos o con cambios"
+    ),
+    asincrono: bool = Query(False, description="Procesar en segundo plano y retornar el id del trabajo"),
+    respuesta: str = Query(
+        "list", alias="response",
+        description="list: productos importados; summary: solo totales; ndjson: una línea por producto"
+    ),
+    carga_masiva: bool = Query(
+        False,
+        description="Reconstruir los índices secundarios al final en vez de actualizarlos por fila. "
+                    "Mientras dura, las búsquedas de productos por nombre o categoría recorren toda la "
+                    "tabla: usar solo en ventanas de mantenimiento sin otro tráfico"
+    ),
+    reparsear: bool = Query(
+        False, description="Leer el archivo aunque ya haya un resultado en cache para el mismo contenido"
+    ),
+    desactivar_ausentes: bool = Query(
+        False, description="Modo diferencial: marcar inactivos los productos que no están en el archivo"
+    ),
+    similitud_nombres: Optional[float] = Query(
+        None,
+        description="Similitud mínima (mayor que 0, hasta 1) para tratar dos nombres como el mismo producto; "
+                    "1 = solo nombres iguales sin contar mayúsculas, acentos ni palabras como 'de'. "
+                    "Sin valor (ni IMPORT_UMBRAL_SIMILITUD) solo se unen nombres iguales"
+    ),
+    db: Session = Depends(get_db)
+):
+    try:
+        opciones = OpcionesImportacion(
+            modo, respuesta, carga_masiva, reparsear, desactivar_ausentes, similitud_nombres
+        )
+        opciones.validar(asincrono)
+
+        if asincrono:
+            _validar_formato(file.filename or '')
+            archivo = await _guardar_en_temporal(file)
+            trabajo = TrabajoImportacion(file.filename, opciones)
+            try:
+                _registrar_trabajo(trabajo)
+            except HTTPException:
+                archivo.eliminar()
+                raise
+            _obtener_ejecutor().submit(_ejecutar_trabajo, trabajo, archivo)
+            return JSONResponse(status_code=202, content={
+                "success": True,
+                "message": "Importación en cola",
+                "data": {"id": trabajo.id, "estado": trabajo.estado}
+            })
+
+        # La subida se copia a disco y se lee por lotes: nunca está completa en memoria
+        archivo = await _guardar_en_temporal(file)
+        if opciones.respuesta == "ndjson":
+            return await _respuesta_ndjson(archivo, opciones)
+        try:
+            # Lectura y escritura bloqueantes fuera del event loop, para no frenar otras peticiones
+            return await asyncio.get_running_loop().run_in_executor(
+                _obtener_ejecutor_escritura(),
+                functools.partial(_importar_archivo, db, archivo, opciones)
+            )
+        finally:
+            archivo.eliminar()
+
     except HTTPException:
         raise
     except Exception as e:
+        db.rollback()
         logger.error(f"Error al procesar archivo: {str(e)}")
         raise HTTPException(
-            status_code=500, 
+            status_code=500,
             detail=f"Error al procesar el archivo: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+
+@router.get("/api/import/jobs/{id_trabajo}")
+async def obtener_trabajo_importacion(id_trabajo: str):
+    """Progreso de una importación en segundo plano y, al terminar, su resultado"""
+    with _trabajos_lock:
+        trabajo = _trabajos.get(id_trabajo)
+    if trabajo is None:
+        raise HTTPException(status_code=404, detail="Trabajo de importación no encontrado")
+    return {"success": True, "data": trabajo.resumen()}
@@ -0,0 +1,155 @@
+import { spawn } from 'child_process'
+import readline from 'readline'
+import logger from '../utils/logger.js'
+
+/**
+ * Worker Python persistente para importación de productos.
+ * Lanza `importProducts.py --serve` una sola vez y le envía un trabajo JSON por línea,
+ * evitando pagar el arranque del intérprete y de pandas/pdfplumber en cada importación.
+ * Con `opciones.output = 'ndjson'` el worker responde varias líneas por trabajo: un registro
+ * `tipo: 'producto'` por producto y la línea de resumen final.
+ */
+class ImportWorkerService {
+  constructor() {
+    this.proceso = null
+    this.comando = null
+    this.pendientes = new Map() // id -> { resolve, reject, timer, alRegistro }
+    this.siguienteId = 1
+    this.ultimoStderr = []
+  }
+
+  // Iniciar el proceso si no está corriendo (o si cambió el comando/script)
+  iniciar(pythonCommand, scriptPath) {
+    const comando = `${pythonCommand} ${scriptPath}`
+    if (this.proceso && this.comando === comando) return
+
+    this.detener()
+    this.comando = comando
+    const proceso = spawn(pythonCommand, [scriptPath, '--serve'], {
+      stdio: ['pipe', 'pipe', 'pipe'],
+      env: { ...process.env, PYTHONIOENCODING: 'utf-8' },
+    })
+    this.proceso = proceso
+
+    readline.createInterface({ input: proceso.stdout }).on('line', (linea) => this.recibirLinea(linea))
+
+    proceso.stderr.setEncoding('utf8')
+    proceso.stderr.on('data', (texto) => {
+      // Conservar solo las últimas líneas para mensajes de error
+      this.ultimoStderr.push(...texto.split('\n').filter(Boolean))
+      if (this.ultimoStderr.length > 50) {
+        this.ultimoStderr = this.ultimoStderr.slice(-50)
+      }
+    })
+
+    const alTerminar = (error) => {
+      if (this.proceso !== proceso) return
+      this.proceso = null
+      this.comando = null
+      const mensaje = error?.message || 'El worker de importación terminó inesperadamente'
+      logger.warn(`⚠️ Worker de importación detenido: ${mensaje}`)
+      this.rechazarPendientes(mensaje)
+    }
+    proceso.on('error', alTerminar)
+    proceso.on('exit', () => alTerminar())
+    // EPIPE al escribir en un worker que ya terminó: lo resuelve el evento 'exit'
+    proceso.stdin.on('error', () => {})
+
+    logger.info('🐍 Worker de importación Python iniciado')
+  }
+
+  recibirLinea(linea) {
+    const texto = linea.trim()
+    if (!texto) return
+
+    let respuesta
+    try {
+      respuesta = JSON.parse(texto)
+    } catch {
+      logger.warn(`Worker de importación devolvió una línea no JSON: ${texto.substring(0, 200)}`)
+      return
+    }
+
+    const pendiente = this.pendientes.get(respuesta.id)
+    if (!pendiente) return
+    if (respuesta.tipo === 'producto') {
+      pendiente.alRegistro?.(respuesta)
+      return
+    }
+    this.pendientes.delete(respuesta.id)
+    clearTimeout(pendiente.timer)
+
+    // Mismo contrato que execAsync: código de salida distinto de 0 => error con stdout
+    if (respuesta.codigoSalida) {
+      const error = new Error(respuesta.mensaje || 'Error en el script de importación')
+      error.stdout = texto
+      error.stderr = this.ultimoStderr.join('\n')
+      pendiente.reject(error)
+      return
+    }
+    pendiente.resolve({ stdout: texto, stderr: '' })
+  }
+
+  rechazarPendientes(mensaje) {
+    for (const [id, pendiente] of this.pendientes) {
+      clearTimeout(pendiente.timer)
+      const error = new Error(mensaje)
+      error.workerNoDisponible = true
+      error.stderr = this.ultimoStderr.join('\n')
+      pendiente.reject(error)
+      this.pendientes.delete(id)
+    }
+  }
+
+  /**
+   * Procesa un archivo en el worker. Resuelve con { stdout, stderr } como execAsync.
+   * Si el worker no puede usarse, el error trae `workerNoDisponible = true`.
+   * En modo NDJSON, `alRegistro` recibe cada producto antes de que llegue el resumen; si el
+   * worker muere después de entregar alguno, repetir el trabajo volvería a procesarlos.
+   */
+  procesar({ pythonCommand, scriptPath, tipo, archivo, apiKey = null, opciones = {}, alRegistro = null, timeoutMs }) {
+    return new Promise((resolve, reject) => {
+      try {
+        this.iniciar(pythonCommand, scriptPath)
+      } catch (error) {
+        error.workerNoDisponible = true
+        return reject(error)
+      }
+
+      const id = this.siguienteId++
+      const timer = setTimeout(() => {
+        this.pendientes.delete(id)
+        const error = new Error('Tiempo de espera agotado procesando el archivo de importación')
+        reject(error)
+        // Un trabajo colgado deja el worker inutilizable: reiniciarlo en la próxima importación
+        this.detener()
+      }, timeoutMs)
+
+      this.pendientes.set(id, { resolve, reject, timer, alRegistro })
+      this.ultimoStderr = []
+
+      const trabajo = JSON.stringify({ id, tipo, archivo, apiKey, opciones })
+      this.proceso.stdin.write(`${trabajo}\n`, 'utf8', (error) => {
+        if (error && this.pendientes.has(id)) {
+          clearTimeout(timer)
+          this.pendientes.delete(id)
+          error.workerNoDisponible = true
+          reject(error)
+        }
+      })
+    })
+  }
+
+  detener() {
+    if (!this.proceso) return
+    const proceso = this.proceso
+    this.proceso = null
+    this.comando = null
+    this.rechazarPendientes('Worker de importación detenido')
+    proceso.kill()
+  }
+}
+
+const importWorkerService = new ImportWorkerService()
+
+export default importWorkerService
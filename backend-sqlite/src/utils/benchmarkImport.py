@@ -0,0 +1,673 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmarks del pipeline de importación de productos.
+
+Genera inventarios sintéticos y mide procesar_excel, procesar_pdf,
+_extraer_productos_desde_lineas_texto, _extraer_balance_y_distribucion, el endpoint
+FastAPI importar_productos, la
+coincidencia aproximada de nombres (coincidenciaNombres.py) contra un catálogo, la
+extracción con IA por fragmentos contra el modelo local de servidorModeloStub.py y la
+reimportación de un reporte PDF corregido en pocas páginas (cache de páginas).
+Los inventarios son libros XLSX con varias hojas y encabezados escritos de formas
+distintas, y PDFs "Reporte de inventario" con líneas RD$ y páginas de Balance General.
+Cada caso corre en un subproceso propio, así el pico de memoria (RSS) de un caso
+no contamina al siguiente.
+
+Uso:
+    python benchmarkImport.py                                   # casos por defecto
+    python benchmarkImport.py --filas 1000,100000,1000000 --hojas 8
+    python benchmarkImport.py --casos excel,pdf --guardar base.json
+    python benchmarkImport.py --comparar base.json --tolerancia 15
+"""
+
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import List, Dict, Any
+
+DIRECTORIO_UTILS = os.path.dirname(os.path.abspath(__file__))
+DIRECTORIO_BACKEND = os.path.dirname(os.path.dirname(DIRECTORIO_UTILS))
+DIRECTORIO_BENCHMARK = os.environ.get('IMPORT_BENCHMARK_DIR') or os.path.join(tempfile.gettempdir(), 'app-inv-benchmark')
+
+TIPOS_CASO = ('excel', 'pdf', 'lineas', 'balance', 'endpoint', 'nombres', 'ia', 'reimportacion')
+
+# ========== Generadores de inventarios sintéticos ==========
+
+# Encabezados con las grafías que aparecen en los inventarios reales (una variante por hoja)
+_ENCABEZADOS_EXCEL = [
+    ('Código', 'Descripción', 'Cantidad', 'Costo Unitario', 'Total', 'Categoría'),
+    ('SKU', 'Producto', 'Cant', 'Precio', 'Valor Total', 'Familia'),
+    ('Barcode', 'ARTICULO', 'Existencia', 'PVP', 'Importe', 'Departamento'),
+    ('ref', 'Nombre', 'Qty', 'Cost', 'Monto Total', 'Category'),
+    (' Codigo ', 'Item', 'Unidades', 'Valor Unitario', 'TOTAL', 'Grupo'),
+]
+_CATEGORIAS = ('Abarrotes', 'Bebidas', 'Limpieza', 'Lácteos', 'Embutidos', 'Cuidado Personal')
+_MARCAS = ('EL GALLEGO', 'LA FAVORITA', 'CRISTAL', 'SANTO DOMINGO', 'INDUVECA', 'RICA', 'NESTLE')
+_ARTICULOS = ('ACEITE', 'ARROZ', 'HABICHUELAS', 'LECHE', 'SALAMI', 'JABON', 'GALLETAS', 'CAFE', 'AZUCAR', 'SARDINAS')
+_UNIDADES_REPORTE = ('UDS', 'PAQ', 'LIB UDS', 'UNI UDS', '')
+
+
+def _formato_miles(valor: float, coma_decimal: bool) -> str:
+    texto = f"{valor:,.2f}"
+    return texto.replace(',', 'X').replace('.', ',').replace('X', '.') if coma_decimal else texto
+
+
+def _nombre_articulo(azar: random.Random, n: int) -> str:
+    return f"{azar.choice(_ARTICULOS)} {azar.choice(_MARCAS)} {n}"
+
+
+def _variante_nombre(azar: random.Random, nombre: str) -> str:
+    """El mismo producto escrito de otra forma: con 'DE', en otra capitalización o con una letra de menos"""
+    palabras = nombre.split()
+    if azar.random() < 0.5:
+        palabras.insert(1, 'DE')
+    i = azar.randrange(len(palabras) - 1)
+    if len(palabras[i]) > 4 and azar.random() < 0.5:
+        j = azar.randrange(1, len(palabras[i]))
+        palabras[i] = palabras[i][:j] + palabras[i][j + 1:]
+    texto = ' '.join(palabras)
+    return texto.title() if azar.random() < 0.5 else texto
+
+
+def generar_xlsx(ruta: str, filas: int, hojas: int = 4, semilla: int = 1) -> None:
+    """
+    Libro con 'filas' productos repartidos en 'hojas' hojas. Cada hoja usa otra grafía
+    de encabezados y otro formato de costo (número, 'RD$ 1,234.50' o '1.234,50').
+    """
+    from openpyxl import Workbook
+
+    azar = random.Random(semilla)
+    libro = Workbook(write_only=True)
+    por_hoja = -(-filas // hojas)
+    n = 0
+    for h in range(hojas):
+        hoja = libro.create_sheet(f"Inventario {h + 1}")
+        hoja.append(list(_ENCABEZADOS_EXCEL[h % len(_ENCABEZADOS_EXCEL)]))
+        formato = h % 3
+        for _ in range(min(por_hoja, filas - n)):
+            cantidad = azar.randint(1, 500)
+            costo = azar.randint(100, 999999) / 100
+            if formato == 0:
+                valor_costo, valor_total = costo, round(costo * cantidad, 2)
+            elif formato == 1:
+                valor_costo, valor_total = f"RD$ {_formato_miles(costo, False)}", f"RD$ {_formato_miles(costo * cantidad, False)}"
+            else:
+                valor_costo, valor_total = _formato_miles(costo, True), _formato_miles(costo * cantidad, True)
+            codigo = str(7460000000000 + n) if azar.random() > 0.1 else None
+            hoja.append([codigo, _nombre_articulo(azar, n), cantidad, valor_costo, valor_total, azar.choice(_CATEGORIAS)])
+            n += 1
+    libro.save(ruta)
+
+
+def lineas_reporte(pagina: int, lineas: int, azar: random.Random, relleno: int = 1) -> List[str]:
+    """
+    Una página de "Reporte de inventario": cabeceras, líneas 'ARTICULO [UNIDAD] CANTIDAD COSTO RD$ TOTAL' y pie.
+    Con relleno > 1 las columnas van separadas por esa cantidad de espacios, como en el texto
+    extraído conservando la disposición de la página.
+    """
+    sep = ' ' * relleno
+    texto = ['Fecha : 01/02/2024', 'Inventario No: 55', sep.join(['ARTICULO', 'UNIDAD', 'CANTIDAD', 'COSTO', 'TOTAL'])]
+    for i in range(lineas):
+        cantidad = azar.randint(1, 300) / 4
+        costo = azar.randint(100, 99999) / 100
+        texto.append(
+            f"{_nombre_articulo(azar, pagina * lineas + i)} 8/1 {azar.choice(_UNIDADES_REPORTE)}{sep}"
+            f"{cantidad:.2f}{sep}{costo:.2f}{sep}RD$ {_formato_miles(cantidad * costo, False)}"
+        )
+    texto.append(f'Pag. {pagina + 1}')
+    return texto
+
+
+_LINEAS_BALANCE = [
+    'BALANCE GENERAL',
+    'EFECTIVO EN CAJA Y BANCO RD$ 12,500.00',
+    'CUENTAS POR COBRAR (FIAO) RD$ 3,000.00',
+    'INVENTARIO DE MERCANCIA RD$ 250,000.50',
+    'ACTIVOS FIJOS RD$ 40,000.00',
+    'TOTAL ACTIVOS RD$ 305,500.50',
+    'CTAS. POR PAGAR SUPLIDORES RD$ 20,000.00',
+    'TOTAL PASIVOS RD$ 20,000.00',
+    'CAPITAL DE TRABAJO RD$ 285,500.50',
+    'VENTAS DEL MES RD$ 90,000.00',
+    'GASTOS GENERALES RD$ 10,000.00',
+    'UTILIDAD BRUTA RD$ 22,000.00',
+    'UTILIDAD NETA RD$ 12,000.00',
+    'PORCIENTO NETO 13.33 %',
+    'PORCIENTO BRUTO 24.43 %',
+    'DISTRIBUCION DE SALDO',
+    'EFECTIVO RD$ 12,500.00',
+    'INVENTARIO RD$ 0.00',
+    'OTROS RD$ 1,000.00',
+]
+
+
+def _escapar_pdf(texto: str) -> str:
+    return texto.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def escribir_pdf_texto(ruta: str, paginas: List[List[str]]) -> None:
+    """
+    Escribe un PDF mínimo (Courier 8pt, una línea de texto por renglón) sin dependencias
+    externas. pdfplumber extrae de vuelta las mismas líneas.
+    """
+    cuerpos: List[bytes] = [b'', b'', b'<< /Type /Font /Subtype /Type1 /BaseFont /Courier /Encoding /WinAnsiEncoding >>']
+    ids_paginas = []
+    for lineas in paginas:
+        contenido = ['BT', '/F1 8 Tf', '10 TL', '36 756 Td']
+        contenido.extend(f'({_escapar_pdf(linea)}) Tj T*' for linea in lineas)
+        contenido.append('ET')
+        flujo = '\n'.join(contenido).encode('latin-1', errors='replace')
+        cuerpos.append(b'<< /Length %d >>\nstream\n' % len(flujo) + flujo + b'\nendstream')
+        cuerpos.append((
+            '<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] '
+            f'/Resources << /Font << /F1 3 0 R >> >> /Contents {len(cuerpos)} 0 R >>'
+        ).encode())
+        ids_paginas.append(len(cuerpos))
+    cuerpos[0] = b'<< /Type /Catalog /Pages 2 0 R >>'
+    cuerpos[1] = f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in ids_paginas)}] /Count {len(ids_paginas)} >>".encode()
+
+    salida = bytearray(b'%PDF-1.4\n')
+    posiciones = []
+    for numero, cuerpo in enumerate(cuerpos, 1):
+        posiciones.append(len(salida))
+        salida += b'%d 0 obj\n' % numero + cuerpo + b'\nendobj\n'
+    inicio_xref = len(salida)
+    salida += b'xref\n0 %d\n0000000000 65535 f \n' % (len(cuerpos) + 1)
+    for posicion in posiciones:
+        salida += b'%010d 00000 n \n' % posicion
+    salida += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(cuerpos) + 1, inicio_xref)
+    with open(ruta, 'wb') as f:
+        f.write(salida)
+
+
+def generar_pdf_reporte(ruta: str, paginas: int, lineas_por_pagina: int = 60, balance: bool = True, semilla: int = 2) -> None:
+    """PDF "Reporte de inventario" de 'paginas' páginas, opcionalmente seguido de una página de Balance General"""
+    azar = random.Random(semilla)
+    contenido = [lineas_reporte(p, lineas_por_pagina, azar) for p in range(paginas)]
+    if balance:
+        contenido.append(_LINEAS_BALANCE)
+    escribir_pdf_texto(ruta, contenido)
+
+
+def generar_pdf_corregido(ruta: str, paginas: int, cambiadas: int, lineas_por_pagina: int = 60, semilla: int = 2) -> None:
+    """
+    El reporte de generar_pdf_reporte (sin Balance) con 'cambiadas' páginas repartidas por
+    el documento corregidas: en cada una cambia el nombre del primer artículo
+    """
+    azar = random.Random(semilla)
+    contenido = [lineas_reporte(p, lineas_por_pagina, azar) for p in range(paginas)]
+    for p in range(0, paginas, max(1, paginas // max(1, cambiadas)))[:cambiadas]:
+        contenido[p][3] = contenido[p][3].replace('8/1', '8/1 CORREGIDO', 1)
+    escribir_pdf_texto(ruta, contenido)
+
+
+def generar_csv_endpoint(ruta: str, filas: int, semilla: int = 3) -> None:
+    """CSV con las columnas que espera el endpoint FastAPI importar_productos"""
+    azar = random.Random(semilla)
+    with open(ruta, 'w', newline='', encoding='utf-8') as f:
+        escritor = csv.writer(f)
+        escritor.writerow(['nombre', 'categoria', 'precio', 'stock', 'codigo_barras', 'descripcion'])
+        for n in range(filas):
+            escritor.writerow([
+                _nombre_articulo(azar, n), azar.choice(_CATEGORIAS), azar.randint(100, 99999) / 100,
+                azar.randint(0, 500), 7460000000000 + n, f"Producto sintético {n}"
+            ])
+
+
+def _archivo_generado(nombre: str, generador, *args, **kwargs) -> str:
+    """Ruta de un archivo sintético; se genera solo si no existe (los parámetros van en el nombre)"""
+    os.makedirs(DIRECTORIO_BENCHMARK, exist_ok=True)
+    ruta = os.path.join(DIRECTORIO_BENCHMARK, nombre)
+    if not os.path.exists(ruta):
+        print(f"Generando {nombre}...", file=sys.stderr)
+        temporal = ruta + '.tmp' + os.path.splitext(nombre)[1]
+        generador(temporal, *args, **kwargs)
+        os.replace(temporal, ruta)
+    return ruta
+
+# ========== Casos (se ejecutan dentro del subproceso) ==========
+
+def _pico_rss_mb() -> Any:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta KB; macOS, bytes
+    return round(pico / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _importar_importador():
+    sys.path.insert(0, DIRECTORIO_UTILS)
+    import importProducts
+    return importProducts
+
+
+def _caso_excel(caso: Dict[str, Any]) -> Dict[str, Any]:
+    ruta = _archivo_generado(f"inventario_{caso['filas']}x{caso['hojas']}.xlsx", generar_xlsx, caso['filas'], caso['hojas'])
+    importador = _importar_importador()
+    opciones = {'motor': caso['motor'], 'procesos': caso['procesos']}
+    perfil = importador._perfil_arranque('xlsx', None, opciones)
+    importador.tiempos_fase.clear()
+    inicio = time.perf_counter()
+    resultado = importador.procesar_excel(ruta, caso['motor'], caso['procesos'])
+    segundos = time.perf_counter() - inicio
+    if isinstance(resultado, dict):
+        raise RuntimeError(resultado.get('error'))
+    return {
+        'filas': caso['filas'],
+        'productos': len(resultado),
+        'segundos': segundos,
+        'fases': dict(importador.tiempos_fase, imports=sum(ms or 0 for ms in perfil['importsMs'].values()) / 1000),
+    }
+
+
+def _caso_pdf(caso: Dict[str, Any]) -> Dict[str, Any]:
+    nombre = f"reporte_{caso['paginas']}p{'_balance' if caso['balance'] else ''}.pdf"
+    ruta = _archivo_generado(nombre, generar_pdf_reporte, caso['paginas'], caso['lineas'], caso['balance'])
+    importador = _importar_importador()
+    perfil = importador._perfil_arranque('pdf', None, {})
+    importador.tiempos_fase.clear()
+    inicio = time.perf_counter()
+    # Sin leer la cache de páginas: mide la extracción completa de una primera importación
+    resultado = importador.procesar_pdf(ruta, None, caso['procesos'], sin_cache=True)
+    segundos = time.perf_counter() - inicio
+    if isinstance(resultado, dict) and 'error' in resultado:
+        raise RuntimeError(resultado['error'])
+    productos = resultado.get('productos', []) if isinstance(resultado, dict) else resultado
+    return {
+        'filas': caso['paginas'] * caso['lineas'],
+        'productos': len(productos),
+        'segundos': segundos,
+        'fases': dict(importador.tiempos_fase, imports=sum(ms or 0 for ms in perfil['importsMs'].values()) / 1000),
+    }
+
+
+def _caso_lineas(caso: Dict[str, Any]) -> Dict[str, Any]:
+    azar = random.Random(4)
+    lineas = []
+    pagina = 0
+    while len(lineas) < caso['lineas']:
+        lineas.extend(lineas_reporte(pagina, 60, azar, caso['relleno']))
+        pagina += 1
+    lineas = lineas[:caso['lineas']]
+    importador = _importar_importador()
+    inicio = time.perf_counter()
+    productos = importador._extraer_productos_desde_lineas_texto(lineas)
+    segundos = time.perf_counter() - inicio
+    return {'filas': len(lineas), 'productos': len(productos), 'segundos': segundos, 'fases': {}}
+
+
+def _caso_balance(caso: Dict[str, Any]) -> Dict[str, Any]:
+    """Texto de un reporte largo con su página de Balance General y Distribución de Saldo al final"""
+    azar = random.Random(4)
+    lineas = []
+    pagina = 0
+    while len(lineas) < caso['lineas']:
+        lineas.extend(lineas_reporte(pagina, 60, azar))
+        pagina += 1
+    texto = '\n'.join(lineas[:caso['lineas']] + _LINEAS_BALANCE)
+    importador = _importar_importador()
+    inicio = time.perf_counter()
+    datos = importador._extraer_balance_y_distribucion(texto)
+    segundos = time.perf_counter() - inicio
+    campos = len(datos.get('balanceGeneral', {})) + len(datos.get('distribucionSaldo', {}))
+    return {'filas': caso['lineas'], 'productos': campos, 'segundos': segundos, 'fases': {}}
+
+
+def _caso_nombres(caso: Dict[str, Any]) -> Dict[str, Any]:
+    """Busca nombres (la mitad variantes de productos del catálogo, la mitad nuevos) en un catálogo"""
+    import coincidenciaNombres
+
+    azar = random.Random(5)
+    catalogo = [_nombre_articulo(azar, n) for n in range(caso['catalogo'])]
+    consultas = [
+        _variante_nombre(azar, azar.choice(catalogo)) if i % 2 else _nombre_articulo(azar, caso['catalogo'] + i)
+        for i in range(caso['consultas'])
+    ]
+    inicio = time.perf_counter()
+    indice = coincidenciaNombres.IndiceNombres(coincidenciaNombres.UMBRAL_SUGERIDO)
+    for i, nombre in enumerate(catalogo):
+        indice.agregar(i, nombre)
+    encontrados = sum(1 for nombre in consultas if indice.buscar(nombre) is not None)
+    segundos = time.perf_counter() - inicio
+    return {'filas': len(consultas), 'productos': encontrados, 'segundos': segundos, 'fases': {}}
+
+
+def _caso_reimportacion(caso: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Importa un reporte y luego su versión corregida en 'cambiadas' páginas: solo esas se
+    extraen, el resto sale de la cache de páginas (en un directorio nuevo en cada ejecución)
+    """
+    import cacheImportacion
+
+    base = _archivo_generado(f"reporte_{caso['paginas']}p.pdf", generar_pdf_reporte, caso['paginas'], 60, False)
+    corregido = _archivo_generado(
+        f"reporte_{caso['paginas']}p_corregido{caso['cambiadas']}.pdf",
+        generar_pdf_corregido, caso['paginas'], caso['cambiadas']
+    )
+    cacheImportacion.cache_paginas.directorio = tempfile.mkdtemp(dir=DIRECTORIO_BENCHMARK)
+    importador = _importar_importador()
+    importador.procesar_pdf(base, None, caso['procesos'])
+    importador.tiempos_fase.clear()
+    inicio = time.perf_counter()
+    resultado = importador.procesar_pdf(corregido, None, caso['procesos'])
+    segundos = time.perf_counter() - inicio
+    if isinstance(resultado, dict) and 'error' in resultado:
+        raise RuntimeError(resultado['error'])
+    return {
+        'filas': caso['paginas'] * 60,
+        'productos': len(resultado),
+        'segundos': segundos,
+        'fases': dict(importador.tiempos_fase),
+    }
+
+
+def _caso_ia(caso: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    procesar_pdf_con_gemini contra servidorModeloStub.py: cada fragmento tarda la latencia
+    del caso, y una fracción de las solicitudes falla con 503 y se reintenta
+    """
+    import extraccionIA
+    import servidorModeloStub
+
+    ruta = _archivo_generado(f"reporte_{caso['paginas']}p.pdf", generar_pdf_reporte, caso['paginas'], 60, False)
+    importador = _importar_importador()
+    servidor = servidorModeloStub.iniciar(latencia=caso['latencia'], tasa_error=caso['tasaError'], semilla=6)
+    try:
+        importador.tiempos_fase.clear()
+        inicio = time.perf_counter()
+        resultado = importador.procesar_pdf_con_gemini(
+            ruta, None, cliente=extraccionIA.ClienteHTTP(servidor.url), concurrencia=caso['concurrencia']
+        )
+        segundos = time.perf_counter() - inicio
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+    if isinstance(resultado, dict):
+        raise RuntimeError(resultado.get('error'))
+    return {
+        'filas': caso['paginas'] * 60,
+        'productos': len(resultado),
+        'segundos': segundos,
+        'fases': dict(importador.tiempos_fase),
+        'solicitudes': servidor.solicitudes,
+        'concurrenciaMaxima': servidor.concurrencia_maxima,
+    }
+
+
+def _caso_endpoint(caso: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Llama al handler importar_productos con una base SQLite nueva: una importación inicial
+    (inserciones) y una reimportación del mismo archivo (actualizaciones, o ninguna
+    escritura en modo diferencial), con el perfil SQLite del caso y, opcionalmente, con
+    los índices secundarios diferidos (carga masiva).
+    """
+    import asyncio
+    import importlib
+    import shutil
+
+    sys.path.insert(0, DIRECTORIO_BACKEND)
+    try:
+        from fastapi import UploadFile
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        controlador = importlib.import_module('src.controllers.importController')
+        modelos = importlib.import_module('src.models')
+        perfil_sqlite = importlib.import_module('src.utils.perfilSqlite')
+    except ImportError as e:
+        return {'omitido': f'Endpoint FastAPI no disponible: {e}'}
+
+    ruta = _archivo_generado(f"productos_{caso['filas']}.csv", generar_csv_endpoint, caso['filas'])
+    directorio_db = tempfile.mkdtemp(dir=DIRECTORIO_BENCHMARK)
+    motor = create_engine(f"sqlite:///{os.path.join(directorio_db, 'benchmark.db')}")
+    # Como la aplicación al iniciar: el perfil se registra antes de abrir conexiones
+    perfil_sqlite.aplicar_perfil(motor, caso['perfil'])
+    modelos.Base.metadata.create_all(motor)
+    Sesion = sessionmaker(bind=motor)
+
+    fases = {}
+    productos = 0
+    for fase in ('importacion_inicial', 'reimportacion'):
+        sesion = Sesion()
+        try:
+            with open(ruta, 'rb') as f:
+                archivo = UploadFile(file=f, filename=os.path.basename(ruta))
+                inicio = time.perf_counter()
+                respuesta = asyncio.run(controlador.importar_productos(
+                    archivo, modo=caso['modo'], asincrono=False, respuesta='summary',
+                    carga_masiva=caso['carga_masiva'], reparsear=True, desactivar_ausentes=False,
+                    similitud_nombres=None, db=sesion
+                ))
+                fases[fase] = time.perf_counter() - inicio
+        finally:
+            sesion.close()
+        productos = respuesta['data']['productos'] if isinstance(respuesta, dict) else productos
+    motor.dispose()
+    shutil.rmtree(directorio_db, ignore_errors=True)
+    return {'filas': caso['filas'] * 2, 'productos': productos, 'segundos': sum(fases.values()), 'fases': fases}
+
+
+_EJECUTORES = {
+    'excel': _caso_excel, 'pdf': _caso_pdf, 'lineas': _caso_lineas, 'balance': _caso_balance,
+    'endpoint': _caso_endpoint, 'nombres': _caso_nombres, 'ia': _caso_ia,
+    'reimportacion': _caso_reimportacion
+}
+
+
+def ejecutar_caso(caso: Dict[str, Any]) -> Dict[str, Any]:
+    """Ejecuta un caso en el proceso actual y agrega el pico de RSS"""
+    resultado = _EJECUTORES[caso['tipo']](caso)
+    resultado['picoRssMb'] = _pico_rss_mb()
+    return resultado
+
+# ========== Orquestación ==========
+
+def nombre_caso(caso: Dict[str, Any]) -> str:
+    if caso['tipo'] == 'excel':
+        return f"excel-{caso['motor']}-{caso['filas']}x{caso['hojas']}" + (f"-p{caso['procesos']}" if caso['procesos'] > 1 else '')
+    if caso['tipo'] == 'pdf':
+        return f"pdf-{'reporte-balance' if caso['balance'] else 'reporte'}-{caso['paginas']}p" + (f"-p{caso['procesos']}" if caso['procesos'] > 1 else '')
+    if caso['tipo'] == 'lineas':
+        return f"lineas-{caso['lineas']}" + (f"-relleno{caso['relleno']}" if caso['relleno'] > 1 else '')
+    if caso['tipo'] == 'balance':
+        return f"balance-{caso['lineas']}"
+    if caso['tipo'] == 'nombres':
+        return f"nombres-{caso['consultas']}-en-{caso['catalogo']}"
+    if caso['tipo'] == 'reimportacion':
+        return f"reimportacion-{caso['paginas']}p-{caso['cambiadas']}cambiadas" + (f"-p{caso['procesos']}" if caso['procesos'] > 1 else '')
+    if caso['tipo'] == 'ia':
+        return f"ia-{caso['paginas']}p-c{caso['concurrencia']}" + (f"-error{caso['tasaError']:g}" if caso['tasaError'] else '')
+    return f"endpoint-{caso['modo']}-{caso['filas']}-{caso['perfil']}" + ('-masiva' if caso['carga_masiva'] else '')
+
+
+def construir_casos(args) -> List[Dict[str, Any]]:
+    tipos = [t.strip() for t in args.casos.split(',') if t.strip()]
+    filas = [int(v) for v in args.filas.split(',') if v.strip()]
+    paginas = [int(v) for v in args.paginas.split(',') if v.strip()]
+    motores = [m.strip() for m in args.motores.split(',') if m.strip()]
+    casos = []
+    if 'excel' in tipos:
+        for n in filas:
+            for motor in motores:
+                casos.append({'tipo': 'excel', 'filas': n, 'hojas': args.hojas, 'motor': motor, 'procesos': args.procesos})
+    if 'pdf' in tipos:
+        for n in paginas:
+            for balance in (False, True):
+                casos.append({'tipo': 'pdf', 'paginas': n, 'lineas': 60, 'balance': balance, 'procesos': args.procesos})
+    if 'lineas' in tipos:
+        for relleno in (1, 40):
+            casos.append({'tipo': 'lineas', 'lineas': args.lineas, 'relleno': relleno})
+    if 'balance' in tipos:
+        casos.append({'tipo': 'balance', 'lineas': args.lineas})
+    if 'nombres' in tipos:
+        casos.append({'tipo': 'nombres', 'catalogo': args.catalogo, 'consultas': args.consultas})
+    if 'reimportacion' in tipos:
+        for n in paginas:
+            casos.append({'tipo': 'reimportacion', 'paginas': n, 'cambiadas': args.paginas_cambiadas, 'procesos': args.procesos})
+    if 'ia' in tipos:
+        for concurrencia in sorted({1, args.concurrencia_ia}):
+            casos.append({
+                'tipo': 'ia', 'paginas': args.paginas_ia, 'concurrencia': concurrencia,
+                'latencia': args.latencia_ia, 'tasaError': args.tasa_error_ia
+            })
+    if 'endpoint' in tipos:
+        perfiles = [p.strip() for p in args.perfiles_sqlite.split(',') if p.strip()]
+        for perfil in perfiles:
+            for modo, carga_masiva in (('filas', False), ('lote', False), ('lote', True), ('diferencial', False)):
+                casos.append({
+                    'tipo': 'endpoint', 'filas': args.filas_endpoint, 'modo': modo,
+                    'perfil': perfil, 'carga_masiva': carga_masiva
+                })
+    return casos
+
+
+def ejecutar_caso_aislado(caso: Dict[str, Any]) -> Dict[str, Any]:
+    """Corre el caso en un subproceso nuevo (RSS y caches aislados) y retorna su resultado"""
+    entorno = dict(os.environ, IMPORT_CACHE_DIR=os.path.join(DIRECTORIO_BENCHMARK, 'cache'))
+    proceso = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--caso', json.dumps(caso)],
+        capture_output=True, text=True, encoding='utf-8', env=entorno
+    )
+    lineas = [l for l in proceso.stdout.splitlines() if l.strip()]
+    if proceso.returncode != 0 or not lineas:
+        return {'error': (proceso.stderr.strip().splitlines() or ['sin salida'])[-1]}
+    return json.loads(lineas[-1])
+
+
+def medir(caso: Dict[str, Any], repeticiones: int) -> Dict[str, Any]:
+    """Mejor de 'repeticiones' ejecuciones (menor tiempo), con filas/s calculado"""
+    mejor = None
+    for _ in range(max(1, repeticiones)):
+        resultado = ejecutar_caso_aislado(caso)
+        if 'error' in resultado or 'omitido' in resultado:
+            mejor = resultado
+            break
+        if mejor is None or resultado['segundos'] < mejor['segundos']:
+            mejor = resultado
+    registro = {'caso': nombre_caso(caso), 'parametros': caso}
+    registro.update(mejor)
+    if 'segundos' in registro:
+        registro['segundos'] = round(registro['segundos'], 4)
+        registro['filasPorSegundo'] = round(registro['filas'] / registro['segundos'], 1) if registro['segundos'] > 0 else None
+        registro['fases'] = {fase: round(s * 1000, 1) for fase, s in registro.get('fases', {}).items()}
+    return registro
+
+
+def imprimir_resultado(r: Dict[str, Any]) -> None:
+    if 'error' in r or 'omitido' in r:
+        print(f"{r['caso']:<42} {'ERROR: ' + r['error'] if 'error' in r else 'omitido: ' + r['omitido']}")
+        return
+    fases = ', '.join(f"{k}={v:.0f}ms" for k, v in r['fases'].items())
+    rss = f"{r['picoRssMb']:.0f}" if r.get('picoRssMb') is not None else '-'
+    print(f"{r['caso']:<42} {r['filas']:>9} {r['segundos']:>9.3f} {r['filasPorSegundo'] or 0:>11.0f} {rss:>7}  {fases}")
+
+
+def _version_codigo() -> Any:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=DIRECTORIO_BACKEND,
+            capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def comparar(resultados: List[Dict[str, Any]], ruta_base: str, tolerancia: float) -> List[str]:
+    """
+    Compara contra una base guardada con --guardar. Es regresión si filas/s cae, o el pico
+    de RSS sube, más de 'tolerancia' por ciento.
+    """
+    with open(ruta_base, 'r', encoding='utf-8') as f:
+        base = {r['caso']: r for r in json.load(f).get('resultados', [])}
+    regresiones = []
+    print(f"\nComparación con {ruta_base} (tolerancia {tolerancia:g}%)")
+    for r in resultados:
+        anterior = base.get(r['caso'])
+        if not anterior or not r.get('filasPorSegundo') or not anterior.get('filasPorSegundo'):
+            continue
+        cambio = (r['filasPorSegundo'] / anterior['filasPorSegundo'] - 1) * 100
+        detalle = f"{r['caso']:<42} filas/s {anterior['filasPorSegundo']:>11.0f} -> {r['filasPorSegundo']:>11.0f} ({cambio:+.1f}%)"
+        if r.get('picoRssMb') and anterior.get('picoRssMb'):
+            cambio_rss = (r['picoRssMb'] / anterior['picoRssMb'] - 1) * 100
+            detalle += f"  RSS {anterior['picoRssMb']:.0f} -> {r['picoRssMb']:.0f} MB ({cambio_rss:+.1f}%)"
+            if cambio_rss > tolerancia:
+                regresiones.append(f"{r['caso']}: pico de RSS {cambio_rss:+.1f}%")
+        if cambio < -tolerancia:
+            regresiones.append(f"{r['caso']}: filas/s {cambio:+.1f}%")
+        print(detalle)
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks del pipeline de importación de productos')
+    parser.add_argument('--casos', default=','.join(TIPOS_CASO), help='Tipos de caso: excel,pdf,lineas,balance,endpoint,nombres,ia,reimportacion')
+    parser.add_argument('--filas', default='1000,100000', help='Filas de los libros XLSX (p. ej. 1000,100000,1000000)')
+    parser.add_argument('--hojas', type=int, default=4, help='Hojas por libro XLSX')
+    parser.add_argument('--motores', default='vectorizado,streaming', help='Motores de procesar_excel a medir')
+    parser.add_argument('--paginas', default='10,100', help='Páginas de los PDF "Reporte de inventario"')
+    parser.add_argument('--paginas-cambiadas', type=int, default=2, help='Páginas corregidas al reimportar (casos reimportacion)')
+    parser.add_argument('--lineas', type=int, default=180000, help='Líneas de reporte (60 por página) para los casos lineas y balance')
+    parser.add_argument('--filas-endpoint', type=int, default=1000, help='Filas del CSV enviado al endpoint FastAPI')
+    parser.add_argument('--catalogo', type=int, default=100000, help='Productos del catálogo para los casos nombres')
+    parser.add_argument('--consultas', type=int, default=20000, help='Nombres buscados en el catálogo (casos nombres)')
+    parser.add_argument('--paginas-ia', type=int, default=40, help='Páginas del PDF enviado al modelo local (casos ia)')
+    parser.add_argument('--concurrencia-ia', type=int, default=4, help='Solicitudes en curso al modelo (casos ia; también se mide 1)')
+    parser.add_argument('--latencia-ia', type=float, default=0.5, help='Segundos por respuesta del modelo local (casos ia)')
+    parser.add_argument('--tasa-error-ia', type=float, default=0.0, help='Fracción de respuestas 503 del modelo local (casos ia)')
+    parser.add_argument('--perfiles-sqlite', default='defecto,rendimiento',
+                        help='Perfiles SQLite (utils/perfilSqlite.py) para los casos endpoint')
+    parser.add_argument('--procesos', type=int, default=1, help='Procesos para procesar_excel/procesar_pdf')
+    parser.add_argument('--repeticiones', type=int, default=1, help='Ejecuciones por caso (se conserva la mejor)')
+    parser.add_argument('--guardar', help='Guardar los resultados como base JSON en esta ruta')
+    parser.add_argument('--comparar', help='Comparar contra una base JSON guardada con --guardar')
+    parser.add_argument('--tolerancia', type=float, default=10.0, help='Porcentaje de regresión tolerado al comparar')
+    parser.add_argument('--caso', help=argparse.SUPPRESS)  # Uso interno: ejecutar un caso en este proceso
+    args = parser.parse_args()
+
+    if args.caso:
+        print(json.dumps(ejecutar_caso(json.loads(args.caso))))
+        return
+
+    tipos_invalidos = [t for t in args.casos.split(',') if t.strip() and t.strip() not in TIPOS_CASO]
+    if tipos_invalidos:
+        parser.error(f"Casos no soportados: {', '.join(tipos_invalidos)}. Use {', '.join(TIPOS_CASO)}")
+
+    print(f"{'caso':<42} {'filas':>9} {'segundos':>9} {'filas/s':>11} {'RSS MB':>7}  fases")
+    resultados = []
+    for caso in construir_casos(args):
+        resultado = medir(caso, args.repeticiones)
+        imprimir_resultado(resultado)
+        resultados.append(resultado)
+
+    if args.guardar:
+        datos = {
+            'generado': datetime.now().isoformat(timespec='seconds'),
+            'version': _version_codigo(),
+            'python': platform.python_version(),
+            'plataforma': platform.platform(),
+            'cpus': os.cpu_count(),
+            'resultados': resultados,
+        }
+        with open(args.guardar, 'w', encoding='utf-8') as f:
+            json.dump(datos, f, ensure_ascii=False, indent=2)
+        print(f"\nBase guardada en {args.guardar}")
+
+    if args.comparar:
+        regresiones = comparar(resultados, args.comparar, args.tolerancia)
+        if regresiones:
+            print('\nRegresiones:\n  ' + '\n  '.join(regresiones))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
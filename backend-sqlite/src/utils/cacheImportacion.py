@@ -0,0 +1,186 @@
+# backend-sqlite/src/utils/cacheImportacion.py
+"""
+Cache de resultados de importación direccionada por contenido.
+
+La clave es el hash SHA-256 de los bytes del archivo más lo que cambie el resultado
+(tipo, versión del código, etc.): volver a subir el mismo archivo retorna lo ya parseado
+sin leerlo de nuevo. Cada entrada es un archivo NDJSON (un registro por línea), de modo
+que se puede escribir y leer por partes sin tener todo el resultado en memoria.
+
+Se eliminan las entradas que llevan más de IMPORT_CACHE_RESULTADOS_HORAS sin usarse y, si
+el total supera IMPORT_CACHE_RESULTADOS_MB, las menos usadas recientemente.
+
+cache_paginas guarda, con sus propios límites (IMPORT_CACHE_PAGINAS_MB/_HORAS), el texto
+y los productos de cada página de PDF por el hash de su contenido: un reporte corregido
+que se vuelve a subir solo extrae las páginas que cambiaron.
+
+Lo usan importProducts.py (como módulo hermano del script) y el endpoint FastAPI.
+"""
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+from functools import lru_cache
+from typing import Any, Iterable, Iterator, Optional
+
+# Bytes por lectura al calcular el hash de un archivo
+TAMANO_BLOQUE_HASH = 1024 * 1024
+
+DIRECTORIO_CACHE = os.environ.get('IMPORT_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'app-inv-importacion')
+DIRECTORIO_RESULTADOS = os.path.join(DIRECTORIO_CACHE, 'resultados')
+DIRECTORIO_PAGINAS = os.path.join(DIRECTORIO_CACHE, 'paginas')
+
+
+def hash_archivo(ruta: str) -> str:
+    """SHA-256 del contenido del archivo, leído por bloques"""
+    h = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(TAMANO_BLOQUE_HASH), b''):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+@lru_cache(maxsize=None)
+def version_codigo(ruta_fuente: str) -> str:
+    """Hash del código que produce el resultado: al cambiar el parser, las entradas viejas no se usan"""
+    return hash_archivo(ruta_fuente)[:12]
+
+
+class CacheResultados:
+    """Entradas NDJSON en un directorio, con desalojo por tamaño total y antigüedad"""
+
+    def __init__(self, directorio: str, max_bytes: int, max_edad_segundos: float):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self.max_edad_segundos = max_edad_segundos
+        self.aciertos = 0
+        self.fallos = 0
+
+    @property
+    def habilitada(self) -> bool:
+        return self.max_bytes > 0 and self.max_edad_segundos > 0
+
+    @staticmethod
+    def clave(huella: str, *partes: Any) -> str:
+        """Clave de la entrada: hash del contenido más las partes que cambian el resultado"""
+        return hashlib.sha256(json.dumps([huella, *partes]).encode('utf-8')).hexdigest()
+
+    def _ruta(self, clave: str) -> str:
+        return os.path.join(self.directorio, f'{clave}.ndjson')
+
+    def leer(self, clave: str) -> Optional[Iterator[Any]]:
+        """
+        Retorna un iterador con los registros guardados, o None si no hay entrada vigente.
+        Leer una entrada la marca como usada recientemente.
+        """
+        if not self.habilitada:
+            return None
+        ruta = self._ruta(clave)
+        try:
+            estado = os.stat(ruta)
+            if time.time() - estado.st_mtime > self.max_edad_segundos:
+                os.remove(ruta)
+                raise FileNotFoundError(ruta)
+            archivo = open(ruta, 'r', encoding='utf-8')
+            os.utime(ruta)
+        except OSError:
+            self.fallos += 1
+            return None
+        self.aciertos += 1
+        return self._registros(archivo)
+
+    @staticmethod
+    def _registros(archivo) -> Iterator[Any]:
+        with archivo:
+            for linea in archivo:
+                yield json.loads(linea)
+
+    def escribir(self, clave: str, registros: Iterable[Any], desalojar: bool = True) -> Iterator[Any]:
+        """
+        Deja pasar los registros mientras los va guardando. La entrada solo se publica si
+        el iterable se consume completo; si falla o se abandona a mitad, se descarta.
+        Un error de disco solo deja el resultado sin guardar: nunca interrumpe la importación.
+        Con desalojar=False, quien escribe muchas entradas seguidas llama a desalojar() al final.
+        """
+        if not self.habilitada:
+            yield from registros
+            return
+        try:
+            os.makedirs(self.directorio, exist_ok=True)
+            fd, temporal = tempfile.mkstemp(dir=self.directorio, suffix='.tmp')
+        except OSError as e:
+            print(f"[DEBUG] No se pudo crear la entrada de la cache de resultados: {str(e)}", file=sys.stderr)
+            yield from registros
+            return
+
+        archivo = os.fdopen(fd, 'w', encoding='utf-8')
+        try:
+            for registro in registros:
+                if archivo is not None:
+                    try:
+                        # Serializar antes de entregarlo: quien lo consume puede modificarlo
+                        archivo.write(json.dumps(registro, ensure_ascii=False, default=str) + '\n')
+                    except OSError as e:
+                        print(f"[DEBUG] No se pudo escribir en la cache de resultados: {str(e)}", file=sys.stderr)
+                        archivo.close()
+                        archivo = None
+                yield registro
+            if archivo is not None:
+                archivo.close()
+                archivo = None
+                try:
+                    os.replace(temporal, self._ruta(clave))
+                except OSError as e:
+                    print(f"[DEBUG] No se pudo publicar la entrada de la cache de resultados: {str(e)}", file=sys.stderr)
+                else:
+                    if desalojar:
+                        self.desalojar()
+        finally:
+            if archivo is not None:
+                archivo.close()
+            if os.path.exists(temporal):
+                os.remove(temporal)
+
+    def guardar(self, clave: str, registros: Iterable[Any], desalojar: bool = True) -> None:
+        for _ in self.escribir(clave, registros, desalojar):
+            pass
+
+    def desalojar(self) -> None:
+        """Elimina las entradas vencidas y, si se supera el tamaño, las menos usadas"""
+        try:
+            entradas = []
+            ahora = time.time()
+            for nombre in os.listdir(self.directorio):
+                if not nombre.endswith('.ndjson'):
+                    continue
+                ruta = os.path.join(self.directorio, nombre)
+                estado = os.stat(ruta)
+                if ahora - estado.st_mtime > self.max_edad_segundos:
+                    os.remove(ruta)
+                else:
+                    entradas.append((estado.st_mtime, estado.st_size, ruta))
+            total = sum(tamano for _, tamano, _ in entradas)
+            for _, tamano, ruta in sorted(entradas):
+                if total <= self.max_bytes:
+                    break
+                os.remove(ruta)
+                total -= tamano
+        except OSError as e:
+            # Otro proceso pudo desalojar la misma entrada; se reintenta en la próxima escritura
+            print(f"[DEBUG] No se pudo desalojar la cache de resultados: {str(e)}", file=sys.stderr)
+
+
+cache_resultados = CacheResultados(
+    DIRECTORIO_RESULTADOS,
+    int(os.environ.get('IMPORT_CACHE_RESULTADOS_MB', '256')) * 1024 * 1024,
+    float(os.environ.get('IMPORT_CACHE_RESULTADOS_HORAS', '168')) * 3600
+)
+
+# Los reportes mensuales se corrigen y se vuelven a subir durante semanas
+cache_paginas = CacheResultados(
+    DIRECTORIO_PAGINAS,
+    int(os.environ.get('IMPORT_CACHE_PAGINAS_MB', '128')) * 1024 * 1024,
+    float(os.environ.get('IMPORT_CACHE_PAGINAS_HORAS', '720')) * 3600
+)
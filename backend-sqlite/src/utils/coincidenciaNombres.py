@@ -0,0 +1,206 @@
+# backend-sqlite/src/utils/coincidenciaNombres.py
+"""
+Coincidencia aproximada de nombres de productos.
+
+Los nombres se normalizan (minúsculas, sin acentos ni signos y sin palabras vacías como
+"de" o "el"; "sin", "con", "para" y "por" se conservan porque "Pan sin sal" no es
+"Pan con sal") y se comparan por sus trigramas de caracteres con el coeficiente de Dice:
+"ACEITE EL GALLEGO DE SOBRE" y "Aceite El Gallego Sobre" son el mismo producto, y un
+error de tipeo ("Aceite Galego Sobre") queda por encima del umbral. Las palabras con
+dígitos (tamaños, presentaciones) deben coincidir exactamente: "Leche 1L" no es "Leche 2L".
+
+La coincidencia aproximada es opcional: sin IMPORT_UMBRAL_SIMILITUD (ni un umbral explícito
+en quien la usa) los importadores solo unen nombres iguales, como antes.
+
+IndiceNombres busca con filtro de prefijo (el de los joins por similitud): con los
+trigramas en un orden global fijo (los menos frecuentes primero), dos nombres que alcanzan
+el umbral comparten al menos COMUNES_EN_PREFIJO trigramas de sus prefijos extendidos.
+Solo se indexa ese prefijo de cada nombre, y cada búsqueda verifica únicamente los
+nombres que comparten esa cantidad de trigramas con el suyo, o los que tienen las mismas
+palabras con dígitos si son menos; nunca recorre todo el catálogo.
+
+Lo usan importProducts.py (como módulo hermano del script) y el endpoint FastAPI.
+"""
+import math
+import os
+import re
+import unicodedata
+from collections import Counter
+from typing import Any, Callable, Dict, FrozenSet, Hashable, Iterable, List, Optional, Tuple
+
+# Similitud mínima (coeficiente de Dice entre trigramas, 0 a 1) para considerar dos
+# nombres como el mismo producto; 1 solo acepta nombres iguales tras normalizarlos.
+# Sin definir, la coincidencia aproximada queda desactivada
+_UMBRAL_ENTORNO = os.environ.get('IMPORT_UMBRAL_SIMILITUD')
+UMBRAL_SIMILITUD: Optional[float] = float(_UMBRAL_ENTORNO) if _UMBRAL_ENTORNO else None
+# Umbral sugerido al activarla: une variantes de escritura y errores de tipeo leves
+UMBRAL_SUGERIDO = 0.85
+
+# Palabras que no distinguen un producto de otro (no las negaciones ni las preposiciones
+# que cambian el producto: "sin", "con", "para", "por")
+PALABRAS_VACIAS = frozenset({
+    'a', 'al', 'de', 'del', 'el', 'en', 'la', 'las', 'lo', 'los', 'y'
+})
+
+TAMANO_GRAMA = 3
+
+# Trigramas que dos nombres parecidos comparten como mínimo en sus prefijos extendidos
+# (más = menos candidatos que verificar, pero prefijos y listas más largos)
+COMUNES_EN_PREFIJO = int(os.environ.get('IMPORT_COMUNES_EN_PREFIJO', '3'))
+
+_NO_ALFANUMERICO = re.compile(r'[^a-z0-9]+')
+
+
+def normalizar(nombre: Any) -> str:
+    """Minúsculas, sin acentos, solo letras y dígitos, sin palabras vacías (si queda alguna otra)"""
+    texto = str(nombre).lower()
+    if not texto.isascii():
+        texto = unicodedata.normalize('NFKD', texto).encode('ascii', 'ignore').decode('ascii')
+    palabras = _NO_ALFANUMERICO.sub(' ', texto).split()
+    return ' '.join([p for p in palabras if p not in PALABRAS_VACIAS] or palabras)
+
+
+def trigramas(normalizado: str) -> FrozenSet[str]:
+    """Trigramas de caracteres del nombre normalizado, con un espacio de relleno en los extremos"""
+    texto = f' {normalizado} '
+    return frozenset(texto[i:i + TAMANO_GRAMA] for i in range(len(texto) - TAMANO_GRAMA + 1))
+
+
+def _numeros(normalizado: str) -> FrozenSet[str]:
+    return frozenset(p for p in normalizado.split() if not p.isalpha())
+
+
+def _dice(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    return 2 * len(a & b) / (len(a) + len(b)) if a or b else 1.0
+
+
+def similitud(nombre_a: Any, nombre_b: Any) -> float:
+    """Similitud entre dos nombres (0 si sus palabras con dígitos difieren)"""
+    a, b = normalizar(nombre_a), normalizar(nombre_b)
+    if _numeros(a) != _numeros(b):
+        return 0.0
+    return _dice(trigramas(a), trigramas(b))
+
+
+class IndiceNombres:
+    """
+    Índice de trigramas para buscar el nombre registrado más parecido.
+    Cada entrada tiene una clave (un id, un nombre exacto, etc.); las entradas no se
+    eliminan: quien usa el índice puede descartar claves vencidas con 'aceptar'.
+    Registrar es barato: los nombres se procesan en la primera búsqueda que los necesita.
+    El orden global de los trigramas (por frecuencia) se recalcula, reindexando los
+    prefijos, cada vez que la cantidad de nombres se duplica.
+    """
+
+    def __init__(self, umbral: float):
+        self.umbral = umbral
+        if not 0 < self.umbral <= 1:
+            raise ValueError(f"Umbral de similitud fuera de rango: {self.umbral}. Use un valor mayor que 0 y hasta 1")
+        # clave -> (orden de registro, trigramas como números, palabras con dígitos)
+        self._entradas: Dict[Hashable, Tuple[int, Tuple[int, ...], FrozenSet[str]]] = {}
+        self._numero_grama: Dict[str, int] = {}  # trigrama -> número (menos memoria que guardar textos)
+        self._por_normalizado: Dict[str, List[Hashable]] = {}
+        self._por_numeros: Dict[FrozenSet[str], List[Hashable]] = {}
+        self._sin_procesar: Dict[Hashable, Any] = {}  # clave -> nombre, en orden de registro
+        self._prefijos: Dict[int, List[Hashable]] = {}  # trigrama -> claves con ese trigrama en su prefijo
+        self._sin_indexar: List[Hashable] = []  # procesadas, aún no agregadas a _prefijos
+        self._rangos: Dict[int, int] = {}  # orden global de los trigramas (frecuencia)
+        self._nombres_al_ordenar = 0
+
+    def __len__(self) -> int:
+        return len(self._entradas) + len(self._sin_procesar)
+
+    def __contains__(self, clave: Hashable) -> bool:
+        return clave in self._entradas or clave in self._sin_procesar
+
+    def agregar(self, clave: Hashable, nombre: Any) -> None:
+        """Registra el nombre con esa clave; si la clave ya existe no hace nada"""
+        if clave not in self._entradas:
+            self._sin_procesar.setdefault(clave, nombre)
+
+    def _procesar(self) -> None:
+        for clave, nombre in self._sin_procesar.items():
+            normalizado = normalizar(nombre)
+            numeros = _numeros(normalizado)
+            gramas = tuple(self._numero_grama.setdefault(g, len(self._numero_grama)) for g in trigramas(normalizado))
+            self._entradas[clave] = (len(self._entradas), gramas, numeros)
+            self._por_normalizado.setdefault(normalizado, []).append(clave)
+            self._por_numeros.setdefault(numeros, []).append(clave)
+            self._sin_indexar.append(clave)
+        self._sin_procesar = {}
+
+    def _minimo_comunes(self, cantidad: int) -> int:
+        """Trigramas que un nombre con 'cantidad' trigramas comparte con cualquiera que alcance el umbral"""
+        # Dice >= t y |a ∩ b| <= |b| implican |a ∩ b| >= t*|a|/(2-t)
+        return max(1, math.ceil(self.umbral * cantidad / (2 - self.umbral) - 1e-9))
+
+    def _prefijo(self, gramas: Iterable[int], cantidad: int) -> List[int]:
+        """Los trigramas del prefijo extendido, en el orden global (los desconocidos primero)"""
+        ordenados = sorted(gramas, key=lambda g: (self._rangos.get(g, 0), g))
+        return ordenados[:cantidad - self._minimo_comunes(cantidad) + COMUNES_EN_PREFIJO]
+
+    def _indexar(self) -> None:
+        if len(self._entradas) >= 2 * self._nombres_al_ordenar:
+            # Los trigramas menos frecuentes primero: prefijos con listas cortas
+            self._rangos = Counter(g for _, gramas, _ in self._entradas.values() for g in gramas)
+            self._nombres_al_ordenar = len(self._entradas)
+            self._prefijos = {}
+            self._sin_indexar = list(self._entradas)
+        for clave in self._sin_indexar:
+            gramas = self._entradas[clave][1]
+            for grama in self._prefijo(gramas, len(gramas)):
+                self._prefijos.setdefault(grama, []).append(clave)
+        self._sin_indexar = []
+
+    def buscar(
+        self, nombre: Any, aceptar: Optional[Callable[[Hashable], bool]] = None
+    ) -> Optional[Tuple[Hashable, float]]:
+        """
+        Retorna (clave, similitud) del nombre más parecido con similitud >= umbral, o None.
+        Con empate gana el registrado primero. 'aceptar' descarta claves que ya no valen.
+        """
+        if self._sin_procesar:
+            self._procesar()
+        normalizado = normalizar(nombre)
+        for clave in self._por_normalizado.get(normalizado, ()):
+            if aceptar is None or aceptar(clave):
+                return clave, 1.0
+        if self.umbral >= 1 or not self._entradas:
+            return None
+        if self._sin_indexar:
+            self._indexar()
+
+        textos = trigramas(normalizado)
+        cantidad = len(textos)
+        # Los trigramas que ningún nombre tiene no están en ningún prefijo, pero cuentan para Dice
+        gramas = {self._numero_grama.get(g, -1 - i) for i, g in enumerate(textos)}
+        numeros = _numeros(normalizado)
+        listas = [self._prefijos.get(g, ()) for g in self._prefijo(gramas, cantidad)]
+        # Las mismas palabras con dígitos también son obligatorias: se recorre lo más corto
+        mismos_numeros = self._por_numeros.get(numeros, ())
+        if len(mismos_numeros) <= sum(len(lista) for lista in listas):
+            candidatos = mismos_numeros
+        else:
+            # Con el orden global fijo, dos nombres que comparten al menos 'minimo' trigramas
+            # comparten al menos 'comunes' en sus prefijos extendidos: se cuentan en C y se
+            # descartan los que no llegan, sin verificarlos
+            comunes = min(COMUNES_EN_PREFIJO, self._minimo_comunes(cantidad))
+            conteo = Counter()
+            for lista in listas:
+                conteo.update(lista)
+            candidatos = [clave for clave, veces in conteo.items() if veces >= comunes]
+
+        # Cantidades de trigramas con las que todavía se puede alcanzar el umbral
+        cantidad_minima = self.umbral * cantidad / (2 - self.umbral) - 1e-9
+        cantidad_maxima = cantidad * (2 - self.umbral) / self.umbral + 1e-9
+        mejor = None
+        for clave in candidatos:
+            orden, gramas_clave, numeros_clave = self._entradas[clave]
+            if not cantidad_minima <= len(gramas_clave) <= cantidad_maxima or numeros_clave != numeros:
+                continue
+            valor = 2 * len(gramas.intersection(gramas_clave)) / (cantidad + len(gramas_clave))
+            if valor < self.umbral or (mejor and (valor, -orden) <= (mejor[1], -mejor[2])):
+                continue
+            if aceptar is None or aceptar(clave):
+                mejor = (clave, valor, orden)
+        return (mejor[0], mejor[1]) if mejor else None
@@ -0,0 +1,240 @@
+# backend-sqlite/src/utils/extraccionIA.py
+"""
+Extracción de productos con un modelo de lenguaje, por fragmentos.
+
+El texto del PDF se divide en fragmentos de páginas completas de hasta
+IMPORT_IA_MAX_CARACTERES caracteres (una página más larga se corta entre líneas), y cada
+fragmento se envía al modelo por separado, con hasta IMPORT_IA_CONCURRENCIA solicitudes
+en curso. Los errores transitorios (límite de solicitudes, error del servidor, tiempo
+agotado, respuesta que no es un array JSON) se reintentan con espera exponencial. Si un
+fragmento agota sus reintentos falla toda la extracción: un inventario con páginas de
+menos no se distingue de uno completo.
+
+El cliente del modelo es intercambiable: ClienteGemini llama a la API de Gemini y
+ClienteHTTP a cualquier servicio que reciba POST {"prompt"} y responda {"texto"}, como
+el servidor local servidorModeloStub.py que usan los benchmarks (IMPORT_IA_URL).
+
+Lo usa importProducts.py (como módulo hermano del script).
+"""
+import json
+import os
+import random
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional
+
+# Servicio HTTP compatible que reemplaza a Gemini (p. ej. servidorModeloStub.py)
+URL_MODELO = os.environ.get('IMPORT_IA_URL') or None
+MODELO_GEMINI = os.environ.get('IMPORT_IA_MODELO', 'gemini-pro')
+
+# Caracteres de texto del documento por solicitud (el límite que antes truncaba todo el PDF)
+MAX_CARACTERES_FRAGMENTO = int(os.environ.get('IMPORT_IA_MAX_CARACTERES', '8000'))
+# Solicitudes al modelo en curso a la vez
+CONCURRENCIA = int(os.environ.get('IMPORT_IA_CONCURRENCIA', '4'))
+# Reintentos por fragmento; la espera antes del intento n es ESPERA_BASE * 2^n (con variación)
+REINTENTOS = int(os.environ.get('IMPORT_IA_REINTENTOS', '3'))
+ESPERA_BASE_SEGUNDOS = float(os.environ.get('IMPORT_IA_ESPERA_BASE', '1'))
+TIMEOUT_SEGUNDOS = float(os.environ.get('IMPORT_IA_TIMEOUT', '120'))
+
+# Prompt estricto para obtener solo JSON
+PROMPT_PRODUCTOS = """Eres un asistente que extrae información de inventarios de documentos.
+Analiza el siguiente texto de un inventario y extrae todos los productos listados.
+
+IMPORTANTE: Debes responder ÚNICAMENTE con un JSON válido, sin texto adicional, sin markdown, sin explicaciones.
+
+El formato de respuesta debe ser exactamente:
+[
+  {
+    "nombre": "Nombre del producto",
+    "codigoBarras": "código o SKU si está disponible",
+    "cantidad": número,
+    "precio": número
+  }
+]
+
+Si no encuentras información completa para algún campo, usa valores por defecto:
+- codigoBarras: "" (string vacío)
+- cantidad: 1
+- precio: 0
+
+Responde SOLO con el array JSON, sin texto adicional."""
+
+# Separa las instrucciones del texto del fragmento en cada prompt
+MARCA_DOCUMENTO = '\n\nTexto del documento:\n'
+
+# Errores de la API de Gemini (google.api_core.exceptions) que no se arreglan reintentando
+_ERRORES_GEMINI_DEFINITIVOS = frozenset({
+    'InvalidArgument', 'PermissionDenied', 'Unauthenticated', 'NotFound', 'FailedPrecondition'
+})
+
+
+class ErrorModelo(Exception):
+    """Fallo de una solicitud al modelo; 'espera' es la pausa pedida por el servicio (Retry-After)"""
+
+    def __init__(self, mensaje: str, reintentable: bool = True, espera: Optional[float] = None):
+        super().__init__(mensaje)
+        self.reintentable = reintentable
+        self.espera = espera
+
+
+class ClienteGemini:
+    """API de Gemini (google-generativeai)"""
+
+    def __init__(self, api_key: str, modelo: str = MODELO_GEMINI):
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self._modelo = genai.GenerativeModel(modelo)
+
+    def generar(self, prompt: str) -> str:
+        try:
+            return self._modelo.generate_content(prompt).text
+        except Exception as e:
+            nombre = type(e).__name__
+            raise ErrorModelo(f'{nombre}: {str(e)}', nombre not in _ERRORES_GEMINI_DEFINITIVOS) from e
+
+
+class ClienteHTTP:
+    """Servicio que recibe POST {"prompt"} y responde {"texto"}"""
+
+    def __init__(self, url: str, api_key: str = None, timeout: float = TIMEOUT_SEGUNDOS):
+        self.url = url
+        self.api_key = api_key
+        self.timeout = timeout
+
+    def generar(self, prompt: str) -> str:
+        encabezados = {'Content-Type': 'application/json'}
+        if self.api_key:
+            encabezados['Authorization'] = f'Bearer {self.api_key}'
+        solicitud = urllib.request.Request(
+            self.url, data=json.dumps({'prompt': prompt}).encode('utf-8'), headers=encabezados, method='POST'
+        )
+        try:
+            with urllib.request.urlopen(solicitud, timeout=self.timeout) as respuesta:
+                return json.loads(respuesta.read().decode('utf-8'))['texto']
+        except urllib.error.HTTPError as e:
+            # 429 y 5xx son transitorios; el resto (credenciales, solicitud inválida) no
+            raise ErrorModelo(
+                f'HTTP {e.code} de {self.url}', e.code == 429 or e.code >= 500,
+                _segundos(e.headers.get('Retry-After') if e.headers else None)
+            ) from e
+        except OSError as e:
+            raise ErrorModelo(f'Sin respuesta de {self.url}: {str(e)}') from e
+        except (ValueError, KeyError, TypeError) as e:
+            raise ErrorModelo(f'Respuesta inválida de {self.url}: {str(e)}') from e
+
+
+def _segundos(valor: Any) -> Optional[float]:
+    try:
+        return max(0.0, float(valor))
+    except (TypeError, ValueError):
+        return None
+
+
+def crear_cliente(api_key: str = None):
+    """ClienteHTTP si IMPORT_IA_URL está definida; si no, ClienteGemini"""
+    if URL_MODELO:
+        return ClienteHTTP(URL_MODELO, api_key)
+    return ClienteGemini(api_key)
+
+
+def firma_configuracion() -> str:
+    """Lo que cambia los productos extraídos (modelo y tamaño de fragmento), para las claves de cache"""
+    return f'{URL_MODELO or MODELO_GEMINI}|{MAX_CARACTERES_FRAGMENTO}'
+
+
+def dividir_en_fragmentos(textos_paginas: Iterable[Optional[str]],
+                          max_caracteres: int = MAX_CARACTERES_FRAGMENTO) -> List[str]:
+    """
+    Agrupa páginas completas (cada una terminada en salto de línea, como
+    PaginasPDF.texto_completo) en fragmentos de hasta max_caracteres. Una página más larga
+    se corta entre líneas, y una línea más larga en trozos de max_caracteres.
+    """
+    fragmentos = []
+    actual = []
+    tamano = 0
+    for texto in textos_paginas:
+        if not texto:
+            continue
+        texto += '\n'
+        piezas = [texto] if len(texto) <= max_caracteres else [
+            linea[inicio:inicio + max_caracteres]
+            for linea in texto.splitlines(keepends=True)
+            for inicio in range(0, len(linea), max_caracteres)
+        ]
+        for pieza in piezas:
+            if actual and tamano + len(pieza) > max_caracteres:
+                fragmentos.append(''.join(actual))
+                actual = []
+                tamano = 0
+            actual.append(pieza)
+            tamano += len(pieza)
+    if actual:
+        fragmentos.append(''.join(actual))
+    return fragmentos
+
+
+def parsear_respuesta(texto: str) -> List[Any]:
+    """Array JSON de la respuesta del modelo (puede venir dentro de un bloque ```json)"""
+    texto = (texto or '').strip()
+    if texto.startswith('```'):
+        texto = '\n'.join(l for l in texto.split('\n') if not l.strip().startswith('```'))
+    try:
+        productos = json.loads(texto)
+    except json.JSONDecodeError as e:
+        raise ErrorModelo(f'Error al parsear respuesta de la IA como JSON: {str(e)}. Respuesta recibida: {texto[:200]}') from e
+    if not isinstance(productos, list):
+        raise ErrorModelo('La respuesta de la IA no es un array válido')
+    return productos
+
+
+def _extraer_fragmento(cliente, fragmento: str, reintentos: int, espera_base: float) -> List[Any]:
+    prompt = f'{PROMPT_PRODUCTOS}{MARCA_DOCUMENTO}{fragmento}'
+    intento = 0
+    while True:
+        try:
+            return parsear_respuesta(cliente.generar(prompt))
+        except Exception as e:
+            # Un cliente propio puede lanzar cualquier excepción: se trata como transitoria
+            if not getattr(e, 'reintentable', True) or intento >= reintentos:
+                raise
+            espera = getattr(e, 'espera', None)
+            if espera is None:
+                # Variación aleatoria para que los fragmentos rechazados juntos no reintenten juntos
+                espera = espera_base * 2 ** intento * random.uniform(0.5, 1.0)
+            time.sleep(espera)
+            intento += 1
+
+
+def extraer_productos(textos_paginas: Iterable[Optional[str]], cliente,
+                      max_caracteres: int = None, concurrencia: int = None,
+                      reintentos: int = None, espera_base: float = None) -> List[Dict[str, Any]]:
+    """
+    Productos de todos los fragmentos tal como los devuelve el modelo, en el orden del
+    documento. Lanza ErrorModelo si algún fragmento falla después de sus reintentos.
+    """
+    fragmentos = dividir_en_fragmentos(textos_paginas, max_caracteres or MAX_CARACTERES_FRAGMENTO)
+    if not fragmentos:
+        return []
+    reintentos = REINTENTOS if reintentos is None else reintentos
+    espera_base = ESPERA_BASE_SEGUNDOS if espera_base is None else espera_base
+    trabajadores = max(1, min(int(concurrencia or CONCURRENCIA), len(fragmentos)))
+
+    productos = []
+    ejecutor = ThreadPoolExecutor(max_workers=trabajadores)
+    try:
+        futuros = [
+            ejecutor.submit(_extraer_fragmento, cliente, fragmento, reintentos, espera_base)
+            for fragmento in fragmentos
+        ]
+        for numero, futuro in enumerate(futuros, 1):
+            try:
+                respuesta = futuro.result()
+            except Exception as e:
+                raise ErrorModelo(f'Fragmento {numero} de {len(fragmentos)}: {str(e)}', False) from e
+            productos.extend(p for p in respuesta if isinstance(p, dict))
+    finally:
+        # Si un fragmento falló, los que aún no empezaron ya no se envían
+        ejecutor.shutdown(wait=True, cancel_futures=True)
+    return productos
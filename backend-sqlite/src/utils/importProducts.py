@@ -3,30 +3,76 @@
 """
 Script para importar productos desde archivos XLSX o PDF
 Versión mejorada y robusta para integración con backend Node.js
+
+Las dependencias pesadas se cargan solo en la ruta que las usa:
+pandas/numpy/openpyxl para Excel y pdfplumber para PDF.
 """
 
+from __future__ import annotations
+
+import time
+_INICIO_CARGA = time.perf_counter()  # Para --startup-profile
+
 import sys
 import json
 import os
-import pandas as pd
 import io
 import re
-from typing import List, Dict, Any
+import hashlib
+import importlib.util
+import itertools
+import tempfile
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import List, Dict, Any, Iterable, Iterator, TYPE_CHECKING
 import traceback
 
-# Configurar encoding para salida estándar (importante para Windows/Node.js)
-sys.stdout.reconfigure(encoding='utf-8')
-sys.stderr.reconfigure(encoding='utf-8')
+# Módulos hermanos (solo biblioteca estándar), compartidos con el endpoint FastAPI:
+# cache de resultados y coincidencia aproximada de nombres
+import cacheImportacion
+import coincidenciaNombres
+# Extracción con IA por fragmentos (solo la usa este script)
+import extraccionIA
+
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+
+def _configurar_salida():
+    """Configurar encoding para salida estándar (importante para Windows/Node.js)"""
+    sys.stdout.reconfigure(encoding='utf-8')
+    sys.stderr.reconfigure(encoding='utf-8')
+
+# Tiempo acumulado (segundos) por fase del procesamiento; lo leen los benchmarks
+tiempos_fase: Dict[str, float] = {}
+
+@contextmanager
+def _medir_fase(nombre: str):
+    """Acumula en tiempos_fase el tiempo que tarda el bloque"""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        tiempos_fase[nombre] = tiempos_fase.get(nombre, 0.0) + time.perf_counter() - inicio
+
+def _es_nulo(valor: Any) -> bool:
+    """Equivalente a pd.isna para un valor escalar, sin cargar pandas"""
+    if valor is None:
+        return True
+    try:
+        return bool(valor != valor)  # NaN (float/numpy) y NaT son distintos de sí mismos
+    except TypeError:
+        return True  # pd.NA: su comparación es ambigua
 
 def limpiar_texto(texto: Any) -> str:
     """Limpia y normaliza texto"""
-    if pd.isna(texto) or texto is None:
+    if _es_nulo(texto):
         return ""
     return str(texto).strip()
 
 def parsear_numero(valor: Any) -> float:
     """Convierte un valor a número, manejando diferentes formatos"""
-    if pd.isna(valor) or valor is None or valor == '':
+    if _es_nulo(valor) or valor == '':
         return 0.0
     
     if isinstance(valor, (int, float)):
@@ -42,17 +88,97 @@ def parsear_numero(valor: Any) -> float:
         return 0.0
 
 
+# Formato numérico de una columna: (separador de miles, separador decimal)
+_FORMATO_NUMERICO_PREDETERMINADO = (',', '.')
+_FORMATO_NUMERICO_COMA_DECIMAL = ('.', ',')
+# Símbolos de moneda y espacios que se eliminan antes de convertir
+_CARACTERES_MONEDA = '$€ \t\xa0\u202f'
+_TABLA_SIN_MONEDA = str.maketrans('', '', _CARACTERES_MONEDA)
+_PATRON_SIN_MONEDA = '[' + re.escape(_CARACTERES_MONEDA) + ']'
+_PATRON_TEXTO_NUMERICO = re.compile(r'[-+]?[\d\.,]*\d[\d\.,]*')
+# Filas iniciales de la hoja/tabla usadas para detectar el formato de cada columna
+_FILAS_MUESTRA_FORMATO = 1000
+
+
+def _quitar_moneda(texto: str) -> str:
+    """Quita prefijo RD$, símbolos $/€ y espacios de un texto numérico"""
+    texto = texto.strip()
+    if texto[:3].upper() == 'RD$':
+        texto = texto[3:]
+    return texto.translate(_TABLA_SIN_MONEDA)
+
+
+def _detectar_formato_numerico(valores: Any) -> Any:
+    """
+    Detecta una sola vez el formato de una columna de montos a partir de sus valores de texto:
+    '1,234.56' / '1,500' -> miles ',' y decimal '.' (predeterminado)
+    '1.234,56' / '12,50' / '1.234.567' -> miles '.' y decimal ','
+    Retorna (separador_miles, separador_decimal).
+    """
+    coma_decimal = False
+    punto_decimal = False
+    for valor in valores:
+        if not isinstance(valor, str):
+            continue
+        texto = _quitar_moneda(valor)
+        if not _PATRON_TEXTO_NUMERICO.fullmatch(texto):
+            continue
+        comas = texto.count(',')
+        puntos = texto.count('.')
+        if comas and puntos:
+            # Ambos separadores: el último es el decimal
+            return _FORMATO_NUMERICO_COMA_DECIMAL if texto.rfind(',') > texto.rfind('.') else _FORMATO_NUMERICO_PREDETERMINADO
+        if comas == 1 and len(texto) - texto.rfind(',') - 1 != 3:
+            coma_decimal = True
+        elif comas > 1:
+            punto_decimal = True
+        elif puntos > 1:
+            coma_decimal = True
+        elif puntos == 1 and len(texto) - texto.rfind('.') - 1 != 3:
+            punto_decimal = True
+    if coma_decimal and not punto_decimal:
+        return _FORMATO_NUMERICO_COMA_DECIMAL
+    return _FORMATO_NUMERICO_PREDETERMINADO
+
+
+def _numero_con_formato(valor: Any, formato: Any) -> float:
+    """Como parsear_numero, pero usando el formato detectado para la columna"""
+    if _es_nulo(valor) or valor == '':
+        return 0.0
+
+    if isinstance(valor, (int, float)):
+        return float(valor)
+
+    texto = _quitar_moneda(str(valor))
+    miles, decimal = formato
+    texto = texto.replace(miles, '')
+    if decimal != '.':
+        texto = texto.replace(decimal, '.')
+
+    try:
+        return float(texto)
+    except ValueError:
+        return 0.0
+
+
+def parsear_columna_numerica(valores: List[Any], formato: Any = None) -> List[float]:
+    """
+    Convierte una columna completa de montos: detecta el formato una sola vez
+    (RD$, separador de miles, coma o punto decimal) y luego convierte todos los valores.
+    """
+    if formato is None:
+        formato = _detectar_formato_numerico(valores[:_FILAS_MUESTRA_FORMATO])
+    # Sin pandas: la ruta PDF solo carga pdfplumber (ver _DEPENDENCIAS_PDF); las hojas
+    # Excel usan la versión vectorizada, _serie_numerica
+    return [_numero_con_formato(valor, formato) for valor in valores]
+
+
 # Formato "Reporte de inventario": líneas tipo "ARTICULO ... UDS CANTIDAD COSTO RD$ TOTAL"
 # Ej: ACEITE EL GALLEGO DE SOBRE UNI UDS 8.00 15.00 RD$ 120.00  o  CHULETA LIB UDS 77.44 105.00 RD$ 8,131.20
-_REPORTE_INVENTARIO_LINEA = re.compile(
-    r'^(.+?)\s+(\d+[\.,]?\d*)\s+(\d+[\.,]?\d*)\s+RD\$?\s*([\d\s,\.]+)\s*$',
-    re.IGNORECASE
-)
-# Versión greedy del nombre para no cortar en números intermedios (ej. "EL GALLO 8/1")
-_REPORTE_INVENTARIO_LINEA_GREEDY = re.compile(
-    r'^(.+)\s+(\d+[\.,]?\d*)\s+(\d+[\.,]?\d*)\s+RD\$?\s*([\d\s,\.]+)\s*$',
-    re.IGNORECASE
-)
+# El nombre puede tener números intermedios (ej. "EL GALLO 8/1"): cantidad y costo son siempre
+# las dos palabras antes del último "RD" (sin importar mayúsculas)
+_PREFIJOS_NO_PRODUCTO = ('fecha :', 'lineas ', 'total rd$', 'contador ', 'tel', 'inventario no:')
+_ENCABEZADO_REPORTE = 'ARTICULO UNIDAD CANTIDAD'
 _UNIDADES_SUFIJO = frozenset({'UDS', 'PAQ', 'LIB', 'UNI', 'UND', 'UNIDAD', 'UNIDADES', 'UNID'})
 _HEADERS_SALTAR = frozenset({
     'articulo', 'unidad', 'cantidad', 'costo', 'total', 'observación', 'observacion',
@@ -90,94 +216,180 @@ def _extraer_porcentaje_linea(linea: str) -> float:
         return 0.0
 
 
+# Balance General / Distribución de Saldo: reglas en el orden de una cadena if/elif. Cada
+# regla es (campo, alternativas, excluidas): se cumple si la línea (en mayúsculas) contiene
+# todas las palabras de alguna alternativa y ninguna excluida; gana la primera que se cumple.
+_REGLAS_BALANCE = (
+    ('efectivo_caja_banco', (('EFECTIVO', 'CAJA'), ('EFECTIVO', 'BANCO')), ()),
+    ('cuentas_por_cobrar', (('COBRAR',), ('FIAO',)), ()),
+    ('valor_inventario', (('INVENTARIO', 'MERCANCIA'),), ()),
+    ('deuda_a_negocio', (('DEUDA', 'NEGOCIO'),), ()),
+    ('activos_fijos', (('ACTIVOS FIJOS',),), ()),
+    ('total_activos', (('TOTAL ACTIVOS',),), ()),
+    ('total_corrientes', (('CORRIENTES', 'TOTAL'),), ()),
+    ('total_fijos', (('TOTAL FIJOS',),), ()),
+    ('cuentas_por_pagar', (('POR PAGAR',), ('SUPLIDORES',)), ()),
+    ('total_pasivos', (('TOTAL PASIVOS',),), ('CAPITAL',)),
+    ('capital_contable', (('CAPITAL', 'TRABAJO'), ('CAPITAL', 'CONTABLE')), ()),
+    ('total_pasivos_mas_capital', (('PASIVOS + CAPITAL',), ('PASIVOS Y CAPITAL',)), ()),
+    ('ventas_del_mes', (('VENTAS', 'MES'), ('VENTAS', 'DEL'), ('VENTAS', '$')), ()),
+    ('gastos_generales', (('GASTOS',), ('PAGO DE INVENTARIO',)), ()),
+    ('utilidad_neta', (('UTILIDAD NETA',),), ()),
+    ('utilidad_bruta', (('UTILIDAD BRUTA',),), ()),
+    ('porcentaje_neto', (('PORCIENTO NETO',), ('PORCENTAJE NETO',)), ()),
+    ('porcentaje_bruto', (('PORCIENTO BRUTO',), ('PORCENTAJE BRUTO',)), ()),
+)
+# Campos que no toma la última línea: el primero, el último con monto positivo, o el primero positivo
+_BALANCE_PRIMERO = frozenset({'cuentas_por_cobrar'})
+_BALANCE_POSITIVO = frozenset({'total_activos'})
+_BALANCE_PRIMERO_POSITIVO = frozenset({'gastos_generales'})
+_BALANCE_PORCENTAJE = frozenset({'porcentaje_neto', 'porcentaje_bruto'})
+
+_REGLAS_DISTRIBUCION = (
+    ('efectivo_caja_banco', (('EFECTIVO',), ('CAJA',)), ()),
+    ('inventario_mercancia', (('INVENTARIO',),), ()),
+    ('activos_fijos', (('ACTIVOS FIJOS',),), ()),
+    ('cuentas_por_cobrar', (('COBRAR',),), ()),
+    ('cuentas_por_pagar', (('PAGAR',),), ()),
+    ('otros', (('OTROS',),), ()),
+)
+# Campo del Balance que se usa cuando la línea de la Distribución no trae monto
+_DISTRIBUCION_DESDE_BALANCE = {
+    'efectivo_caja_banco': 'efectivo_caja_banco',
+    'inventario_mercancia': 'valor_inventario',
+    'activos_fijos': 'activos_fijos',
+    'cuentas_por_cobrar': 'cuentas_por_cobrar',
+    'cuentas_por_pagar': 'cuentas_por_pagar',
+}
+
+# Deuda a negocio sin la línea "DEUDA ... NEGOCIO": a veces aparece como "EMILIO RD$" o nombre + RD$
+_PALABRAS_DEUDA_ALTERNATIVA = frozenset({'EMILIO', 'ADEUDADA', 'CUENTA'})
+_PALABRAS_NO_DEUDA = frozenset({'INVENTARIO', 'COBRAR'})
+
+_PALABRAS_CLAVE = frozenset(
+    {p for _, alternativas, excluidas in _REGLAS_BALANCE + _REGLAS_DISTRIBUCION
+     for p in excluidas + tuple(p for alt in alternativas for p in alt)}
+    .union(_PALABRAS_DEUDA_ALTERNATIVA, _PALABRAS_NO_DEUDA)
+)
+# Palabras que encuentran las líneas candidatas: toda alternativa de una regla contiene
+# alguna. Las comunes en líneas de productos ("RD$", "TOTAL", "DEL MONTE") no están
+_PALABRAS_DISPARADORAS = (
+    'EFECTIVO', 'CAJA', 'COBRAR', 'FIAO', 'INVENTARIO', 'DEUDA', 'ACTIVOS', 'FIJOS', 'CORRIENTES',
+    'PAGAR', 'SUPLIDORES', 'PASIVOS', 'CAPITAL', 'VENTAS', 'GASTOS', 'UTILIDAD', 'PORCIENTO',
+    'PORCENTAJE', 'OTROS', 'EMILIO', 'CUENTA'
+)
+
+
+def _patron_trie(palabras: Iterable[str]) -> str:
+    """Expresión regular con las palabras en forma de trie: los prefijos comunes se comparan una vez"""
+    ramas = {}
+    termina = False
+    for palabra in palabras:
+        if palabra:
+            ramas.setdefault(palabra[0], []).append(palabra[1:])
+        else:
+            termina = True
+    alternativas = [re.escape(letra) + _patron_trie(restos) for letra, restos in sorted(ramas.items())]
+    if not alternativas:
+        return ''
+    patron = alternativas[0] if len(alternativas) == 1 else '(?:' + '|'.join(alternativas) + ')'
+    return f'(?:{patron})?' if termina else patron
+
+
+# Autómata de las palabras disparadoras: lo recorre el motor de expresiones regulares (en C)
+# sobre todo el texto de una vez, en lugar de probar cada palabra en cada línea
+_PATRON_DISPARADORAS = re.compile(_patron_trie(_PALABRAS_DISPARADORAS))
+
+
+def _lineas_con_palabras_clave(texto_upper: str) -> Iterator[Any]:
+    """
+    Recorre el texto (en mayúsculas) una sola vez y retorna, en orden, (índice de línea,
+    palabras clave de la línea) de cada línea con alguna palabra disparadora. Las demás
+    líneas no se miran una por una.
+    """
+    indice = 0
+    contado_hasta = 0
+    m = _PATRON_DISPARADORAS.search(texto_upper)
+    while m:
+        posicion = m.start()
+        indice += texto_upper.count('\n', contado_hasta, posicion)
+        inicio_linea = texto_upper.rfind('\n', 0, posicion) + 1
+        fin_linea = texto_upper.find('\n', posicion)
+        if fin_linea < 0:
+            fin_linea = len(texto_upper)
+        linea_upper = texto_upper[inicio_linea:fin_linea]
+        yield indice, {p for p in _PALABRAS_CLAVE if p in linea_upper}
+        contado_hasta = fin_linea
+        m = _PATRON_DISPARADORAS.search(texto_upper, fin_linea)
+
+
+def _primera_regla(reglas: tuple, palabras: set) -> Any:
+    """Campo de la primera regla que cumple la línea, o None"""
+    for campo, alternativas, excluidas in reglas:
+        if any(palabras.issuperset(alt) for alt in alternativas) and palabras.isdisjoint(excluidas):
+            return campo
+    return None
+
+
 def _extraer_balance_y_distribucion(texto_completo: str) -> Dict[str, Dict[str, Any]]:
     """
     Extrae Balance General y Distribución de Saldo del texto de un PDF
     (formato Infocolmados / reporte de inventario con Balance y Distribución).
     Retorna { 'balanceGeneral': {...}, 'distribucionSaldo': {...} } con los campos encontrados.
+    Una sola pasada: cada línea con palabras clave se asigna a su campo y solo en ellas se leen montos.
     """
     if not texto_completo or len(texto_completo.strip()) < 50:
         return {}
     texto_upper = texto_completo.upper()
+    con_balance = 'BALANCE GENERAL' in texto_upper
+    con_distribucion = 'DISTRIBUCION' in texto_upper and 'SALDO' in texto_upper
+    if not con_balance and not con_distribucion:
+        return {}
     balance = {}
     distribucion = {}
+    montos_distribucion = {}  # campo -> monto de la última línea de la Distribución de Saldo
+    deuda_alternativa = None
     lineas = texto_completo.split('\n')
 
-    # --- Balance General ---
-    if 'BALANCE GENERAL' in texto_upper:
-        for i, linea in enumerate(lineas):
-            lin = linea.strip()
-            lin_upper = lin.upper()
-            if not lin:
-                continue
-            val = _extraer_monto_linea(lin)
-            if 'EFECTIVO' in lin_upper and ('CAJA' in lin_upper or 'BANCO' in lin_upper):
-                balance['efectivo_caja_banco'] = val
-            elif 'COBRAR' in lin_upper or 'FIAO' in lin_upper:
-                if 'cuentas_por_cobrar' not in balance:
-                    balance['cuentas_por_cobrar'] = val
-            elif 'INVENTARIO' in lin_upper and 'MERCANCIA' in lin_upper:
-                balance['valor_inventario'] = val
-            elif 'DEUDA' in lin_upper and 'NEGOCIO' in lin_upper:
-                balance['deuda_a_negocio'] = val
-            elif 'ACTIVOS FIJOS' in lin_upper:
-                balance['activos_fijos'] = val
-            elif 'TOTAL ACTIVOS' in lin_upper or 'TOTAL ACTIVOS' in lin:
-                if val > 0:
-                    balance['total_activos'] = val
-            elif 'CORRIENTES' in lin_upper and 'TOTAL' in lin_upper:
-                balance['total_corrientes'] = val
-            elif 'TOTAL FIJOS' in lin_upper:
-                balance['total_fijos'] = val
-            elif 'POR PAGAR' in lin_upper or 'CTAS. POR PAGAR' in lin_upper or 'SUPLIDORES' in lin_upper:
-                balance['cuentas_por_pagar'] = val
-            elif 'TOTAL PASIVOS' in lin_upper and 'CAPITAL' not in lin_upper:
-                balance['total_pasivos'] = val
-            elif 'CAPITAL' in lin_upper and ('TRABAJO' in lin_upper or 'CONTABLE' in lin_upper):
-                balance['capital_contable'] = val
-            elif 'PASIVOS + CAPITAL' in lin_upper or 'PASIVOS Y CAPITAL' in lin_upper:
-                balance['total_pasivos_mas_capital'] = val
-            elif 'VENTAS' in lin_upper and ('MES' in lin_upper or 'DEL' in lin_upper or '$' in lin):
-                balance['ventas_del_mes'] = val
-            elif 'GASTOS' in lin_upper or 'PAGO DE INVENTARIO' in lin_upper:
-                if val > 0 and 'gastos_generales' not in balance:
-                    balance['gastos_generales'] = val
-            elif 'UTILIDAD NETA' in lin_upper:
-                balance['utilidad_neta'] = val
-            elif 'UTILIDAD BRUTA' in lin_upper:
-                balance['utilidad_bruta'] = val
-            elif 'PORCIENTO NETO' in lin_upper or 'PORCENTAJE NETO' in lin_upper:
-                balance['porcentaje_neto'] = val if val > 0 else _extraer_porcentaje_linea(lin)
-            elif 'PORCIENTO BRUTO' in lin_upper or 'PORCENTAJE BRUTO' in lin_upper:
-                balance['porcentaje_bruto'] = val if val > 0 else _extraer_porcentaje_linea(lin)
-        # Deuda a negocio: a veces aparece como "EMILIO RD$" o nombre + RD$
-        if 'deuda_a_negocio' not in balance:
-            for linea in lineas:
-                if re.search(r'RD\$?\s*[\d\s,\.]+', linea) and 'INVENTARIO' not in linea.upper() and 'COBRAR' not in linea.upper():
-                    if 'EMILIO' in linea.upper() or 'ADEUDADA' in linea.upper() or 'CUENTA' in linea.upper():
-                        v = _extraer_monto_linea(linea)
-                        if v > 0:
-                            balance['deuda_a_negocio'] = v
-                            break
+    for indice, palabras in _lineas_con_palabras_clave(texto_upper):
+        lin = lineas[indice].strip()
+        val = None
+        # --- Balance General ---
+        if con_balance:
+            campo = _primera_regla(_REGLAS_BALANCE, palabras)
+            if campo is not None:
+                val = _extraer_monto_linea(lin)
+                if campo in _BALANCE_PRIMERO:
+                    balance.setdefault(campo, val)
+                elif campo in _BALANCE_POSITIVO:
+                    if val > 0:
+                        balance[campo] = val
+                elif campo in _BALANCE_PRIMERO_POSITIVO:
+                    if val > 0:
+                        balance.setdefault(campo, val)
+                elif campo in _BALANCE_PORCENTAJE:
+                    balance[campo] = val if val > 0 else _extraer_porcentaje_linea(lin)
+                else:
+                    balance[campo] = val
+            if (deuda_alternativa is None and not palabras.isdisjoint(_PALABRAS_DEUDA_ALTERNATIVA)
+                    and palabras.isdisjoint(_PALABRAS_NO_DEUDA)
+                    and re.search(r'RD\$?\s*[\d\s,\.]+', lineas[indice])):
+                v = _extraer_monto_linea(lineas[indice])
+                if v > 0:
+                    deuda_alternativa = v
+        # --- Distribución de Saldo ---
+        if con_distribucion:
+            campo = _primera_regla(_REGLAS_DISTRIBUCION, palabras)
+            if campo is not None:
+                montos_distribucion[campo] = _extraer_monto_linea(lin) if val is None else val
+    if con_balance and 'deuda_a_negocio' not in balance and deuda_alternativa is not None:
+        balance['deuda_a_negocio'] = deuda_alternativa
 
-    # --- Distribución de Saldo (usar mismos datos que Balance cuando aplique) ---
-    if 'DISTRIBUCION' in texto_upper and 'SALDO' in texto_upper:
-        for i, linea in enumerate(lineas):
-            lin = linea.strip()
-            lin_upper = lin.upper()
-            val = _extraer_monto_linea(lin)
-            if 'EFECTIVO' in lin_upper or 'CAJA' in lin_upper:
-                distribucion['efectivo_caja_banco'] = val or balance.get('efectivo_caja_banco', 0)
-            elif 'INVENTARIO' in lin_upper:
-                distribucion['inventario_mercancia'] = val or balance.get('valor_inventario', 0)
-            elif 'ACTIVOS FIJOS' in lin_upper:
-                distribucion['activos_fijos'] = val or balance.get('activos_fijos', 0)
-            elif 'COBRAR' in lin_upper:
-                distribucion['cuentas_por_cobrar'] = val or balance.get('cuentas_por_cobrar', 0)
-            elif 'PAGAR' in lin_upper:
-                distribucion['cuentas_por_pagar'] = val or balance.get('cuentas_por_pagar', 0)
-            elif 'OTROS' in lin_upper:
-                distribucion['otros'] = val
+    if con_distribucion:
+        # Usar los mismos datos que Balance cuando la línea no trae monto
+        for campo, val in montos_distribucion.items():
+            respaldo = _DISTRIBUCION_DESDE_BALANCE.get(campo)
+            distribucion[campo] = (val or balance.get(respaldo, 0)) if respaldo else val
     else:
         # Si no hay sección Distribución, rellenar desde Balance para la vista
         if balance:
@@ -198,6 +410,35 @@ def _extraer_balance_y_distribucion(texto_completo: str) -> Dict[str, Dict[str,
     return result
 
 
+def _numero_reporte(palabra: str) -> bool:
+    """Dígitos con a lo sumo un separador ('.' o ',') que no va al inicio: 8, 8.00, 8,5, 8."""
+    entero, _, decimales = palabra.replace(',', '.', 1).partition('.')
+    return entero.isdecimal() and (not decimales or decimales.isdecimal())
+
+
+def _clasificar_linea_reporte(linea: str) -> Any:
+    """
+    Clasifica una línea del reporte en una sola pasada, desde el final:
+    retorna (nombre, cantidad, costo), o None si no es una línea de producto.
+    """
+    # Total: lo que sigue al último "RD" (y a su "$" opcional), solo dígitos, espacios, ',' y '.'
+    posicion = max(linea.rfind('RD'), linea.rfind('rd'), linea.rfind('Rd'), linea.rfind('rD'))
+    if posicion < 1 or not linea[posicion - 1].isspace():
+        return None
+    total = linea[posicion + 2:]
+    if total[:1] == '$':
+        total = total[1:]
+    digitos_total = ''.join(total.replace(',', '').replace('.', '').split())
+    if not total or (digitos_total and not digitos_total.isdecimal()):
+        return None
+    # Antes del RD: nombre, cantidad y costo separados por espacios
+    partes = linea[:posicion].rsplit(None, 2)
+    if len(partes) < 3 or not _numero_reporte(partes[1]) or not _numero_reporte(partes[2]):
+        return None
+    # Ya validados como número: float directo, quitando la coma igual que parsear_numero
+    return partes[0], float(partes[1].replace(',', '')), float(partes[2].replace(',', ''))
+
+
 def _extraer_productos_desde_lineas_texto(lineas: List[str]) -> List[Dict[str, Any]]:
     """
     Extrae productos de líneas de texto en formato reporte de inventario:
@@ -209,20 +450,15 @@ def _extraer_productos_desde_lineas_texto(lineas: List[str]) -> List[Dict[str, A
         if not linea_limpia or len(linea_limpia) < 10:
             continue
         # Saltar cabeceras y metadatos
-        if linea_limpia.lower().startswith('fecha :') or linea_limpia.lower().startswith('lineas ') or \
-           linea_limpia.lower().startswith('total rd$') or linea_limpia.lower().startswith('contador ') or \
-           'pag.' in linea_limpia.lower() or linea_limpia.lower().startswith('tel') or \
-           linea_limpia.lower().startswith('inventario no:'):
+        minusculas = linea_limpia.lower()
+        if minusculas.startswith(_PREFIJOS_NO_PRODUCTO) or 'pag.' in minusculas:
             continue
-        if linea_limpia.upper().startswith('ARTICULO UNIDAD CANTIDAD'):
+        if linea_limpia[:len(_ENCABEZADO_REPORTE)].upper() == _ENCABEZADO_REPORTE:
             continue
-        m = _REPORTE_INVENTARIO_LINEA_GREEDY.match(linea_limpia) or _REPORTE_INVENTARIO_LINEA.match(linea_limpia)
-        if not m:
+        campos = _clasificar_linea_reporte(linea_limpia)
+        if campos is None:
             continue
-        nombre_raw, str_cant, str_costo, str_total = m.group(1).strip(), m.group(2), m.group(3), m.group(4)
-        cantidad = parsear_numero(str_cant)
-        costo = parsear_numero(str_costo)
-        total = parsear_numero(str_total.replace(' ', '').replace(',', ''))
+        nombre_raw, cantidad, costo = campos
         if cantidad <= 0 or cantidad > 100000:
             cantidad = 1
         if costo < 0 or costo >= 1000000:
@@ -246,128 +482,624 @@ def _extraer_productos_desde_lineas_texto(lineas: List[str]) -> List[Dict[str, A
         })
     return productos
 
-def procesar_excel(archivo_path: str) -> List[Dict[str, Any]]:
-    """Procesa un archivo Excel y retorna una lista de diccionarios"""
+# Mapeo de posibles nombres de columnas - ENFOQUE: Nombre, Cantidad, Costo, Total, Código
+_MAPA_COLUMNAS_EXCEL = {
+    'nombre': ['nombre', 'producto', 'descripción', 'descripcion', 'articulo', 'item', 'description'],
+    'cantidad': ['cantidad', 'cant', 'qty', 'unidad', 'unidades', 'stock', 'existencia'],
+    'costo': ['costo', 'costo unitario', 'precio unitario', 'valor unitario', 'precio', 'pvp', 'cost'],
+    'total': ['total', 'valor total', 'importe', 'monto total'],
+    'categoria': ['categoria', 'categoría', 'grupo', 'familia', 'departamento', 'category'],
+    'codigo': ['codigo', 'código', 'barcode', 'sku', 'ref', 'referencia', 'id', 'cod', 'code']
+}
+_HEADERS_COMUNES_EXCEL = frozenset({
+    'nombre', 'descripcion', 'articulo', 'producto', 'item', 'cantidad', 'costo', 'precio', 'total', 'codigo', 'barcode'
+})
+_CODIGOS_VACIOS = frozenset({'nan', 'none', 'null', ''})
+
+# Motores disponibles para procesar_excel:
+# - 'vectorizado': operaciones por columna completa con pandas/NumPy (por defecto)
+# - 'filas': recorrido fila a fila con df.iterrows(), se conserva como referencia
+# - 'streaming': cursor de solo lectura de openpyxl, memoria acotada sin importar el tamaño del archivo
+MOTORES_EXCEL = ('vectorizado', 'filas', 'streaming')
+
+
+def _detectar_columnas_excel(columnas: List[str]) -> Dict[str, str]:
+    """Identifica qué columna de la hoja corresponde a cada campo destino"""
+    columnas_encontradas = {}
+    for campo_destino, posibles_nombres in _MAPA_COLUMNAS_EXCEL.items():
+        for posible in posibles_nombres:
+            match = next((col for col in columnas if posible in col), None)
+            if match:
+                columnas_encontradas[campo_destino] = match
+                break
+    return columnas_encontradas
+
+
+# Directorio de caches del importador (se puede cambiar con IMPORT_CACHE_DIR)
+DIRECTORIO_CACHE = os.environ.get('IMPORT_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'app-inv-importacion')
+
+
+def _escribir_json_atomico(ruta: str, datos: Any) -> None:
+    """Escribe JSON en un archivo temporal y lo renombra, para no dejar archivos a medio escribir"""
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    fd, temporal = tempfile.mkstemp(dir=os.path.dirname(ruta), suffix='.tmp')
     try:
-        print(f"[DEBUG] Iniciando procesamiento Excel: {archivo_path}", file=sys.stderr)
-        
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(datos, f, ensure_ascii=False)
+        os.replace(temporal, ruta)
+    except Exception:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+
+
+class CacheColumnas:
+    """
+    Cache LRU firma de encabezados -> columnas detectadas.
+    La firma es la tupla de nombres de columna normalizados de la hoja; las plantillas
+    de proveedor que se repiten saltan la detección por subcadenas de _MAPA_COLUMNAS_EXCEL.
+    Se mantiene en memoria (en modo --serve dura todo el proceso) y se persiste en disco.
+    """
+
+    def __init__(self, ruta: str, max_entradas: int = 256):
+        self.ruta = ruta
+        self.max_entradas = max_entradas
+        self.version = hashlib.sha1(json.dumps(_MAPA_COLUMNAS_EXCEL, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+        self.aciertos = 0
+        self.fallos = 0
+        self._entradas: 'OrderedDict[str, Dict[str, str]]' = OrderedDict()
+        self._cargada = False
+        self._modificada = False
+
+    def _leer_archivo(self) -> 'OrderedDict[str, Dict[str, str]]':
+        """Lee las entradas guardadas; un archivo ausente, corrupto o de otra versión se ignora"""
+        try:
+            with open(self.ruta, 'r', encoding='utf-8') as f:
+                datos = json.load(f)
+            if datos.get('version') != self.version:
+                return OrderedDict()
+            return OrderedDict((firma, columnas) for firma, columnas in datos.get('entradas', []))
+        except (OSError, ValueError, TypeError, AttributeError):
+            return OrderedDict()
+
+    def _cargar(self) -> None:
+        if not self._cargada:
+            self._entradas = self._leer_archivo()
+            self._cargada = True
+
+    def detectar(self, columnas: List[str]) -> Dict[str, str]:
+        """Retorna las columnas detectadas para estos encabezados, usando la cache si es posible"""
+        if self.max_entradas <= 0:
+            return _detectar_columnas_excel(columnas)
+        self._cargar()
+        firma = json.dumps(list(columnas), ensure_ascii=False)
+        encontradas = self._entradas.get(firma)
+        if encontradas is not None:
+            self._entradas.move_to_end(firma)
+            self.aciertos += 1
+            return dict(encontradas)
+
+        self.fallos += 1
+        encontradas = _detectar_columnas_excel(columnas)
+        self._entradas[firma] = dict(encontradas)
+        while len(self._entradas) > self.max_entradas:
+            self._entradas.popitem(last=False)
+        self._modificada = True
+        return encontradas
+
+    def guardar(self) -> None:
+        """Persiste la cache si cambió, combinándola con lo que otros procesos hayan guardado"""
+        if not self._modificada:
+            return
+        try:
+            entradas = self._leer_archivo()
+            for firma, columnas in self._entradas.items():
+                entradas.pop(firma, None)
+                entradas[firma] = columnas
+            while len(entradas) > self.max_entradas:
+                entradas.popitem(last=False)
+            _escribir_json_atomico(self.ruta, {'version': self.version, 'entradas': list(entradas.items())})
+            self._modificada = False
+        except OSError as e:
+            print(f"[DEBUG] No se pudo guardar la cache de columnas: {str(e)}", file=sys.stderr)
+
+    def estadisticas(self) -> Dict[str, int]:
+        return {'aciertos': self.aciertos, 'fallos': self.fallos, 'entradas': len(self._entradas)}
+
+
+cache_columnas = CacheColumnas(
+    os.path.join(DIRECTORIO_CACHE, 'columnas_excel.json'),
+    int(os.environ.get('IMPORT_CACHE_COLUMNAS_MAX', '256'))
+)
+
+
+def _columnas_hoja(sheet_name: str, columnas: List[str]) -> Any:
+    """
+    Detecta las columnas de una hoja aplicando la heurística de columna nombre.
+    Retorna None si la hoja no tiene estructura válida.
+    """
+    columnas_encontradas = cache_columnas.detectar(columnas)
+
+    # Si no encontramos columna nombre en esta hoja, intentamos con la primera columna de texto
+    # Pero si la hoja está vacía o no tiene estructura válida, la saltamos
+    if 'nombre' not in columnas_encontradas:
+        if len(columnas) > 0:
+            # Heurística: la columna de nombre suele ser la que tiene strings más largos
+            # O simplemente la primera/segunda columna
+            columnas_encontradas['nombre'] = columnas[0]
+        else:
+            print(f"[DEBUG] Saltando hoja {sheet_name}: No se identificó columna nombre", file=sys.stderr)
+            return None
+    return columnas_encontradas
+
+
+def _producto_desde_fila(row: Any, columnas: List[str], columnas_encontradas: Dict[str, str], formato_de: Any) -> Any:
+    """
+    Convierte una fila (cualquier objeto con .get(columna)) en producto.
+    'formato_de(columna)' retorna el formato numérico detectado para esa columna.
+    Retorna None si la fila es vacía o es un header repetido.
+    """
+    def numero_columna(col: str) -> float:
+        return _numero_con_formato(row.get(col), formato_de(col))
+
+    nombre = limpiar_texto(row.get(columnas_encontradas.get('nombre')))
+
+    # Saltar filas vacías o headers
+    if not nombre or len(nombre) < 2:
+        return None
+
+    # Filtrar headers comunes
+    if nombre.lower().strip() in _HEADERS_COMUNES_EXCEL:
+        return None
+
+    # Extraer cantidad (PRIORIDAD ALTA)
+    cantidad = 1  # Valor por defecto
+    if 'cantidad' in columnas_encontradas:
+        cantidad_val = numero_columna(columnas_encontradas.get('cantidad'))
+        if cantidad_val > 0:
+            cantidad = int(cantidad_val) if cantidad_val <= 100000 else 1
+
+    # Extraer costo unitario (PRIORIDAD ALTA)
+    costo = 0
+    if 'costo' in columnas_encontradas:
+        costo = numero_columna(columnas_encontradas.get('costo'))
+
+    # Si tenemos total pero no costo, calcular costo = total / cantidad
+    if 'total' in columnas_encontradas and costo == 0 and cantidad > 0:
+        total_val = numero_columna(columnas_encontradas.get('total'))
+        if total_val > 0:
+            costo = total_val / cantidad
+
+    # Si tenemos total pero no cantidad, calcular cantidad = total / costo
+    if 'total' in columnas_encontradas and cantidad == 1 and costo > 0:
+        total_val = numero_columna(columnas_encontradas.get('total'))
+        if total_val > 0:
+            cantidad = int(total_val / costo) or 1
+
+    # Si no encontramos costo, buscar en otras columnas numéricas
+    if costo == 0:
+        for col in columnas:
+            if col not in [columnas_encontradas.get('nombre'), columnas_encontradas.get('cantidad'), columnas_encontradas.get('total')]:
+                val = numero_columna(col)
+                if val > 0 and val < 1000000:
+                    costo = val
+                    break
+
+    # Extraer código de barras
+    codigo_barras = None
+    if 'codigo' in columnas_encontradas:
+        val_codigo = row.get(columnas_encontradas.get('codigo'))
+        if not _es_nulo(val_codigo):
+            codigo_barras = str(val_codigo).strip()
+            if codigo_barras.lower() in _CODIGOS_VACIOS:
+                codigo_barras = None
+
+    categoria = 'General'
+    if 'categoria' in columnas_encontradas:
+        cat_val = limpiar_texto(row.get(columnas_encontradas.get('categoria')))
+        if cat_val and len(cat_val) > 2:
+            categoria = cat_val
+
+    return {
+        'nombre': nombre,
+        'codigoBarras': codigo_barras,
+        'cantidad': cantidad,
+        'precio': costo if costo > 0 else 0,
+        'costoBase': costo if costo > 0 else 0,
+        'categoria': categoria,
+        'unidad': 'unidad'
+    }
+
+
+def _formatos_hoja(df: pd.DataFrame) -> Any:
+    """Retorna formato_de(columna), que detecta (una vez por columna) el formato numérico de la hoja"""
+    formatos: Dict[str, Any] = {}
+    muestra = df.head(_FILAS_MUESTRA_FORMATO)
+
+    def formato_de(col: str) -> Any:
+        if col not in formatos:
+            formatos[col] = _detectar_formato_numerico(muestra[col].tolist()) if col in muestra else _FORMATO_NUMERICO_PREDETERMINADO
+        return formatos[col]
+    return formato_de
+
+
+def _productos_hoja_filas(df: pd.DataFrame, columnas_encontradas: Dict[str, str]) -> List[Dict[str, Any]]:
+    """Motor de referencia: procesa la hoja fila a fila con df.iterrows()"""
+    productos = []
+    columnas = list(df.columns)
+    formato_de = _formatos_hoja(df)
+    for _, row in df.iterrows():
+        producto = _producto_desde_fila(row, columnas, columnas_encontradas, formato_de)
+        if producto:
+            productos.append(producto)
+    return productos
+
+
+def _float_o_cero(texto: Any) -> float:
+    try:
+        return float(texto)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _serie_numerica(serie: pd.Series, formato: Any) -> np.ndarray:
+    """
+    Versión por columna de _numero_con_formato: quita moneda y separadores en una sola pasada
+    vectorizada y solo convierte con float() las celdas que to_numeric no pudo convertir.
+    """
+    import pandas as pd
+
+    miles, decimal = formato
+    texto = serie.astype(object).where(serie.notna(), None)
+    try:
+        limpio = texto.str.strip().str.replace(r'^[Rr][Dd]\$', '', regex=True).str.replace(_PATRON_SIN_MONEDA, '', regex=True)
+    except AttributeError:
+        # Columna sin celdas de texto (solo números): se convierte tal cual
+        limpio = texto
+    else:
+        limpio = limpio.str.replace(miles, '', regex=False)
+        if decimal != '.':
+            limpio = limpio.str.replace(decimal, '.', regex=False)
+        # Las celdas que ya son números (columna mixta) no pasan por .str: se convierten tal cual
+        limpio = limpio.where(limpio.notna(), texto)
+    numeros = pd.to_numeric(limpio, errors='coerce').astype(float)
+    vacias = texto.isna() | (texto == '')
+    pendientes = numeros.isna() & ~vacias
+    if pendientes.any():
+        numeros[pendientes] = [_float_o_cero(v) for v in limpio[pendientes]]
+    numeros[vacias] = 0.0
+    return numeros.to_numpy(dtype=float)
+
+
+def _serie_texto(serie: pd.Series) -> pd.Series:
+    """Versión por columna de limpiar_texto"""
+    return serie.astype(object).where(serie.notna(), '').astype(str).str.strip()
+
+
+def _productos_hoja_vectorizado(df: pd.DataFrame, columnas_encontradas: Dict[str, str]) -> List[Dict[str, Any]]:
+    """
+    Motor vectorizado: aplica las mismas reglas que _producto_desde_fila
+    con operaciones sobre columnas completas.
+    """
+    import numpy as np
+
+    formato_de = _formatos_hoja(df)
+    nombres = _serie_texto(df[columnas_encontradas['nombre']])
+    validas = (nombres.str.len() >= 2) & ~nombres.str.lower().str.strip().isin(_HEADERS_COMUNES_EXCEL)
+    if not validas.any():
+        return []
+    df = df.loc[validas.to_numpy()]
+    nombres = nombres[validas]
+    filas = len(df)
+
+    # Cada columna numérica se convierte una sola vez
+    numericas: Dict[str, np.ndarray] = {}
+
+    def numerica(col: str) -> np.ndarray:
+        if col not in numericas:
+            numericas[col] = _serie_numerica(df[col], formato_de(col))
+        return numericas[col]
+
+    # Cantidad (valor por defecto 1)
+    cantidad = np.ones(filas, dtype=np.int64)
+    if 'cantidad' in columnas_encontradas:
+        cantidad_val = numerica(columnas_encontradas['cantidad'])
+        positivas = cantidad_val > 0
+        razonables = positivas & (cantidad_val <= 100000)
+        cantidad[razonables] = np.trunc(cantidad_val[razonables]).astype(np.int64)
+
+    # Costo unitario
+    costo = np.zeros(filas, dtype=float)
+    if 'costo' in columnas_encontradas:
+        costo = numerica(columnas_encontradas['costo']).copy()
+
+    if 'total' in columnas_encontradas:
+        total_val = numerica(columnas_encontradas['total'])
+        # costo = total / cantidad cuando no hay costo
+        sin_costo = (costo == 0) & (cantidad > 0) & (total_val > 0)
+        costo[sin_costo] = total_val[sin_costo] / cantidad[sin_costo]
+        # cantidad = total / costo cuando la cantidad quedó en 1
+        sin_cantidad = (cantidad == 1) & (costo > 0) & (total_val > 0)
+        if sin_cantidad.any():
+            calculada = np.trunc(total_val[sin_cantidad] / costo[sin_cantidad]).astype(np.int64)
+            calculada[calculada == 0] = 1
+            cantidad[sin_cantidad] = calculada
+
+    # Costo de respaldo: primera columna numérica razonable en orden de columnas
+    pendientes = costo == 0
+    if pendientes.any():
+        excluidas = {columnas_encontradas.get('nombre'), columnas_encontradas.get('cantidad'), columnas_encontradas.get('total')}
+        for col in df.columns:
+            if col in excluidas:
+                continue
+            val = numerica(col)
+            acierto = pendientes & (val > 0) & (val < 1000000)
+            costo[acierto] = val[acierto]
+            pendientes &= ~acierto
+            if not pendientes.any():
+                break
+
+    # Código de barras
+    if 'codigo' in columnas_encontradas:
+        serie_codigo = df[columnas_encontradas['codigo']]
+        codigos = serie_codigo.astype(object).where(serie_codigo.notna(), '').astype(str).str.strip()
+        vacios = serie_codigo.isna().to_numpy() | codigos.str.lower().isin(_CODIGOS_VACIOS).to_numpy()
+        codigos = [None if vacio else codigo for codigo, vacio in zip(codigos.tolist(), vacios)]
+    else:
+        codigos = [None] * filas
+
+    # Categoría (por defecto 'General')
+    if 'categoria' in columnas_encontradas:
+        cat_val = _serie_texto(df[columnas_encontradas['categoria']])
+        categorias = cat_val.where(cat_val.str.len() > 2, 'General').tolist()
+    else:
+        categorias = ['General'] * filas
+
+    costos = [c if c > 0 else 0 for c in costo.tolist()]
+    return [
+        {
+            'nombre': nombre,
+            'codigoBarras': codigo,
+            'cantidad': cant,
+            'precio': c,
+            'costoBase': c,
+            'categoria': categoria,
+            'unidad': 'unidad'
+        }
+        for nombre, codigo, cant, c, categoria in zip(nombres.tolist(), codigos, cantidad.tolist(), costos, categorias)
+    ]
+
+
+# Valores que pd.read_excel interpreta como nulos (na_values por defecto de pandas)
+_VALORES_NULOS_EXCEL = frozenset({
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'
+})
+# Con values_only=True openpyxl entrega las celdas de error como texto ('#DIV/0!', '#REF!', ...)
+_ERRORES_EXCEL = frozenset({'#NULL!', '#DIV/0!', '#VALUE!', '#REF!', '#NAME?', '#NUM!', '#N/A'})
+
+
+def _celda_excel_a_texto(valor: Any) -> Any:
+    """
+    Convierte una celda de openpyxl al mismo texto que produce pd.read_excel(dtype=str).
+    Retorna None para las celdas que pandas considera nulas.
+    """
+    if valor is None:
+        return None
+    if isinstance(valor, str):
+        if valor in _VALORES_NULOS_EXCEL or valor in _ERRORES_EXCEL:
+            return None
+        return valor
+    if isinstance(valor, bool):
+        return str(valor)
+    if isinstance(valor, (int, float)):
+        entero = int(valor)
+        return str(entero) if entero == valor else str(float(valor))
+    return str(valor)
+
+
+def _nombres_columnas_streaming(encabezado: tuple) -> List[str]:
+    """Nombres de columnas de la fila de encabezado, con las mismas reglas que pandas"""
+    nombres = []
+    for i, valor in enumerate(encabezado):
+        if valor is None or valor == '':
+            nombres.append(f'Unnamed: {i}')
+        elif isinstance(valor, (int, float)) and not isinstance(valor, bool) and int(valor) == valor:
+            nombres.append(int(valor))
+        else:
+            nombres.append(valor)
+    # Deduplicar como pandas: 'total', 'total.1', 'total.2'...
+    conteos: Dict[Any, int] = {}
+    for i, col in enumerate(nombres):
+        actual = conteos.get(col, 0)
+        while actual > 0:
+            conteos[col] = actual + 1
+            col = f'{col}.{actual}'
+            actual = conteos.get(col, 0)
+        nombres[i] = col
+        conteos[col] = actual + 1
+    return [str(col).strip().lower() for col in nombres]
+
+
+def _formatos_muestra(filas: List[Dict[str, Any]]) -> Any:
+    """Como _formatos_hoja, para las filas de muestra (dicts) del modo streaming"""
+    formatos: Dict[str, Any] = {}
+
+    def formato_de(col: str) -> Any:
+        if col not in formatos:
+            formatos[col] = _detectar_formato_numerico([fila.get(col) for fila in filas])
+        return formatos[col]
+    return formato_de
+
+
+def iterar_productos_excel(archivo_path: str, hojas: List[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Lee el Excel con el cursor de solo lectura de openpyxl y genera los productos
+    hoja por hoja y fila por fila. Solo se mantiene en memoria la fila actual
+    (además de la tabla de textos compartidos del libro).
+    Si se indica 'hojas', solo se recorren esas hojas.
+    """
+    from openpyxl import load_workbook
+
+    libro = load_workbook(archivo_path, read_only=True, data_only=True)
+    try:
+        print(f"[DEBUG] Excel abierto en modo streaming. Hojas encontradas: {libro.sheetnames}", file=sys.stderr)
+        for hoja in libro.worksheets:
+            if hojas is not None and hoja.title not in hojas:
+                continue
+            hoja.reset_dimensions()
+            filas = hoja.iter_rows(values_only=True)
+            encabezado = next(filas, None)
+            # Quitar celdas vacías al final del encabezado (pandas las trata como 'Unnamed: N')
+            encabezado = list(encabezado or ())
+            while encabezado and (encabezado[-1] is None or encabezado[-1] == ''):
+                encabezado.pop()
+            columnas = _nombres_columnas_streaming(tuple(encabezado))
+
+            columnas_encontradas = None
+            # Las primeras filas se retienen para detectar el formato numérico de cada columna
+            muestra = []
+            formato_de = None
+            filas_leidas = 0
+            for fila in filas:
+                filas_leidas += 1
+                if columnas_encontradas is None:
+                    columnas_encontradas = _columnas_hoja(hoja.title, columnas or ['unnamed: 0'])
+                # Filas más anchas que el encabezado: columnas adicionales 'unnamed: N'
+                while len(columnas) < len(fila):
+                    columnas.append(f'unnamed: {len(columnas)}')
+                valores = {columnas[i]: _celda_excel_a_texto(v) for i, v in enumerate(fila) if v is not None}
+                if formato_de is None:
+                    muestra.append((valores, len(fila)))
+                    if len(muestra) < _FILAS_MUESTRA_FORMATO:
+                        continue
+                    formato_de = _formatos_muestra([v for v, _ in muestra])
+                else:
+                    muestra = [(valores, len(fila))]
+                for valores_fila, ancho in muestra:
+                    producto = _producto_desde_fila(valores_fila, columnas[:ancho], columnas_encontradas, formato_de)
+                    if producto:
+                        yield producto
+            if formato_de is None and muestra:
+                formato_de = _formatos_muestra([v for v, _ in muestra])
+                for valores_fila, ancho in muestra:
+                    producto = _producto_desde_fila(valores_fila, columnas[:ancho], columnas_encontradas, formato_de)
+                    if producto:
+                        yield producto
+            print(f"[DEBUG] Hoja procesada en modo streaming: {hoja.title}. Filas: {filas_leidas}", file=sys.stderr)
+    finally:
+        libro.close()
+
+
+def _productos_de_hoja(sheet_name: str, df: pd.DataFrame, motor: str) -> List[Dict[str, Any]]:
+    """Detecta columnas y extrae los productos de una hoja ya leída"""
+    print(f"[DEBUG] Procesando hoja: {sheet_name}. Filas: {len(df)}", file=sys.stderr)
+
+    # Normalizar nombres de columnas (minusculas, sin acentos, sin espacios extra)
+    df.columns = df.columns.astype(str).str.strip().str.lower()
+
+    # Identificar columnas
+    columnas_encontradas = _columnas_hoja(sheet_name, list(df.columns))
+    if columnas_encontradas is None:
+        return []
+
+    procesar_hoja = _productos_hoja_vectorizado if motor == 'vectorizado' else _productos_hoja_filas
+    return procesar_hoja(df, columnas_encontradas)
+
+
+def _procesar_hoja_excel(archivo_path: str, sheet_name: str, motor: str) -> Any:
+    """
+    Lee y procesa una sola hoja. Se ejecuta dentro de los procesos del pool.
+    Retorna (productos, aciertos_cache, fallos_cache).
+    """
+    aciertos, fallos = cache_columnas.aciertos, cache_columnas.fallos
+    if motor == 'streaming':
+        productos = list(iterar_productos_excel(archivo_path, hojas=[sheet_name]))
+    else:
+        import pandas as pd
+        df = pd.read_excel(archivo_path, sheet_name=sheet_name, dtype=str)
+        productos = _productos_de_hoja(sheet_name, df, motor)
+    cache_columnas.guardar()
+    return productos, cache_columnas.aciertos - aciertos, cache_columnas.fallos - fallos
+
+
+# Pool de procesos reutilizable para hojas Excel y rangos de páginas PDF
+# (en modo --serve se conserva entre trabajos)
+_pool_hojas = None
+_pool_hojas_tamano = 0
+
+def _obtener_pool(procesos: int):
+    """Retorna un ProcessPoolExecutor de 'procesos' workers, reutilizando el existente"""
+    global _pool_hojas, _pool_hojas_tamano
+    from concurrent.futures import ProcessPoolExecutor
+
+    if _pool_hojas is None or _pool_hojas_tamano != procesos:
+        if _pool_hojas is not None:
+            _pool_hojas.shutdown(wait=False)
+        _pool_hojas = ProcessPoolExecutor(max_workers=procesos)
+        _pool_hojas_tamano = procesos
+    return _pool_hojas
+
+
+def procesar_excel(archivo_path: str, motor: str = 'vectorizado', procesos: int = 1) -> List[Dict[str, Any]]:
+    """
+    Procesa un archivo Excel y retorna una lista de diccionarios.
+    Con procesos > 1 las hojas se leen y procesan en paralelo en un pool de procesos;
+    los productos se devuelven en el orden original de las hojas.
+    """
+    try:
+        if motor not in MOTORES_EXCEL:
+            return {'error': f'Motor Excel no soportado: {motor}. Use {", ".join(MOTORES_EXCEL)}'}
+        procesos = max(1, int(procesos or 1))
+        print(f"[DEBUG] Iniciando procesamiento Excel: {archivo_path} (motor: {motor}, procesos: {procesos})", file=sys.stderr)
+
+        if procesos > 1:
+            import pandas as pd
+            with pd.ExcelFile(archivo_path) as libro:
+                hojas = libro.sheet_names
+            print(f"[DEBUG] Hojas encontradas: {hojas}. Procesando en paralelo", file=sys.stderr)
+            all_productos = []
+            with _medir_fase('hojas_paralelo'):
+                if len(hojas) > 1:
+                    pool = _obtener_pool(min(procesos, len(hojas)))
+                    # map conserva el orden de las hojas
+                    resultados = pool.map(_procesar_hoja_excel, [archivo_path] * len(hojas), hojas, [motor] * len(hojas))
+                else:
+                    resultados = [_procesar_hoja_excel(archivo_path, hoja, motor) for hoja in hojas]
+                aciertos = fallos = 0
+                for productos_hoja, aciertos_hoja, fallos_hoja in resultados:
+                    all_productos.extend(productos_hoja)
+                    aciertos += aciertos_hoja
+                    fallos += fallos_hoja
+            print(f"[DEBUG] Cache de columnas: {aciertos} aciertos, {fallos} fallos", file=sys.stderr)
+            print(f"[DEBUG] Total productos encontrados en todas las hojas: {len(all_productos)}", file=sys.stderr)
+            return all_productos
+
+        aciertos, fallos = cache_columnas.aciertos, cache_columnas.fallos
+        if motor == 'streaming':
+            with _medir_fase('streaming'):
+                all_productos = list(iterar_productos_excel(archivo_path))
+            cache_columnas.guardar()
+            print(f"[DEBUG] Cache de columnas: {cache_columnas.aciertos - aciertos} aciertos, {cache_columnas.fallos - fallos} fallos", file=sys.stderr)
+            print(f"[DEBUG] Total productos encontrados en todas las hojas: {len(all_productos)}", file=sys.stderr)
+            return all_productos
+
         # Leer TODAS las hojas del Excel
         # sheet_name=None devuelve un dict {nombre_hoja: DataFrame}
-        xls = pd.read_excel(archivo_path, sheet_name=None, dtype=str)
-        
+        import pandas as pd
+        with _medir_fase('lectura'):
+            xls = pd.read_excel(archivo_path, sheet_name=None, dtype=str)
+
         all_productos = []
-        
+
         print(f"[DEBUG] Excel leído. Hojas encontradas: {list(xls.keys())}", file=sys.stderr)
-        
-        for sheet_name, df in xls.items():
-            print(f"[DEBUG] Procesando hoja: {sheet_name}. Filas: {len(df)}", file=sys.stderr)
-            
-            # Normalizar nombres de columnas (minusculas, sin acentos, sin espacios extra)
-            df.columns = df.columns.astype(str).str.strip().str.lower()
-            
-            # Mapeo de posibles nombres de columnas - ENFOQUE: Nombre, Cantidad, Costo, Total, Código
-            mapa_columnas = {
-                'nombre': ['nombre', 'producto', 'descripción', 'descripcion', 'articulo', 'item', 'description'],
-                'cantidad': ['cantidad', 'cant', 'qty', 'unidad', 'unidades', 'stock', 'existencia'],
-                'costo': ['costo', 'costo unitario', 'precio unitario', 'valor unitario', 'precio', 'pvp', 'cost'],
-                'total': ['total', 'valor total', 'importe', 'monto total'],
-                'categoria': ['categoria', 'categoría', 'grupo', 'familia', 'departamento', 'category'],
-                'codigo': ['codigo', 'código', 'barcode', 'sku', 'ref', 'referencia', 'id', 'cod', 'code']
-            }
-            
-            # Identificar columnas
-            columnas_encontradas = {}
-            for campo_destino, posibles_nombres in mapa_columnas.items():
-                for posible in posibles_nombres:
-                    match = next((col for col in df.columns if posible in col), None)
-                    if match:
-                        columnas_encontradas[campo_destino] = match
-                        break
-            
-            # Si no encontramos columna nombre en esta hoja, intentamos con la primera columna de texto
-            # Pero si la hoja está vacía o no tiene estructura válida, la saltamos
-            if 'nombre' not in columnas_encontradas:
-                if len(df.columns) > 0:
-                     # Heurística: la columna de nombre suele ser la que tiene strings más largos
-                     # O simplemente la primera/segunda columna
-                     columnas_encontradas['nombre'] = df.columns[0]
-                else:
-                    print(f"[DEBUG] Saltando hoja {sheet_name}: No se identificó columna nombre", file=sys.stderr)
-                    continue
 
-            for _, row in df.iterrows():
-                nombre = limpiar_texto(row.get(columnas_encontradas.get('nombre')))
-                
-                # Saltar filas vacías o headers
-                if not nombre or len(nombre) < 2:
-                    continue
-                
-                # Filtrar headers comunes
-                headers_comunes = ['nombre', 'descripcion', 'articulo', 'producto', 'item', 'cantidad', 'costo', 'precio', 'total', 'codigo', 'barcode']
-                if nombre.lower().strip() in headers_comunes:
-                    continue
-                
-                # Extraer cantidad (PRIORIDAD ALTA)
-                cantidad = 1  # Valor por defecto
-                if 'cantidad' in columnas_encontradas:
-                    cantidad_val = parsear_numero(row.get(columnas_encontradas.get('cantidad')))
-                    if cantidad_val > 0:
-                        cantidad = int(cantidad_val) if cantidad_val <= 100000 else 1
-                
-                # Extraer costo unitario (PRIORIDAD ALTA)
-                costo = 0
-                if 'costo' in columnas_encontradas:
-                    costo = parsear_numero(row.get(columnas_encontradas.get('costo')))
-                
-                # Si tenemos total pero no costo, calcular costo = total / cantidad
-                if 'total' in columnas_encontradas and costo == 0 and cantidad > 0:
-                    total_val = parsear_numero(row.get(columnas_encontradas.get('total')))
-                    if total_val > 0:
-                        costo = total_val / cantidad
-                
-                # Si tenemos total pero no cantidad, calcular cantidad = total / costo
-                if 'total' in columnas_encontradas and cantidad == 1 and costo > 0:
-                    total_val = parsear_numero(row.get(columnas_encontradas.get('total')))
-                    if total_val > 0:
-                        cantidad = int(total_val / costo) or 1
-                
-                # Si no encontramos costo, buscar en otras columnas numéricas
-                if costo == 0:
-                    for col in df.columns:
-                        if col not in [columnas_encontradas.get('nombre'), columnas_encontradas.get('cantidad'), columnas_encontradas.get('total')]:
-                            val = parsear_numero(row.get(col))
-                            if val > 0 and val < 1000000:
-                                costo = val
-                                break
-                
-                # Extraer código de barras
-                codigo_barras = None
-                if 'codigo' in columnas_encontradas:
-                    val_codigo = row.get(columnas_encontradas.get('codigo'))
-                    if not pd.isna(val_codigo):
-                        codigo_barras = str(val_codigo).strip()
-                        if codigo_barras.lower() in ['nan', 'none', 'null', '']:
-                             codigo_barras = None
-
-                # Agregar producto si tenemos nombre válido
-                if nombre and len(nombre) >= 2:
-                    categoria = 'General'
-                    if 'categoria' in columnas_encontradas:
-                        cat_val = limpiar_texto(row.get(columnas_encontradas.get('categoria')))
-                        if cat_val and len(cat_val) > 2:
-                            categoria = cat_val
-
-                    producto = {
-                        'nombre': nombre,
-                        'codigoBarras': codigo_barras,
-                        'cantidad': cantidad,
-                        'precio': costo if costo > 0 else 0,
-                        'costoBase': costo if costo > 0 else 0,
-                        'categoria': categoria,
-                        'unidad': 'unidad'
-                    }
-                    all_productos.append(producto)
-        
+        with _medir_fase('parseo'):
+            for sheet_name, df in xls.items():
+                all_productos.extend(_productos_de_hoja(sheet_name, df, motor))
+
+        cache_columnas.guardar()
+        print(f"[DEBUG] Cache de columnas: {cache_columnas.aciertos - aciertos} aciertos, {cache_columnas.fallos - fallos} fallos", file=sys.stderr)
         print(f"[DEBUG] Total productos encontrados en todas las hojas: {len(all_productos)}", file=sys.stderr)
         return all_productos
 
@@ -377,77 +1109,220 @@ def procesar_excel(archivo_path: str) -> List[Dict[str, Any]]:
         print(f"[DEBUG] Traceback Excel: {traceback.format_exc()}", file=sys.stderr)
         return {'error': f'Error procesando Excel: {str(e)}'}
 
-def procesar_pdf_con_gemini(archivo_path: str, api_key: str) -> List[Dict[str, Any]]:
+class PaginasPDF:
     """
-    Procesa un PDF usando Gemini AI para extraer productos con prompt estricto JSON
+    Cache de páginas de un PDF: el texto y las tablas de cada página se extraen
+    como máximo una vez y todas las estrategias de procesar_pdf leen de aquí.
+    El archivo se abre al primer uso; lo ya extraído sigue disponible tras cerrarlo.
+    Los productos de cada página pasan además por la cache en disco de páginas
+    (cacheImportacion.cache_paginas); con sin_cache se vuelven a extraer y se reemplazan.
     """
-    try:
+
+    def __init__(self, archivo_path: str, sin_cache: bool = False):
+        self.archivo_path = archivo_path
+        self.sin_cache = sin_cache
+        self._pdf = None
+        self._total_paginas = None
+        self._textos: Dict[int, Any] = {}
+        self._tablas: Dict[int, Any] = {}
+        self._texto_completo = None
+        self._paginas_guardadas = False
+        self.paginas_desde_cache = 0
+
+    def _abrir(self):
+        if self._pdf is None:
+            import pdfplumber
+            self._pdf = pdfplumber.open(self.archivo_path)
+            self._total_paginas = len(self._pdf.pages)
+        return self._pdf
+
+    def cerrar(self) -> None:
+        if self._pdf is not None:
+            self._pdf.close()
+            self._pdf = None
+        if self._paginas_guardadas:
+            # Un solo recorrido del directorio por documento, no uno por página guardada
+            self._paginas_guardadas = False
+            cacheImportacion.cache_paginas.desalojar()
+
+    def __enter__(self) -> 'PaginasPDF':
+        self._abrir()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.cerrar()
+
+    @property
+    def total_paginas(self) -> int:
+        if self._total_paginas is None:
+            self._abrir()
+        return self._total_paginas
+
+    def texto(self, num_pagina: int):
+        """Texto de la página (extract_text), extraído una sola vez"""
+        if num_pagina not in self._textos:
+            with _medir_fase('extraccion'):
+                self._textos[num_pagina] = self._abrir().pages[num_pagina].extract_text()
+        return self._textos[num_pagina]
+
+    def tablas(self, num_pagina: int):
+        """Tablas de la página (extract_tables), extraídas una sola vez"""
+        if num_pagina not in self._tablas:
+            with _medir_fase('extraccion'):
+                self._tablas[num_pagina] = self._abrir().pages[num_pagina].extract_tables()
+        return self._tablas[num_pagina]
+
+    def _clave_pagina(self, num_pagina: int) -> str:
+        """
+        Clave de la página en la cache de páginas: hash de lo que determina su texto y sus
+        tablas (flujos de contenido, recursos como las fuentes, y sus cajas), sin extraerla.
+        La misma página en otro archivo, o con las demás páginas cambiadas, da la misma clave.
+        """
         import pdfplumber
-        import google.generativeai as genai
-        
-        # Extraer texto del PDF primero
-        texto_completo = ""
-        with pdfplumber.open(archivo_path) as pdf:
-            for page in pdf.pages:
-                texto_pagina = page.extract_text()
-                if texto_pagina:
-                    texto_completo += texto_pagina + "\n"
+        pagina = self._abrir().pages[num_pagina].page_obj
+        h = hashlib.sha256(repr((pagina.mediabox, pagina.cropbox, pagina.rotate)).encode('utf-8'))
+        visitados = set()
+        _agregar_a_huella(h, pagina.resources, visitados)
+        _agregar_a_huella(h, pagina.contents, visitados)
+        return cacheImportacion.cache_paginas.clave(
+            h.hexdigest(), 'pagina', pdfplumber.__version__,
+            cacheImportacion.version_codigo(os.path.abspath(__file__))
+        )
+
+    def productos(self, num_pagina: int) -> List[Dict[str, Any]]:
+        """
+        Productos de la página. Si ya se procesó una página con el mismo contenido (en una
+        importación anterior de este u otro archivo), se toman de la cache de páginas junto
+        con su texto, sin extraerla.
+        """
+        cache = cacheImportacion.cache_paginas
+        clave = None
+        if cache.habilitada:
+            try:
+                with _medir_fase('huellas'):
+                    clave = self._clave_pagina(num_pagina)
+            except Exception as e:
+                # Objetos del PDF que no se pueden recorrer: la página se procesa sin cache
+                print(f"[DEBUG] Página {num_pagina + 1}: sin huella para la cache de páginas: {str(e)}", file=sys.stderr)
+        if clave and not self.sin_cache:
+            guardada = cache.leer(clave)
+            try:
+                registros = list(guardada) if guardada is not None else []
+            except ValueError:
+                registros = []  # Entrada corrupta: se vuelve a extraer y se reemplaza
+            if registros:
+                self._textos.setdefault(num_pagina, registros[0]['texto'])
+                self.paginas_desde_cache += 1
+                print(f"[DEBUG] Página {num_pagina + 1}: tomada de la cache de páginas", file=sys.stderr)
+                return registros[0]['productos']
+
+        tablas, texto = self.tablas(num_pagina), self.texto(num_pagina)
+        with _medir_fase('parseo'):
+            productos = _productos_pagina_pdf(num_pagina, tablas, texto)
+        if clave:
+            cache.guardar(clave, [{'texto': texto, 'productos': productos}], desalojar=False)
+            self._paginas_guardadas = True
+        return productos
+
+    def precargar(self, textos: Dict[int, Any], tablas: Dict[int, Any]) -> None:
+        """Incorpora páginas ya extraídas en otro proceso"""
+        self._textos.update(textos)
+        self._tablas.update(tablas)
+
+    def texto_completo(self) -> str:
+        """Texto de todas las páginas, una por línea, como lo usan Gemini y Balance/Distribución"""
+        if self._texto_completo is None:
+            textos = (self.texto(i) for i in range(self.total_paginas))
+            self._texto_completo = ''.join(t + '\n' for t in textos if t)
+        return self._texto_completo
+
+
+def _agregar_a_huella(h, objeto: Any, visitados: set) -> None:
+    """
+    Agrega al hash un objeto de pdfminer recorriendo diccionarios, listas, flujos
+    (decodificados) y referencias; cada objeto indirecto se recorre una sola vez.
+    """
+    from pdfminer.pdftypes import PDFObjRef, PDFStream
+
+    if isinstance(objeto, PDFObjRef):
+        if objeto.objid in visitados:
+            h.update(b'<visto>')
+            return
+        visitados.add(objeto.objid)
+        objeto = objeto.resolve()
+    if isinstance(objeto, PDFStream):
+        h.update(b'<flujo>')
+        # Longitud y filtros dependen de cómo se comprimió, no del contenido
+        _agregar_a_huella(h, {k: v for k, v in objeto.attrs.items() if k not in ('Length', 'Filter', 'DecodeParms')}, visitados)
+        h.update(objeto.get_data() or b'')
+    elif isinstance(objeto, dict):
+        h.update(b'{')
+        for clave in sorted(objeto, key=str):
+            h.update(str(clave).encode('utf-8') + b':')
+            _agregar_a_huella(h, objeto[clave], visitados)
+        h.update(b'}')
+    elif isinstance(objeto, (list, tuple)):
+        h.update(b'[')
+        for valor in objeto:
+            _agregar_a_huella(h, valor, visitados)
+        h.update(b']')
+    else:
+        h.update(repr(objeto).encode('utf-8', errors='replace') + b',')
+
+
+class NombresVistos:
+    """
+    Nombres de productos ya aceptados al deduplicar (gana el primero visto): iguales sin contar
+    mayúsculas ni espacios en los extremos y, solo si hay umbral_similitud, también parecidos
+    (ver coincidenciaNombres).
+    """
+
+    def __init__(self, umbral_similitud: float = None):
+        self._exactos = set()
+        self._parecidos = coincidenciaNombres.IndiceNombres(umbral_similitud) if umbral_similitud is not None else None
+
+    def agregar(self, nombre: str) -> bool:
+        """Registra el nombre; retorna False si ya había uno igual o parecido"""
+        clave = nombre.lower().strip()
+        if clave in self._exactos or (self._parecidos is not None and self._parecidos.buscar(nombre) is not None):
+            return False
+        self._exactos.add(clave)
+        if self._parecidos is not None:
+            self._parecidos.agregar(len(self._exactos), nombre)
+        return True
+
+
+def procesar_pdf_con_gemini(archivo_path: str, api_key: str, paginas: 'PaginasPDF' = None,
+                            umbral_similitud: float = None, cliente=None,
+                            concurrencia: int = None) -> List[Dict[str, Any]]:
+    """
+    Procesa un PDF usando Gemini AI (o el cliente de modelo indicado) para extraer productos
+    con prompt estricto JSON. El texto completo se envía por fragmentos de páginas, en
+    paralelo (extraccionIA.py), y los productos se deduplican por nombre como en la
+    extracción básica.
+    """
+    try:
+        # Extraer texto del PDF primero (reutiliza el cache de páginas de procesar_pdf)
+        paginas = paginas or PaginasPDF(archivo_path)
+        with paginas:
+            texto_completo = paginas.texto_completo()
+            textos = [paginas.texto(i) for i in range(paginas.total_paginas)]
         
         if not texto_completo or len(texto_completo.strip()) < 10:
             return {'error': 'No se pudo extraer texto del PDF. El archivo podría estar escaneado o protegido.'}
         
-        # Configurar Gemini
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-pro')
-        
-        # Prompt estricto para obtener solo JSON
-        system_prompt = """Eres un asistente que extrae información de inventarios de documentos. 
-Analiza el siguiente texto de un inventario y extrae todos los productos listados.
-
-IMPORTANTE: Debes responder ÚNICAMENTE con un JSON válido, sin texto adicional, sin markdown, sin explicaciones.
-
-El formato de respuesta debe ser exactamente:
-[
-  {
-    "nombre": "Nombre del producto",
-    "codigoBarras": "código o SKU si está disponible",
-    "cantidad": número,
-    "precio": número
-  }
-]
-
-Si no encuentras información completa para algún campo, usa valores por defecto:
-- codigoBarras: "" (string vacío)
-- cantidad: 1
-- precio: 0
-
-Responde SOLO con el array JSON, sin texto adicional."""
-        
-        prompt = f"{system_prompt}\n\nTexto del documento:\n{texto_completo[:8000]}"  # Limitar a 8000 chars
+        # Gemini, o el servicio de IMPORT_IA_URL
+        cliente = cliente or extraccionIA.crear_cliente(api_key)
         
-        # Llamar a Gemini
-        response = model.generate_content(prompt)
+        print(f"[DEBUG] Extracción con IA: {len(texto_completo)} caracteres en {len(textos)} páginas", file=sys.stderr)
+        with _medir_fase('ia'):
+            productos = extraccionIA.extraer_productos(textos, cliente, concurrencia=concurrencia)
         
-        # Extraer JSON de la respuesta (puede venir con markdown code blocks)
-        respuesta_texto = response.text.strip()
-        
-        # Eliminar markdown code blocks si existen
-        if respuesta_texto.startswith('```'):
-            # Remover ```json o ``` al inicio y ``` al final
-            lineas = respuesta_texto.split('\n')
-            lineas = [l for l in lineas if not l.strip().startswith('```')]
-            respuesta_texto = '\n'.join(lineas)
-        
-        # Parsear JSON
-        try:
-            productos = json.loads(respuesta_texto)
-            
-            # Validar que sea una lista
-            if not isinstance(productos, list):
-                return {'error': 'La respuesta de la IA no es un array válido'}
-            
-            # Normalizar productos al formato esperado
-            productos_normalizados = []
+        # Normalizar productos al formato esperado; un producto al borde de dos fragmentos
+        # puede venir en ambos: gana el primero visto
+        productos_normalizados = []
+        nombres_vistos = NombresVistos(umbral_similitud)
+        with _medir_fase('deduplicacion'):
             for p in productos:
                 producto_normalizado = {
                     'nombre': limpiar_texto(p.get('nombre', '')),
@@ -458,17 +1333,18 @@ Responde SOLO con el array JSON, sin texto adicional."""
                     'costoBase': parsear_numero(p.get('precio', 0))  # Mapear precio a costoBase
                 }
                 
-                if producto_normalizado['nombre']:
+                nombre = producto_normalizado['nombre']
+                if nombre and nombres_vistos.agregar(nombre):
                     productos_normalizados.append(producto_normalizado)
-            
-            if not productos_normalizados:
-                return {'error': 'No se encontraron productos válidos en el documento'}
-            
-            return productos_normalizados
-            
-        except json.JSONDecodeError as e:
-            return {'error': f'Error al parsear respuesta de la IA como JSON: {str(e)}. Respuesta recibida: {respuesta_texto[:200]}'}
+        print(f"[DEBUG] Productos de la IA: {len(productos)}; únicos: {len(productos_normalizados)}", file=sys.stderr)
+        
+        if not productos_normalizados:
+            return {'error': 'No se encontraron productos válidos en el documento'}
         
+        return productos_normalizados
+        
+    except extraccionIA.ErrorModelo as e:
+        return {'error': f'Error en la extracción con IA: {str(e)}'}
     except ImportError as e:
         if 'google.generativeai' in str(e):
             return {'error': 'Librería google-generativeai no instalada. Instala con: pip install google-generativeai'}
@@ -476,271 +1352,349 @@ Responde SOLO con el array JSON, sin texto adicional."""
     except Exception as e:
         return {'error': f'Error procesando PDF con Gemini: {str(e)}'}
 
-def procesar_pdf(archivo_path: str, api_key: str = None) -> List[Dict[str, Any]]:
+def _productos_pagina_pdf(page_num: int, tablas, texto) -> List[Dict[str, Any]]:
+    """
+    Extrae los productos de una página del PDF a partir de sus tablas y su texto
+    (estrategias 1 y 2 de procesar_pdf). No depende de otras páginas, por lo que
+    puede ejecutarse en cualquier proceso.
+    """
+    productos = []
+    print(f"[DEBUG] Procesando página {page_num + 1}", file=sys.stderr)
+    productos_encontrados_texto = 0  # Inicializar contador para esta página ANTES de cualquier uso
+    # ESTRATEGIA 1: Intentar extraer tablas
+    print(f"[DEBUG] Página {page_num + 1}: {len(tablas) if tablas else 0} tablas encontradas", file=sys.stderr)
+
+    if tablas:
+        for tabla in tablas:
+            if not tabla or len(tabla) < 2: continue
+
+            header = [str(c).lower().strip() if c else '' for c in tabla[0]]
+
+            # Buscar índices de columnas - ENFOQUE: Nombre, Cantidad, Costo, Total, Código
+            idx_nombre = -1
+            idx_costo = -1
+            idx_cantidad = -1
+            idx_total = -1
+            idx_codigo = -1
+
+            for i, col in enumerate(header):
+                col_lower = col.lower()
+                # Prioridad 1: Nombre del producto
+                if 'nombre' in col_lower or 'descrip' in col_lower or 'articulo' in col_lower or 'producto' in col_lower or 'item' in col_lower:
+                    if idx_nombre == -1:  # Tomar el primero que encuentre
+                        idx_nombre = i
+                # Prioridad 2: Código/Barcode
+                elif 'codigo' in col_lower or 'código' in col_lower or 'barcode' in col_lower or 'sku' in col_lower or 'ref' in col_lower:
+                    if idx_codigo == -1:
+                        idx_codigo = i
+                # Prioridad 3: Cantidad
+                elif 'cantidad' in col_lower or 'cant' in col_lower or 'qty' in col_lower or 'unidad' in col_lower:
+                    if idx_cantidad == -1:
+                        idx_cantidad = i
+                # Prioridad 4: Costo/Precio unitario
+                elif ('costo' in col_lower or 'precio' in col_lower or 'valor unitario' in col_lower) and 'total' not in col_lower:
+                    if idx_costo == -1:
+                        idx_costo = i
+                # Prioridad 5: Total (si existe, puede ayudar a calcular cantidad o costo)
+                elif 'total' in col_lower and ('costo' not in col_lower and 'precio' not in col_lower):
+                    if idx_total == -1:
+                        idx_total = i
+
+            # Determinar inicio de datos (saltar header)
+            start_idx = 1 if (idx_nombre != -1 or idx_costo != -1) else 0
+            filas_datos = tabla[start_idx:]
+
+            # Convertir cada columna de la tabla de una vez (formato detectado por columna)
+            ancho = max((len(fila) for fila in filas_datos if fila), default=0)
+            columnas_numericas = [
+                parsear_columna_numerica([fila[i] if fila and len(fila) > i else None for fila in filas_datos])
+                for i in range(ancho)
+            ]
+
+            for n_fila, fila in enumerate(filas_datos):
+                if not fila: continue
+                numeros = [columnas_numericas[i][n_fila] for i in range(len(fila))]
+
+                p_nombre = ""
+                p_precio = 0
+                p_cantidad = 1
+                p_codigo = None
+
+                # Extraer nombre (OBLIGATORIO)
+                if idx_nombre != -1 and len(fila) > idx_nombre:
+                    p_nombre = limpiar_texto(fila[idx_nombre])
+                elif len(fila) >= 2:
+                    p_nombre = limpiar_texto(fila[1])
+                elif len(fila) >= 1:
+                    p_nombre = limpiar_texto(fila[0])
+
+                # Filtrar filas vacías o que sean headers
+                if not p_nombre or len(p_nombre) < 2:
+                    continue
+
+                # Filtrar si parece ser un header repetido
+                headers_comunes = ['nombre', 'descripcion', 'articulo', 'producto', 'item', 'codigo', 'cantidad', 'costo', 'precio', 'total', 'subtotal']
+                if p_nombre.lower().strip() in headers_comunes:
+                    continue
+
+                # Extraer Código (si column detected)
+                if idx_codigo != -1 and len(fila) > idx_codigo:
+                    raw_code = limpiar_texto(fila[idx_codigo])
+                    if raw_code and len(raw_code) > 1 and raw_code.lower() not in ['none', 'null', 'nan']:
+                        p_codigo = raw_code
+
+                # Extraer cantidad (PRIORIDAD ALTA)
+                p_cantidad = 1  # Valor por defecto
+                if idx_cantidad != -1 and len(fila) > idx_cantidad:
+                    p_cantidad = int(numeros[idx_cantidad]) or 1
+                else:
+                    # Buscar cantidad en las primeras columnas numéricas
+                    for i in range(min(3, len(fila))):
+                        val = numeros[i]
+                        if val > 0 and val <= 100000:  # Cantidad razonable
+                            p_cantidad = int(val)
+                            break
+
+                # Extraer costo unitario (PRIORIDAD ALTA)
+                p_costo = 0
+                if idx_costo != -1 and len(fila) > idx_costo:
+                    p_costo = numeros[idx_costo]
+                else:
+                    # Buscar costo en columnas numéricas (no total)
+                    for i in range(len(fila)):
+                        if i == idx_total:  # Saltar columna de total
+                            continue
+                        val = numeros[i]
+                        if val > 0 and val < 1000000:  # Costo razonable
+                            p_costo = val
+                            break
+
+                # Si tenemos total pero no costo, calcular costo = total / cantidad
+                if idx_total != -1 and len(fila) > idx_total and p_costo == 0 and p_cantidad > 0:
+                    total_val = numeros[idx_total]
+                    if total_val > 0:
+                        p_costo = total_val / p_cantidad
+
+                # Si tenemos total pero no cantidad, calcular cantidad = total / costo
+                if idx_total != -1 and len(fila) > idx_total and p_cantidad == 1 and p_costo > 0:
+                    total_val = numeros[idx_total]
+                    if total_val > 0:
+                        p_cantidad = int(total_val / p_costo) or 1
+
+                # Validar que tengamos al menos nombre y costo
+                if p_costo <= 0:
+                    # Intentar una última vez buscar cualquier número como costo
+                    for val in reversed(numeros):
+                        if val > 0 and val < 1000000:
+                            p_costo = val
+                            break
+
+                # Solo agregar si tenemos nombre válido
+                if len(p_nombre) >= 2:
+                    productos.append({
+                        'nombre': p_nombre,
+                        'codigoBarras': p_codigo,
+                        'cantidad': p_cantidad,
+                        'precio': p_costo,  # Costo unitario
+                        'categoria': 'General',
+                        'unidad': 'unidad',
+                        'costoBase': p_costo
+                    })
+                    print(f"[DEBUG] Producto agregado desde tabla: {p_nombre[:30]}... (cod: {p_codigo}, costo: {p_costo})", file=sys.stderr)
+
+    # ESTRATEGIA 2: Extraer de texto (formato "Reporte de inventario" o genérico)
+    if texto:
+        lineas = texto.split('\n')
+        print(f"[DEBUG] Página {page_num + 1}: texto {len(texto)} caracteres, {len(lineas)} líneas", file=sys.stderr)
+        # 2a) Formato reporte inventario: "ARTICULO ... CANTIDAD COSTO RD$ TOTAL"
+        productos_reporte = _extraer_productos_desde_lineas_texto(lineas)
+        if productos_reporte:
+            productos.extend(productos_reporte)
+            productos_encontrados_texto += len(productos_reporte)
+            print(f"[DEBUG] Página {page_num + 1}: {len(productos_reporte)} productos desde formato reporte (RD$)", file=sys.stderr)
+        # 2b) Si no hubo productos con formato reporte, intentar patrón genérico (líneas con texto + números)
+        if not productos_reporte:
+            for linea in lineas:
+                linea_limpia = linea.strip()
+                if not linea_limpia or len(linea_limpia) < 3:
+                    continue
+
+                # Filtrar headers comunes
+                if linea_limpia.lower() in ['nombre', 'descripcion', 'articulo', 'producto', 'item', 'cantidad', 'costo', 'precio', 'total', 'subtotal']:
+                    continue
+
+                # Patrón mejorado: "Nombre Cantidad Costo" o "Nombre Costo" o "Nombre Cantidad Costo Total"
+                # Buscar múltiples números en la línea
+                numeros = re.findall(r'[\$]?\s*(\d+[\.,]?\d*)', linea_limpia)
+
+                if len(numeros) >= 1:
+                    # Separar nombre y números
+                    # El nombre suele estar al inicio, antes del primer número
+                    primer_numero_pos = linea_limpia.find(numeros[0])
+                    nombre_match = linea_limpia[:primer_numero_pos].strip()
+
+                    # Limpiar nombre de caracteres especiales al final
+                    nombre_match = re.sub(r'[:\|\-\s]+$', '', nombre_match).strip()
+
+                    if len(nombre_match) >= 3:
+                        # Convertir números encontrados
+                        numeros_float = []
+                        for num_str in numeros:
+                            try:
+                                num_val = float(num_str.replace(',', '.'))
+                                if num_val > 0:
+                                    numeros_float.append(num_val)
+                            except:
+                                continue
+
+                        if numeros_float:
+                            cantidad = 1
+                            costo = 0
+
+                            if len(numeros_float) == 1:
+                                # Solo un número: asumir que es el costo
+                                costo = numeros_float[0]
+                            elif len(numeros_float) == 2:
+                                # Dos números: cantidad y costo
+                                cantidad = int(numeros_float[0]) if numeros_float[0] <= 100000 else 1
+                                costo = numeros_float[1]
+                            elif len(numeros_float) >= 3:
+                                # Tres o más números: cantidad, costo, total
+                                cantidad = int(numeros_float[0]) if numeros_float[0] <= 100000 else 1
+                                costo = numeros_float[1]
+                                # El tercer número podría ser total (verificar si coincide con cantidad * costo)
+
+                            # Validar costo razonable - PERMITIR productos sin costo también
+                            # Agregar producto si tiene nombre válido, incluso sin costo
+                            if len(nombre_match) >= 3:
+                                if costo >= 0 and costo < 1000000:
+                                    productos.append({
+                                        'nombre': nombre_match,
+                                        'codigoBarras': None,
+                                        'cantidad': cantidad,
+                                        'precio': costo if costo > 0 else 0,
+                                        'categoria': 'General',
+                                        'costoBase': costo if costo > 0 else 0
+                                    })
+                                    productos_encontrados_texto += 1
+                                    if costo > 0:
+                                        print(f"[DEBUG] Producto agregado desde texto: {nombre_match[:30]}... (cantidad: {cantidad}, costo: {costo})", file=sys.stderr)
+                                    else:
+                                        print(f"[DEBUG] Producto sin costo agregado desde texto: {nombre_match[:30]}... (cantidad: {cantidad})", file=sys.stderr)
+                                else:
+                                    # Agregar producto sin costo si el costo no es válido
+                                    productos.append({
+                                        'nombre': nombre_match,
+                                        'codigoBarras': None,
+                                        'cantidad': cantidad,
+                                        'precio': 0,
+                                        'categoria': 'General',
+                                        'costoBase': 0
+                                    })
+                                    productos_encontrados_texto += 1
+                                    print(f"[DEBUG] Producto sin costo agregado desde texto (costo inválido): {nombre_match[:30]}... (cantidad: {cantidad})", file=sys.stderr)
+        # Mostrar resumen de productos encontrados en texto para esta página (fuera del bloque if texto:)
+        if productos_encontrados_texto > 0:
+            print(f"[DEBUG] Página {page_num + 1}: {productos_encontrados_texto} productos encontrados desde texto", file=sys.stderr)
+        else:
+            print(f"[DEBUG] Página {page_num + 1}: No se encontraron productos en texto", file=sys.stderr)
+    return productos
+
+
+def _procesar_rango_pdf(archivo_path: str, inicio: int, fin: int, sin_cache: bool = False):
+    """
+    Procesa las páginas [inicio, fin) del PDF. Se ejecuta dentro de los procesos del pool:
+    cada worker abre su propio manejador del archivo. Retorna (productos, textos, tablas,
+    páginas tomadas de la cache) para que el proceso principal complete su cache de
+    páginas sin volver a leerlas (las tablas solo de las páginas extraídas).
+    """
+    productos = []
+    with PaginasPDF(archivo_path, sin_cache) as paginas:
+        for page_num in range(inicio, fin):
+            productos.extend(paginas.productos(page_num))
+    return productos, paginas._textos, paginas._tablas, paginas.paginas_desde_cache
+
+
+def procesar_pdf(archivo_path: str, api_key: str = None, procesos: int = 1,
+                 umbral_similitud: float = None, sin_cache: bool = False) -> List[Dict[str, Any]]:
     """
     Procesamiento de PDF: Si hay API key, usa Gemini. Si no, usa extracción básica con pdfplumber.
+    Con procesos > 1 los rangos de páginas se procesan en paralelo en un pool de procesos.
+    Los productos con el mismo nombre o, si se indica umbral_similitud, con nombres parecidos
+    (similitud >= umbral_similitud) se cuentan una vez.
+    Las páginas sin cambios desde una importación anterior salen de la cache de páginas;
+    sin_cache las vuelve a extraer todas.
     """
+    # Texto y tablas de cada página se extraen una sola vez y se comparten entre estrategias
+    paginas = PaginasPDF(archivo_path, sin_cache)
+
     # Si hay API key, usar Gemini
     if api_key and api_key.strip():
-        resultado = procesar_pdf_con_gemini(archivo_path, api_key.strip())
+        resultado = procesar_pdf_con_gemini(archivo_path, api_key.strip(), paginas, umbral_similitud)
         if isinstance(resultado, list):
             return resultado
-        # Si falló Gemini, intentar método básico como fallback
-        if 'error' in resultado:
-            pass  # Continuar con método básico
-    
-    # Método básico con pdfplumber (fallback o cuando no hay API key)
+        # Si falló Gemini (p. ej. un 503 o un tiempo agotado), método básico como fallback.
+        # 'errorIA' marca el resultado degradado: no se guarda en la cache de resultados,
+        # cuya clave es la de la extracción con IA, así la próxima subida vuelve a intentarla
+        print(f"[DEBUG] Extracción con IA fallida, usando método básico: {resultado.get('error')}", file=sys.stderr)
+        resultado = _procesar_pdf_basico(archivo_path, paginas, procesos, umbral_similitud)
+        if isinstance(resultado, list):
+            resultado = {'productos': resultado}
+        resultado['errorIA'] = True
+        return resultado
+
+    return _procesar_pdf_basico(archivo_path, paginas, procesos, umbral_similitud)
+
+
+def _procesar_pdf_basico(archivo_path: str, paginas: 'PaginasPDF', procesos: int,
+                         umbral_similitud: float = None) -> Any:
+    """Método básico con pdfplumber (fallback o cuando no hay API key); ver procesar_pdf"""
+    # PaginasPDF importa pdfplumber al abrir el archivo; aquí solo se verifica que esté instalado
+    if importlib.util.find_spec('pdfplumber') is None:
+        return {'error': 'Librería pdfplumber no instalada en el servidor'}
     try:
-        import pdfplumber
-        import re
         productos = []
         
         print(f"[DEBUG] Iniciando procesamiento PDF básico: {archivo_path}", file=sys.stderr)
-        with pdfplumber.open(archivo_path) as pdf:
-            print(f"[DEBUG] PDF abierto. Total de páginas: {len(pdf.pages)}", file=sys.stderr)
-            for page_num, page in enumerate(pdf.pages):
-                print(f"[DEBUG] Procesando página {page_num + 1}", file=sys.stderr)
-                productos_encontrados_texto = 0  # Inicializar contador para esta página ANTES de cualquier uso
-                # ESTRATEGIA 1: Intentar extraer tablas
-                tablas = page.extract_tables()
-                print(f"[DEBUG] Página {page_num + 1}: {len(tablas) if tablas else 0} tablas encontradas", file=sys.stderr)
-                
-                if tablas:
-                    for tabla in tablas:
-                        if not tabla or len(tabla) < 2: continue
-                        
-                        header = [str(c).lower().strip() if c else '' for c in tabla[0]]
-                        
-                        # Buscar índices de columnas - ENFOQUE: Nombre, Cantidad, Costo, Total, Código
-                        idx_nombre = -1
-                        idx_costo = -1
-                        idx_cantidad = -1
-                        idx_total = -1
-                        idx_codigo = -1
-                        
-                        for i, col in enumerate(header):
-                            col_lower = col.lower()
-                            # Prioridad 1: Nombre del producto
-                            if 'nombre' in col_lower or 'descrip' in col_lower or 'articulo' in col_lower or 'producto' in col_lower or 'item' in col_lower:
-                                if idx_nombre == -1:  # Tomar el primero que encuentre
-                                    idx_nombre = i
-                            # Prioridad 2: Código/Barcode
-                            elif 'codigo' in col_lower or 'código' in col_lower or 'barcode' in col_lower or 'sku' in col_lower or 'ref' in col_lower:
-                                if idx_codigo == -1:
-                                    idx_codigo = i
-                            # Prioridad 3: Cantidad
-                            elif 'cantidad' in col_lower or 'cant' in col_lower or 'qty' in col_lower or 'unidad' in col_lower:
-                                if idx_cantidad == -1:
-                                    idx_cantidad = i
-                            # Prioridad 4: Costo/Precio unitario
-                            elif ('costo' in col_lower or 'precio' in col_lower or 'valor unitario' in col_lower) and 'total' not in col_lower:
-                                if idx_costo == -1:
-                                    idx_costo = i
-                            # Prioridad 5: Total (si existe, puede ayudar a calcular cantidad o costo)
-                            elif 'total' in col_lower and ('costo' not in col_lower and 'precio' not in col_lower):
-                                if idx_total == -1:
-                                    idx_total = i
-                        
-                        # Determinar inicio de datos (saltar header)
-                        start_idx = 1 if (idx_nombre != -1 or idx_costo != -1) else 0
-                        
-                        for fila in tabla[start_idx:]:
-                            if not fila: continue
-                            
-                            p_nombre = ""
-                            p_precio = 0
-                            p_cantidad = 1
-                            p_codigo = None
-                            
-                            # Extraer nombre (OBLIGATORIO)
-                            if idx_nombre != -1 and len(fila) > idx_nombre:
-                                p_nombre = limpiar_texto(fila[idx_nombre])
-                            elif len(fila) >= 2:
-                                p_nombre = limpiar_texto(fila[1])
-                            elif len(fila) >= 1:
-                                p_nombre = limpiar_texto(fila[0])
-                            
-                            # Filtrar filas vacías o que sean headers
-                            if not p_nombre or len(p_nombre) < 2:
-                                continue
-                            
-                            # Filtrar si parece ser un header repetido
-                            headers_comunes = ['nombre', 'descripcion', 'articulo', 'producto', 'item', 'codigo', 'cantidad', 'costo', 'precio', 'total', 'subtotal']
-                            if p_nombre.lower().strip() in headers_comunes:
-                                continue
+        with paginas:
+            total_paginas = paginas.total_paginas
+        print(f"[DEBUG] PDF abierto. Total de páginas: {total_paginas}", file=sys.stderr)
+        procesos = max(1, min(int(procesos or 1), total_paginas))
+        if procesos > 1:
+            # Rangos contiguos de páginas; map conserva el orden, así la deduplicación
+            # (primer nombre visto gana) da el mismo resultado que el recorrido secuencial
+            tamano = -(-total_paginas // procesos)
+            rangos = [(inicio, min(inicio + tamano, total_paginas)) for inicio in range(0, total_paginas, tamano)]
+            print(f"[DEBUG] Procesando {len(rangos)} rangos de páginas en paralelo ({procesos} procesos)", file=sys.stderr)
+            pool = _obtener_pool(procesos)
+            with _medir_fase('paginas_paralelo'):
+                resultados = pool.map(
+                    _procesar_rango_pdf,
+                    [archivo_path] * len(rangos),
+                    [inicio for inicio, _ in rangos],
+                    [fin for _, fin in rangos],
+                    [paginas.sin_cache] * len(rangos)
+                )
+                for productos_rango, textos_rango, tablas_rango, desde_cache in resultados:
+                    productos.extend(productos_rango)
+                    paginas.precargar(textos_rango, tablas_rango)
+                    paginas.paginas_desde_cache += desde_cache
+        else:
+            with paginas:
+                for page_num in range(total_paginas):
+                    productos.extend(paginas.productos(page_num))
+        if paginas.paginas_desde_cache:
+            print(f"[DEBUG] Páginas tomadas de la cache de páginas: {paginas.paginas_desde_cache} de {total_paginas}", file=sys.stderr)
 
-                            # Extraer Código (si column detected)
-                            if idx_codigo != -1 and len(fila) > idx_codigo:
-                                raw_code = limpiar_texto(fila[idx_codigo])
-                                if raw_code and len(raw_code) > 1 and raw_code.lower() not in ['none', 'null', 'nan']:
-                                    p_codigo = raw_code
-
-                            # Extraer cantidad (PRIORIDAD ALTA)
-                            p_cantidad = 1  # Valor por defecto
-                            if idx_cantidad != -1 and len(fila) > idx_cantidad:
-                                p_cantidad = int(parsear_numero(fila[idx_cantidad])) or 1
-                            else:
-                                # Buscar cantidad en las primeras columnas numéricas
-                                for i in range(min(3, len(fila))):
-                                    val = parsear_numero(fila[i])
-                                    if val > 0 and val <= 100000:  # Cantidad razonable
-                                        p_cantidad = int(val)
-                                        break
-
-                            # Extraer costo unitario (PRIORIDAD ALTA)
-                            p_costo = 0
-                            if idx_costo != -1 and len(fila) > idx_costo:
-                                p_costo = parsear_numero(fila[idx_costo])
-                            else:
-                                # Buscar costo en columnas numéricas (no total)
-                                for i in range(len(fila)):
-                                    if i == idx_total:  # Saltar columna de total
-                                        continue
-                                    val = parsear_numero(fila[i])
-                                    if val > 0 and val < 1000000:  # Costo razonable
-                                        p_costo = val
-                                        break
-                            
-                            # Si tenemos total pero no costo, calcular costo = total / cantidad
-                            if idx_total != -1 and len(fila) > idx_total and p_costo == 0 and p_cantidad > 0:
-                                total_val = parsear_numero(fila[idx_total])
-                                if total_val > 0:
-                                    p_costo = total_val / p_cantidad
-                            
-                            # Si tenemos total pero no cantidad, calcular cantidad = total / costo
-                            if idx_total != -1 and len(fila) > idx_total and p_cantidad == 1 and p_costo > 0:
-                                total_val = parsear_numero(fila[idx_total])
-                                if total_val > 0:
-                                    p_cantidad = int(total_val / p_costo) or 1
-
-                            # Validar que tengamos al menos nombre y costo
-                            if p_costo <= 0:
-                                # Intentar una última vez buscar cualquier número como costo
-                                for cell in reversed(fila):
-                                    val = parsear_numero(cell)
-                                    if val > 0 and val < 1000000:
-                                        p_costo = val
-                                        break
-                            
-                            # Solo agregar si tenemos nombre válido
-                            if len(p_nombre) >= 2:
-                                productos.append({
-                                    'nombre': p_nombre,
-                                    'codigoBarras': p_codigo,
-                                    'cantidad': p_cantidad,
-                                    'precio': p_costo,  # Costo unitario
-                                    'categoria': 'General',
-                                    'unidad': 'unidad',
-                                    'costoBase': p_costo
-                                })
-                                print(f"[DEBUG] Producto agregado desde tabla: {p_nombre[:30]}... (cod: {p_codigo}, costo: {p_costo})", file=sys.stderr)
-                
-                # ESTRATEGIA 2: Extraer de texto (formato "Reporte de inventario" o genérico)
-                texto = page.extract_text()
-                if texto:
-                    lineas = texto.split('\n')
-                    print(f"[DEBUG] Página {page_num + 1}: texto {len(texto)} caracteres, {len(lineas)} líneas", file=sys.stderr)
-                    # 2a) Formato reporte inventario: "ARTICULO ... CANTIDAD COSTO RD$ TOTAL"
-                    productos_reporte = _extraer_productos_desde_lineas_texto(lineas)
-                    if productos_reporte:
-                        productos.extend(productos_reporte)
-                        productos_encontrados_texto += len(productos_reporte)
-                        print(f"[DEBUG] Página {page_num + 1}: {len(productos_reporte)} productos desde formato reporte (RD$)", file=sys.stderr)
-                    # 2b) Si no hubo productos con formato reporte, intentar patrón genérico (líneas con texto + números)
-                    if not productos_reporte:
-                        for linea in lineas:
-                            linea_limpia = linea.strip()
-                            if not linea_limpia or len(linea_limpia) < 3:
-                                continue
-                            
-                            # Filtrar headers comunes
-                            if linea_limpia.lower() in ['nombre', 'descripcion', 'articulo', 'producto', 'item', 'cantidad', 'costo', 'precio', 'total', 'subtotal']:
-                                continue
-                            
-                            # Patrón mejorado: "Nombre Cantidad Costo" o "Nombre Costo" o "Nombre Cantidad Costo Total"
-                            # Buscar múltiples números en la línea
-                            numeros = re.findall(r'[\$]?\s*(\d+[\.,]?\d*)', linea_limpia)
-                            
-                            if len(numeros) >= 1:
-                                # Separar nombre y números
-                                # El nombre suele estar al inicio, antes del primer número
-                                primer_numero_pos = linea_limpia.find(numeros[0])
-                                nombre_match = linea_limpia[:primer_numero_pos].strip()
-                                
-                                # Limpiar nombre de caracteres especiales al final
-                                nombre_match = re.sub(r'[:\|\-\s]+$', '', nombre_match).strip()
-                                
-                                if len(nombre_match) >= 3:
-                                    # Convertir números encontrados
-                                    numeros_float = []
-                                    for num_str in numeros:
-                                        try:
-                                            num_val = float(num_str.replace(',', '.'))
-                                            if num_val > 0:
-                                                numeros_float.append(num_val)
-                                        except:
-                                            continue
-                                    
-                                    if numeros_float:
-                                        cantidad = 1
-                                        costo = 0
-                                        
-                                        if len(numeros_float) == 1:
-                                            # Solo un número: asumir que es el costo
-                                            costo = numeros_float[0]
-                                        elif len(numeros_float) == 2:
-                                            # Dos números: cantidad y costo
-                                            cantidad = int(numeros_float[0]) if numeros_float[0] <= 100000 else 1
-                                            costo = numeros_float[1]
-                                        elif len(numeros_float) >= 3:
-                                            # Tres o más números: cantidad, costo, total
-                                            cantidad = int(numeros_float[0]) if numeros_float[0] <= 100000 else 1
-                                            costo = numeros_float[1]
-                                            # El tercer número podría ser total (verificar si coincide con cantidad * costo)
-                                        
-                                        # Validar costo razonable - PERMITIR productos sin costo también
-                                        # Agregar producto si tiene nombre válido, incluso sin costo
-                                        if len(nombre_match) >= 3:
-                                            if costo >= 0 and costo < 1000000:
-                                                productos.append({
-                                                    'nombre': nombre_match,
-                                                    'codigoBarras': None,
-                                                    'cantidad': cantidad,
-                                                    'precio': costo if costo > 0 else 0,
-                                                    'categoria': 'General',
-                                                    'costoBase': costo if costo > 0 else 0
-                                                })
-                                                productos_encontrados_texto += 1
-                                                if costo > 0:
-                                                    print(f"[DEBUG] Producto agregado desde texto: {nombre_match[:30]}... (cantidad: {cantidad}, costo: {costo})", file=sys.stderr)
-                                                else:
-                                                    print(f"[DEBUG] Producto sin costo agregado desde texto: {nombre_match[:30]}... (cantidad: {cantidad})", file=sys.stderr)
-                                            else:
-                                                # Agregar producto sin costo si el costo no es válido
-                                                productos.append({
-                                                    'nombre': nombre_match,
-                                                    'codigoBarras': None,
-                                                    'cantidad': cantidad,
-                                                    'precio': 0,
-                                                    'categoria': 'General',
-                                                    'costoBase': 0
-                                                })
-                                                productos_encontrados_texto += 1
-                                                print(f"[DEBUG] Producto sin costo agregado desde texto (costo inválido): {nombre_match[:30]}... (cantidad: {cantidad})", file=sys.stderr)
-                    # Mostrar resumen de productos encontrados en texto para esta página (fuera del bloque if texto:)
-                    if productos_encontrados_texto > 0:
-                        print(f"[DEBUG] Página {page_num + 1}: {productos_encontrados_texto} productos encontrados desde texto", file=sys.stderr)
-                    else:
-                        print(f"[DEBUG] Página {page_num + 1}: No se encontraron productos en texto", file=sys.stderr)
-
-        # Filtrar productos duplicados por nombre
+        # Filtrar productos duplicados por nombre (con umbral de similitud, "ACEITE EL GALLEGO
+        # DE SOBRE" y "Aceite El Gallego Sobre" son el mismo): gana el primero visto
         productos_unicos = []
-        nombres_vistos = set()
-        for producto in productos:
-            nombre_normalizado = producto['nombre'].lower().strip()
-            if nombre_normalizado and nombre_normalizado not in nombres_vistos:
-                nombres_vistos.add(nombre_normalizado)
-                productos_unicos.append(producto)
+        nombres_vistos = NombresVistos(umbral_similitud)
+        with _medir_fase('deduplicacion'):
+            for producto in productos:
+                nombre = producto['nombre'].strip()
+                if nombre and nombres_vistos.agregar(nombre):
+                    productos_unicos.append(producto)
 
         print(f"[DEBUG] Total productos antes de deduplicar: {len(productos)}", file=sys.stderr)
         print(f"[DEBUG] Total productos únicos después de deduplicar: {len(productos_unicos)}", file=sys.stderr)
@@ -751,14 +1705,11 @@ def procesar_pdf(archivo_path: str, api_key: str = None) -> List[Dict[str, Any]]
             # Antes de devolver error, intentar al menos extraer Balance General y Distribución de Saldo (PDF puede ser solo financiero)
             texto_completo_early = ''
             try:
-                with pdfplumber.open(archivo_path) as pdf:
-                    for page in pdf.pages:
-                        t = page.extract_text()
-                        if t:
-                            texto_completo_early += t + '\n'
+                texto_completo_early = paginas.texto_completo()
             except Exception:
                 pass
-            datos_fin_early = _extraer_balance_y_distribucion(texto_completo_early) if texto_completo_early else {}
+            with _medir_fase('balance'):
+                datos_fin_early = _extraer_balance_y_distribucion(texto_completo_early) if texto_completo_early else {}
             if datos_fin_early:
                 print("[DEBUG] No hay productos pero se extrajeron Balance/Distribución; devolviendo solo datos financieros", file=sys.stderr)
                 return {
@@ -770,52 +1721,49 @@ def procesar_pdf(archivo_path: str, api_key: str = None) -> List[Dict[str, Any]]
             print("[DEBUG] Intentando estrategia alternativa: buscar cualquier línea con texto y números", file=sys.stderr)
             # Última estrategia: buscar cualquier línea que tenga texto seguido de números
             try:
-                with pdfplumber.open(archivo_path) as pdf:
-                    for page_num, page in enumerate(pdf.pages):
-                        texto = page.extract_text()
-                        if texto:
-                            lineas = texto.split('\n')
-                            for linea in lineas:
-                                linea_limpia = linea.strip()
-                                if len(linea_limpia) < 5:
-                                    continue
-                                # Buscar líneas con al menos 3 palabras y un número
-                                palabras = linea_limpia.split()
-                                if len(palabras) >= 2:
-                                    # Buscar si hay algún número en la línea
-                                    tiene_numero = any(re.search(r'\d', p) for p in palabras)
-                                    if tiene_numero:
-                                        # Intentar extraer nombre (primeras palabras) y número (último o cualquier número en la línea)
-                                        nombre_candidato = ' '.join(palabras[:-1])[:50]  # Primeras palabras como nombre
-                                        # Buscar números en todas las palabras, no solo la última
-                                        numeros_en_linea = []
-                                        for palabra in palabras:
-                                            val = parsear_numero(palabra)
-                                            if val > 0:
-                                                numeros_en_linea.append(val)
-                                        
-                                        if len(nombre_candidato) >= 3:
-                                            # Si hay números, usar el último como costo
-                                            # Si no hay números, agregar el producto sin costo
-                                            ultimo_valor = numeros_en_linea[-1] if numeros_en_linea else 0
-                                            cantidad_alt = int(numeros_en_linea[0]) if len(numeros_en_linea) > 1 and numeros_en_linea[0] <= 100000 else 1
-                                            
-                                            # Verificar que no sea un duplicado
-                                            nombre_normalizado_alt = nombre_candidato.lower().strip()
-                                            if nombre_normalizado_alt not in nombres_vistos:
-                                                nombres_vistos.add(nombre_normalizado_alt)
-                                                productos_unicos.append({
-                                                    'nombre': nombre_candidato,
-                                                    'codigoBarras': None,
-                                                    'cantidad': cantidad_alt,
-                                                    'precio': ultimo_valor,
-                                                    'categoria': 'General',
-                                                    'costoBase': ultimo_valor
-                                                })
-                                                if ultimo_valor > 0:
-                                                    print(f"[DEBUG] Producto encontrado con estrategia alternativa: {nombre_candidato[:30]}... (cantidad: {cantidad_alt}, costo: {ultimo_valor})", file=sys.stderr)
-                                                else:
-                                                    print(f"[DEBUG] Producto sin costo encontrado con estrategia alternativa: {nombre_candidato[:30]}... (cantidad: {cantidad_alt})", file=sys.stderr)
+                for page_num in range(paginas.total_paginas):
+                    texto = paginas.texto(page_num)
+                    if texto:
+                        lineas = texto.split('\n')
+                        for linea in lineas:
+                            linea_limpia = linea.strip()
+                            if len(linea_limpia) < 5:
+                                continue
+                            # Buscar líneas con al menos 3 palabras y un número
+                            palabras = linea_limpia.split()
+                            if len(palabras) >= 2:
+                                # Buscar si hay algún número en la línea
+                                tiene_numero = any(re.search(r'\d', p) for p in palabras)
+                                if tiene_numero:
+                                    # Intentar extraer nombre (primeras palabras) y número (último o cualquier número en la línea)
+                                    nombre_candidato = ' '.join(palabras[:-1])[:50]  # Primeras palabras como nombre
+                                    # Buscar números en todas las palabras, no solo la última
+                                    numeros_en_linea = []
+                                    for palabra in palabras:
+                                        val = parsear_numero(palabra)
+                                        if val > 0:
+                                            numeros_en_linea.append(val)
+
+                                    if len(nombre_candidato) >= 3:
+                                        # Si hay números, usar el último como costo
+                                        # Si no hay números, agregar el producto sin costo
+                                        ultimo_valor = numeros_en_linea[-1] if numeros_en_linea else 0
+                                        cantidad_alt = int(numeros_en_linea[0]) if len(numeros_en_linea) > 1 and numeros_en_linea[0] <= 100000 else 1
+
+                                        # Verificar que no sea un duplicado
+                                        if nombres_vistos.agregar(nombre_candidato):
+                                            productos_unicos.append({
+                                                'nombre': nombre_candidato,
+                                                'codigoBarras': None,
+                                                'cantidad': cantidad_alt,
+                                                'precio': ultimo_valor,
+                                                'categoria': 'General',
+                                                'costoBase': ultimo_valor
+                                            })
+                                            if ultimo_valor > 0:
+                                                print(f"[DEBUG] Producto encontrado con estrategia alternativa: {nombre_candidato[:30]}... (cantidad: {cantidad_alt}, costo: {ultimo_valor})", file=sys.stderr)
+                                            else:
+                                                print(f"[DEBUG] Producto sin costo encontrado con estrategia alternativa: {nombre_candidato[:30]}... (cantidad: {cantidad_alt})", file=sys.stderr)
             except Exception as e:
                 print(f"[DEBUG] Error en estrategia alternativa: {str(e)}", file=sys.stderr)
         
@@ -823,14 +1771,13 @@ def procesar_pdf(archivo_path: str, api_key: str = None) -> List[Dict[str, Any]]
             print("[DEBUG] ERROR FINAL: No se encontraron productos válidos con ninguna estrategia", file=sys.stderr)
             print("[DEBUG] Información del PDF:", file=sys.stderr)
             try:
-                with pdfplumber.open(archivo_path) as pdf:
-                    print(f"[DEBUG] - Total páginas: {len(pdf.pages)}", file=sys.stderr)
-                    for i, page in enumerate(pdf.pages[:3]):  # Solo primeras 3 páginas
-                        texto = page.extract_text()
-                        if texto:
-                            print(f"[DEBUG] - Página {i+1}: {len(texto)} caracteres, primeras 200 chars: {texto[:200]}", file=sys.stderr)
-                        tablas = page.extract_tables()
-                        print(f"[DEBUG] - Página {i+1}: {len(tablas) if tablas else 0} tablas", file=sys.stderr)
+                print(f"[DEBUG] - Total páginas: {paginas.total_paginas}", file=sys.stderr)
+                for i in range(min(3, paginas.total_paginas)):  # Solo primeras 3 páginas
+                    texto = paginas.texto(i)
+                    if texto:
+                        print(f"[DEBUG] - Página {i+1}: {len(texto)} caracteres, primeras 200 chars: {texto[:200]}", file=sys.stderr)
+                    tablas = paginas.tablas(i)
+                    print(f"[DEBUG] - Página {i+1}: {len(tablas) if tablas else 0} tablas", file=sys.stderr)
             except Exception as e:
                 print(f"[DEBUG] Error obteniendo info del PDF: {str(e)}", file=sys.stderr)
             return {'error': 'No se pudieron extraer productos del PDF. El PDF podría no contener tablas o formato reconocible. Intenta usar una API Key de Gemini para PDFs complejos.'}
@@ -838,14 +1785,11 @@ def procesar_pdf(archivo_path: str, api_key: str = None) -> List[Dict[str, Any]]
         # Fase 2: extraer Balance General y Distribución de Saldo si el PDF los contiene
         texto_completo_pdf = ''
         try:
-            with pdfplumber.open(archivo_path) as pdf:
-                for page in pdf.pages:
-                    t = page.extract_text()
-                    if t:
-                        texto_completo_pdf += t + '\n'
+            texto_completo_pdf = paginas.texto_completo()
         except Exception:
             pass
-        datos_financieros = _extraer_balance_y_distribucion(texto_completo_pdf) if texto_completo_pdf else {}
+        with _medir_fase('balance'):
+            datos_financieros = _extraer_balance_y_distribucion(texto_completo_pdf) if texto_completo_pdf else {}
         if datos_financieros:
             print(f"[DEBUG] Balance/Distribución extraídos del PDF", file=sys.stderr)
             # Si el PDF parece solo financiero (sin listado de artículos), no devolver productos falsos
@@ -874,54 +1818,318 @@ def procesar_pdf(archivo_path: str, api_key: str = None) -> List[Dict[str, Any]]
     except Exception as e:
         return {'error': f'Error procesando PDF: {str(e)}'}
 
-def main():
-    """Función principal de entrada"""
-    if len(sys.argv) < 3:
-        print(json.dumps({'exito': False, 'mensaje': 'Argumentos insuficientes'}))
-        sys.exit(1)
-        
-    tipo = sys.argv[1].lower()
-    archivo = sys.argv[2]
-    api_key = sys.argv[3] if len(sys.argv) > 3 else None
-    
+# Opciones de línea de comandos que no llevan valor
+_OPCIONES_SIN_VALOR = frozenset({'serve', 'startup-profile', 'sin-cache'})
+
+# Dependencias pesadas de cada ruta; solo se importan cuando el trabajo las necesita
+_DEPENDENCIAS_EXCEL = ('numpy', 'pandas', 'openpyxl')
+_DEPENDENCIAS_PDF = ('pdfplumber',)
+
+def _dependencias_trabajo(tipo: str, api_key: str, opciones: Dict[str, Any]) -> List[str]:
+    """Módulos que cargará el trabajo según su tipo y opciones"""
+    if tipo in ['xlsx', 'xls']:
+        if opciones.get('motor') == 'streaming' and int(opciones.get('procesos') or 1) <= 1:
+            return ['openpyxl']
+        return list(_DEPENDENCIAS_EXCEL)
+    if tipo == 'pdf':
+        usa_gemini = api_key and api_key.strip() and not extraccionIA.URL_MODELO
+        return list(_DEPENDENCIAS_PDF) + (['google.generativeai'] if usa_gemini else [])
+    return []
+
+def _perfil_arranque(tipo: str, api_key: str, opciones: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    --startup-profile: importa las dependencias del trabajo midiendo cuánto tarda cada una.
+    Los módulos ya cargados (p. ej. en --serve después del primer trabajo) cuentan ~0 ms.
+    """
+    perfil = {'cargaScriptMs': round(_TIEMPO_CARGA_MS, 1), 'importsMs': {}}
+    for modulo in _dependencias_trabajo(tipo, api_key, opciones):
+        inicio = time.perf_counter()
+        try:
+            importlib.import_module(modulo)
+        except ImportError:
+            # El procesamiento reporta el error habitual de librería no instalada
+            perfil['importsMs'][modulo] = None
+            continue
+        perfil['importsMs'][modulo] = round((time.perf_counter() - inicio) * 1000, 1)
+    perfil['hastaInicioTrabajoMs'] = round((time.perf_counter() - _INICIO_CARGA) * 1000, 1)
+    for modulo, ms in perfil['importsMs'].items():
+        print(f"[STARTUP] import {modulo}: {'no instalado' if ms is None else f'{ms} ms'}", file=sys.stderr)
+    print(f"[STARTUP] carga del script: {perfil['cargaScriptMs']} ms; hasta iniciar el trabajo: {perfil['hastaInicioTrabajoMs']} ms", file=sys.stderr)
+    return perfil
+
+def _separar_opciones(argumentos: List[str]) -> Any:
+    """
+    Separa los argumentos posicionales (tipo, archivo, api_key) de las opciones
+    '--nombre valor' o '--nombre=valor'. Retorna (posicionales, opciones).
+    """
+    posicionales = []
+    opciones = {}
+    i = 0
+    while i < len(argumentos):
+        arg = argumentos[i]
+        if arg.startswith('--'):
+            nombre, _, valor = arg[2:].partition('=')
+            if nombre in _OPCIONES_SIN_VALOR:
+                valor = valor or True
+            elif not valor and i + 1 < len(argumentos):
+                i += 1
+                valor = argumentos[i]
+            opciones[nombre] = valor
+        else:
+            posicionales.append(arg)
+        i += 1
+    return posicionales, opciones
+
+# Formatos de salida del CLI (--output): un JSON con todo el resultado, o NDJSON con un
+# registro {"tipo": "producto", ...} por producto y un registro {"tipo": "resumen", ...} al final
+FORMATOS_SALIDA = ('json', 'ndjson')
+
+
+class ErrorImportacion(Exception):
+    """Error del archivo (no del script): se informa como exito false con código de salida 0"""
+
+
+def _iterar_excel_streaming(archivo_path: str) -> Iterator[Dict[str, Any]]:
+    """
+    procesar_excel con el motor 'streaming' en un solo proceso, sin juntar la lista:
+    los productos se entregan mientras se leen las filas.
+    """
+    print(f"[DEBUG] Iniciando procesamiento Excel: {archivo_path} (motor: streaming, procesos: 1)", file=sys.stderr)
+    aciertos, fallos = cache_columnas.aciertos, cache_columnas.fallos
+    total = 0
+    try:
+        for producto in iterar_productos_excel(archivo_path):
+            total += 1
+            yield producto
+    except Exception as e:
+        print(f"[DEBUG] ERROR procesando Excel: {str(e)}", file=sys.stderr)
+        print(f"[DEBUG] Traceback Excel: {traceback.format_exc()}", file=sys.stderr)
+        raise ErrorImportacion(f'Error procesando Excel: {str(e)}') from e
+    cache_columnas.guardar()
+    print(f"[DEBUG] Cache de columnas: {cache_columnas.aciertos - aciertos} aciertos, {cache_columnas.fallos - fallos} fallos", file=sys.stderr)
+    print(f"[DEBUG] Total productos encontrados en todas las hojas: {total}", file=sys.stderr)
+
+
+def _registros_con_resumen(productos: Iterable[Dict[str, Any]], extras: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    total = 0
+    for producto in productos:
+        total += 1
+        yield {'tipo': 'producto', **producto}
+    yield {'tipo': 'resumen', 'exito': True, 'codigoSalida': 0, 'totalProductos': total, **extras}
+
+
+def _resumen_error(mensaje: str, codigo: int, **extras) -> Dict[str, Any]:
+    return {'tipo': 'resumen', 'exito': False, 'codigoSalida': codigo, 'mensaje': mensaje, **extras}
+
+
+def iterar_importacion(tipo: str, archivo: str, api_key: str = None, opciones: Dict[str, Any] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Ejecuta un trabajo de importación y genera sus registros: {'tipo': 'producto', ...} por
+    producto y, al final, {'tipo': 'resumen', 'exito', 'codigoSalida', 'totalProductos',
+    'balanceGeneral'?, 'distribucionSaldo'?, ...}. Con el motor Excel 'streaming' (un proceso)
+    los productos salen mientras se leen las filas; si la lectura falla a mitad, el resumen
+    con exito false llega después de los productos ya entregados. En los demás casos salen
+    al terminar de parsear (en un PDF, Balance/Distribución pueden descartar los productos).
+    """
+    opciones = opciones or {}
+    tipo = (tipo or '').lower()
+
     # Validar archivo
-    if not os.path.exists(archivo):
-        print(json.dumps({'exito': False, 'mensaje': f'Archivo no encontrado: {archivo}'}))
-        sys.exit(1)
-        
-    resultado = []
-    
+    if not archivo or not os.path.exists(archivo):
+        yield _resumen_error(f'Archivo no encontrado: {archivo}', 1)
+        return
+
+    perfil = _perfil_arranque(tipo, api_key, opciones) if opciones.get('startup-profile') else None
+
     try:
-        if tipo in ['xlsx', 'xls']:
-            resultado = procesar_excel(archivo)
-        elif tipo == 'pdf':
-            resultado = procesar_pdf(archivo, api_key)
-        else:
-            resultado = {'error': 'Formato no soportado. Use XLSX, XLS o PDF'}
-            
-        # Verificar si el resultado es un dict de error
-        if isinstance(resultado, dict) and 'error' in resultado:
-            # Imprimir JSON de error
-            print(json.dumps({'exito': False, 'mensaje': resultado['error']}))
+        # El mismo archivo (mismo contenido) retorna el resultado ya parseado; --sin-cache lo
+        # vuelve a parsear y reemplaza la entrada. Con API key el resultado viene del modelo
+        # de IA, y cambia con el modelo y el tamaño de los fragmentos.
+        # Sin --umbral-similitud (ni IMPORT_UMBRAL_SIMILITUD) solo se deduplican nombres iguales
+        umbral_similitud = opciones.get('umbral-similitud') or coincidenciaNombres.UMBRAL_SIMILITUD
+        umbral_similitud = float(umbral_similitud) if umbral_similitud is not None else None
+        cache = cacheImportacion.cache_resultados
+        clave = cache.clave(
+            cacheImportacion.hash_archivo(archivo), 'importProducts', tipo,
+            extraccionIA.firma_configuracion() if api_key and api_key.strip() else False,
+            umbral_similitud, cacheImportacion.version_codigo(os.path.abspath(__file__)),
+            cacheImportacion.version_codigo(os.path.abspath(coincidenciaNombres.__file__)),
+            cacheImportacion.version_codigo(os.path.abspath(extraccionIA.__file__))
+        )
+        guardada = None if opciones.get('sin-cache') else cache.leer(clave)
+        try:
+            primero = next(guardada, None) if guardada is not None else None
+        except ValueError:
+            primero = None  # Entrada corrupta: se vuelve a parsear y se reemplaza
+        if primero is not None:
+            print(f"[DEBUG] Resultado tomado de la cache ({clave[:12]})", file=sys.stderr)
+            for registro in itertools.chain([primero], guardada):
+                if registro['tipo'] == 'resumen':
+                    registro['desdeCache'] = True
+                    if perfil:
+                        registro['perfilArranque'] = perfil
+                yield registro
+            return
+
+        extras = {}
+        resultado = None
+        if tipo in ['xlsx', 'xls'] and opciones.get('motor') == 'streaming' and int(opciones.get('procesos') or 1) <= 1:
+            productos = _iterar_excel_streaming(archivo)
         else:
+            if tipo in ['xlsx', 'xls']:
+                resultado = procesar_excel(
+                    archivo,
+                    opciones.get('motor', 'vectorizado'),
+                    int(opciones.get('procesos') or 1)
+                )
+            elif tipo == 'pdf':
+                resultado = procesar_pdf(
+                    archivo, api_key, int(opciones.get('procesos') or 1), umbral_similitud,
+                    bool(opciones.get('sin-cache'))
+                )
+            else:
+                resultado = {'error': 'Formato no soportado. Use XLSX, XLS o PDF'}
+
+            # Verificar si el resultado es un dict de error
+            if isinstance(resultado, dict) and 'error' in resultado:
+                yield _resumen_error(resultado['error'], 0)
+                return
+
             # Resultado puede ser lista (solo productos) o dict (productos + balanceGeneral + distribucionSaldo)
-            productos_lista = resultado.get('productos', resultado) if isinstance(resultado, dict) else resultado
-            if not isinstance(productos_lista, list):
-                print(json.dumps({'exito': False, 'mensaje': 'Formato de respuesta inválido'}))
-                sys.exit(1)
-            salida = {'exito': True, 'productos': productos_lista}
+            productos = resultado.get('productos', resultado) if isinstance(resultado, dict) else resultado
+            if not isinstance(productos, list):
+                yield _resumen_error('Formato de respuesta inválido', 1)
+                return
             if isinstance(resultado, dict):
                 if resultado.get('balanceGeneral'):
-                    salida['balanceGeneral'] = resultado['balanceGeneral']
+                    extras['balanceGeneral'] = resultado['balanceGeneral']
                 if resultado.get('distribucionSaldo'):
-                    salida['distribucionSaldo'] = resultado['distribucionSaldo']
-            print(json.dumps(salida, ensure_ascii=False))
-            
+                    extras['distribucionSaldo'] = resultado['distribucionSaldo']
+
+        # La entrada de la cache se publica solo si todos los registros se generan sin error,
+        # y nunca para el resultado del método básico cuando falló la extracción con IA
+        registros = _registros_con_resumen(productos, extras)
+        if not (isinstance(resultado, dict) and resultado.get('errorIA')):
+            registros = cache.escribir(clave, registros)
+        for registro in registros:
+            if registro['tipo'] == 'resumen' and perfil:
+                registro['perfilArranque'] = perfil
+            yield registro
+
+    except ErrorImportacion as e:
+        yield _resumen_error(str(e), 0)
     except Exception as e:
         # Capturar cualquier error no controlado
         tb = traceback.format_exc()
-        print(json.dumps({'exito': False, 'mensaje': f'Error interno: {str(e)}', 'trace': tb}))
+        yield _resumen_error(f'Error interno: {str(e)}', 1, trace=tb)
+
+def ejecutar_importacion(tipo: str, archivo: str, api_key: str = None, opciones: Dict[str, Any] = None) -> Any:
+    """
+    Ejecuta un trabajo de importación y retorna (salida, codigo_salida).
+    'salida' es el dict JSON que se entrega a Node; codigo_salida es 1 en los casos
+    en que el CLI de una sola ejecución termina con sys.exit(1).
+    """
+    productos = []
+    resumen = None
+    # Consumir todos los registros: la entrada de la cache se publica al terminar
+    for registro in iterar_importacion(tipo, archivo, api_key, opciones):
+        if registro.pop('tipo') == 'producto':
+            productos.append(registro)
+        else:
+            resumen = registro
+    codigo = resumen.pop('codigoSalida')
+    if not resumen.pop('exito'):
+        return {'exito': False, **resumen}, codigo
+    del resumen['totalProductos']
+    return {'exito': True, 'productos': productos, **resumen}, codigo
+
+def _escribir_ndjson(registros: Iterable[Dict[str, Any]], **campos) -> int:
+    """Escribe un registro por línea en stdout (agregando 'campos') y retorna el código de salida del resumen"""
+    codigo = 1
+    for registro in registros:
+        if campos:
+            registro = {**campos, **registro}
+        if registro['tipo'] == 'resumen':
+            codigo = registro['codigoSalida']
+        sys.stdout.write(json.dumps(registro, ensure_ascii=registro.get('exito') is False) + '\n')
+    sys.stdout.flush()
+    return codigo
+
+def servir():
+    """
+    Modo worker persistente (--serve): lee trabajos JSON, uno por línea, desde stdin
+    y escribe un resultado JSON por trabajo en stdout. pandas/openpyxl/pdfplumber
+    quedan cargados entre trabajos.
+
+    Trabajo:   {"id": 1, "tipo": "xlsx", "archivo": "/ruta", "apiKey": null, "opciones": {"procesos": 4}}
+    Resultado: {"id": 1, "codigoSalida": 0, "exito": true, "productos": [...]}
+
+    Con "opciones": {"output": "ndjson"} el trabajo escribe sus registros NDJSON, cada uno
+    con su "id"; el registro "resumen" (con "codigoSalida") indica que el trabajo terminó.
+    """
+    print("[DEBUG] Worker de importación listo", file=sys.stderr)
+    while True:
+        linea = sys.stdin.readline()
+        if not linea:
+            break
+        linea = linea.strip()
+        if not linea:
+            continue
+        id_trabajo = None
+        try:
+            trabajo = json.loads(linea)
+            id_trabajo = trabajo.get('id')
+            opciones = trabajo.get('opciones') or {}
+            if opciones.get('output') == 'ndjson':
+                _escribir_ndjson(
+                    iterar_importacion(trabajo.get('tipo'), trabajo.get('archivo'), trabajo.get('apiKey'), opciones),
+                    id=id_trabajo
+                )
+                continue
+            salida, codigo = ejecutar_importacion(
+                trabajo.get('tipo'),
+                trabajo.get('archivo'),
+                trabajo.get('apiKey'),
+                opciones
+            )
+        except Exception as e:
+            salida, codigo = {'exito': False, 'mensaje': f'Trabajo inválido: {str(e)}'}, 1
+        respuesta = {'id': id_trabajo, 'codigoSalida': codigo}
+        respuesta.update(salida)
+        sys.stdout.write(json.dumps(respuesta, ensure_ascii=False) + '\n')
+        sys.stdout.flush()
+
+def main():
+    """Función principal de entrada"""
+    _configurar_salida()
+    argumentos, opciones = _separar_opciones(sys.argv[1:])
+    if opciones.get('serve'):
+        servir()
+        return
+
+    if len(argumentos) < 2:
+        print(json.dumps({'exito': False, 'mensaje': 'Argumentos insuficientes'}))
         sys.exit(1)
 
+    formato = opciones.get('output') or 'json'
+    if formato not in FORMATOS_SALIDA:
+        print(json.dumps({'exito': False, 'mensaje': f'Formato de salida no soportado: {formato}. Use {", ".join(FORMATOS_SALIDA)}'}))
+        sys.exit(1)
+
+    tipo = argumentos[0]
+    archivo = argumentos[1]
+    api_key = argumentos[2] if len(argumentos) > 2 else None
+
+    if formato == 'ndjson':
+        codigo = _escribir_ndjson(iterar_importacion(tipo, archivo, api_key, opciones))
+    else:
+        salida, codigo = ejecutar_importacion(tipo, archivo, api_key, opciones)
+        print(json.dumps(salida, ensure_ascii=salida.get('exito') is not True))
+    if codigo:
+        sys.exit(codigo)
+
+# Tiempo de carga del script (imports de la biblioteca estándar y definiciones), sin dependencias pesadas
+_TIEMPO_CARGA_MS = (time.perf_counter() - _INICIO_CARGA) * 1000
+
 if __name__ == '__main__':
     main()
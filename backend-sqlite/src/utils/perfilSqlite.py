@@ -0,0 +1,104 @@
+# backend-sqlite/src/utils/perfilSqlite.py
+"""
+Perfiles de conexión SQLite para el motor SQLAlchemy del importador.
+
+- "rendimiento": WAL, synchronous=NORMAL, caché y mmap grandes y temporales en memoria
+  (los mismos criterios que src/config/database.js aplica a la base del backend Node).
+- "defecto": los valores por defecto de SQLite, para comparar.
+
+El perfil se aplica en cada conexión nueva mediante el evento "connect" del motor; se
+registra una vez, donde se crea el motor o al iniciar la aplicación (no en una solicitud).
+Además, carga_masiva() permite diferir la actualización de los índices secundarios de
+productos hasta el final de una carga grande.
+"""
+import os
+import threading
+import weakref
+from contextlib import contextmanager
+
+from sqlalchemy import Table, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+PERFILES_SQLITE = {
+    "defecto": {},
+    "rendimiento": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        # Negativo = KiB (64 MB por defecto)
+        "cache_size": -int(os.environ.get("IMPORT_SQLITE_CACHE_KB", "65536")),
+        "mmap_size": int(os.environ.get("IMPORT_SQLITE_MMAP_MB", "256")) * 1024 * 1024,
+        "temp_store": "MEMORY",
+    },
+}
+
+PERFIL_SQLITE = os.environ.get("IMPORT_PERFIL_SQLITE", "rendimiento")
+
+# Motores a los que ya se les registró un perfil (motor -> nombre del perfil)
+_motores_configurados = weakref.WeakKeyDictionary()
+
+# Una carga masiva a la vez: dos cargas simultáneas se pisarían los DROP/CREATE INDEX
+_candado_carga_masiva = threading.Lock()
+
+
+def aplicar_perfil(motor: Engine, perfil: str = None) -> bool:
+    """
+    Registra el perfil para las conexiones nuevas del motor. Las conexiones ya abiertas
+    en el pool se descartan para que todas usen el perfil. Es idempotente; retorna
+    False si el motor no es SQLite.
+    """
+    perfil = perfil or PERFIL_SQLITE
+    if perfil not in PERFILES_SQLITE:
+        raise ValueError(f"Perfil SQLite no soportado: {perfil}. Use {', '.join(PERFILES_SQLITE)}")
+    if motor.dialect.name != "sqlite":
+        return False
+    if _motores_configurados.get(motor) == perfil:
+        return True
+    if motor in _motores_configurados:
+        raise ValueError(f"El motor ya tiene el perfil SQLite {_motores_configurados[motor]}")
+
+    pragmas = PERFILES_SQLITE[perfil]
+
+    @event.listens_for(motor, "connect")
+    def _aplicar_pragmas(conexion_dbapi, _registro):
+        cursor = conexion_dbapi.cursor()
+        try:
+            for pragma, valor in pragmas.items():
+                cursor.execute(f"PRAGMA {pragma} = {valor}")
+        finally:
+            cursor.close()
+
+    _motores_configurados[motor] = perfil
+    # Cerrar las conexiones libres del pool (las que están en uso se cierran al devolverse).
+    # Una base en memoria se perdería al cerrar su única conexión.
+    if motor.url.database not in (None, "", ":memory:"):
+        motor.dispose()
+    return True
+
+
+@contextmanager
+def carga_masiva(db: Session, tabla: Table):
+    """
+    Elimina los índices no únicos de la tabla durante la carga y los recrea al final
+    (también si la carga falla), de modo que cada inserción no los actualice fila a fila.
+    Las restricciones UNIQUE se mantienen: se necesitan para detectar duplicados.
+
+    Los índices se eliminan de la tabla compartida: mientras dura la carga, cualquier otra
+    consulta que los usaría recorre la tabla completa. Es para ventanas de mantenimiento
+    sin otro tráfico. Las cargas masivas de este proceso se ejecutan de a una (las demás
+    esperan); con varios procesos servidores no hay exclusión entre ellos.
+    """
+    indices = [indice for indice in tabla.indexes if not indice.unique]
+    with _candado_carga_masiva:
+        conexion = db.connection()
+        for indice in indices:
+            indice.drop(bind=conexion, checkfirst=True)
+        db.commit()
+        try:
+            yield
+        finally:
+            db.rollback()
+            conexion = db.connection()
+            for indice in indices:
+                indice.create(bind=conexion, checkfirst=True)
+            db.commit()
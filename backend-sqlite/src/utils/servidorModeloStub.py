@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Servidor local que reemplaza al modelo de lenguaje en la extracción con IA (extraccionIA.py).
+
+Recibe POST {"prompt"} y responde {"texto"} con el array JSON de los productos de las
+líneas 'ARTICULO ... CANTIDAD COSTO RD$ TOTAL' del texto del documento, como respondería
+el modelo, después de una latencia fija. Puede responder 503 a una fracción de las
+solicitudes para ejercitar los reintentos, y cuenta las solicitudes y la concurrencia
+máxima que recibió.
+
+Lo usan los benchmarks (benchmarkImport.py, caso ia). También sirve para probar el
+script o el backend sin API key de Gemini:
+
+    python servidorModeloStub.py --puerto 8765 --latencia 0.5
+    IMPORT_IA_URL=http://127.0.0.1:8765 python importProducts.py pdf reporte.pdf cualquier-clave
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+# Misma marca que extraccionIA.MARCA_DOCUMENTO: lo que sigue es el texto del fragmento
+MARCA_DOCUMENTO = '\n\nTexto del documento:\n'
+
+
+def productos_de_texto(texto: str) -> List[Dict[str, Any]]:
+    """Productos de las líneas de reporte con 'CANTIDAD COSTO RD$ TOTAL' al final"""
+    productos = []
+    for linea in texto.splitlines():
+        antes, separador, _ = linea.rpartition('RD$')
+        partes = antes.split()
+        if not separador or len(partes) < 3:
+            continue
+        try:
+            cantidad = float(partes[-2].replace(',', ''))
+            precio = float(partes[-1].replace(',', ''))
+        except ValueError:
+            continue
+        productos.append({'nombre': ' '.join(partes[:-2]), 'codigoBarras': '', 'cantidad': cantidad, 'precio': precio})
+    return productos
+
+
+class ServidorModeloStub(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, direccion, latencia: float = 0.0, tasa_error: float = 0.0, semilla: int = None):
+        super().__init__(direccion, _ManejadorModelo)
+        self.latencia = latencia
+        self.tasa_error = tasa_error
+        self.azar = random.Random(semilla)
+        self.candado = threading.Lock()
+        self.solicitudes = 0
+        self.errores = 0
+        self.en_curso = 0
+        self.concurrencia_maxima = 0
+
+    @property
+    def url(self) -> str:
+        host, puerto = self.server_address[:2]
+        return f'http://{host}:{puerto}'
+
+
+class _ManejadorModelo(BaseHTTPRequestHandler):
+    def do_POST(self):
+        servidor = self.server
+        with servidor.candado:
+            servidor.solicitudes += 1
+            servidor.en_curso += 1
+            servidor.concurrencia_maxima = max(servidor.concurrencia_maxima, servidor.en_curso)
+            fallar = servidor.azar.random() < servidor.tasa_error
+            servidor.errores += fallar
+        try:
+            try:
+                cuerpo = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+                prompt = str(cuerpo.get('prompt', ''))
+            except (ValueError, AttributeError):
+                self._responder(400, {'error': 'Se esperaba un JSON {"prompt": ...}'})
+                return
+            time.sleep(servidor.latencia)
+            if fallar:
+                self._responder(503, {'error': 'Servicio no disponible (simulado)'})
+                return
+            texto = prompt.split(MARCA_DOCUMENTO, 1)[-1]
+            self._responder(200, {'texto': json.dumps(productos_de_texto(texto), ensure_ascii=False)})
+        finally:
+            with servidor.candado:
+                servidor.en_curso -= 1
+
+    def _responder(self, estado: int, datos: Dict[str, Any]) -> None:
+        cuerpo = json.dumps(datos, ensure_ascii=False).encode('utf-8')
+        self.send_response(estado)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, formato, *args):
+        pass  # Sin una línea por solicitud en stderr
+
+
+def iniciar(puerto: int = 0, latencia: float = 0.0, tasa_error: float = 0.0, semilla: int = None) -> ServidorModeloStub:
+    """Inicia el servidor en un hilo (puerto 0: uno libre) y lo retorna; se detiene con shutdown()"""
+    servidor = ServidorModeloStub(('127.0.0.1', puerto), latencia, tasa_error, semilla)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Servidor local que imita al modelo de la extracción con IA')
+    parser.add_argument('--puerto', type=int, default=8765)
+    parser.add_argument('--latencia', type=float, default=0.5, help='Segundos que tarda cada respuesta')
+    parser.add_argument('--tasa-error', type=float, default=0.0, help='Fracción de solicitudes que responden 503')
+    args = parser.parse_args()
+    servidor = ServidorModeloStub(('127.0.0.1', args.puerto), args.latencia, args.tasa_error)
+    print(f'Modelo stub escuchando en {servidor.url} (IMPORT_IA_URL)')
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+# backend-sqlite/test_coincidenciaNombres.py
+"""
+Pruebas de la coincidencia de nombres de productos (src/utils/coincidenciaNombres.py).
+
+Uso (desde backend-sqlite):
+    python -m pytest test_coincidenciaNombres.py
+"""
+import pytest
+
+from src.utils import coincidenciaNombres
+
+# Productos distintos que solo se diferencian por una negación o preposición
+PARES_DISTINTOS = [
+    ('Pan sin sal', 'Pan con sal'),
+    ('Leche sin lactosa', 'Leche con lactosa'),
+    ('Galletas sin azucar', 'Galletas con azúcar'),
+    ('Alimento para perro', 'Alimento por perro'),
+]
+
+
+@pytest.mark.parametrize('nombre_a, nombre_b', PARES_DISTINTOS)
+def test_normalizar_conserva_negaciones_y_preposiciones(nombre_a, nombre_b):
+    assert coincidenciaNombres.normalizar(nombre_a) != coincidenciaNombres.normalizar(nombre_b)
+
+
+@pytest.mark.parametrize('umbral', [1, coincidenciaNombres.UMBRAL_SUGERIDO])
+@pytest.mark.parametrize('nombre_a, nombre_b', PARES_DISTINTOS)
+def test_con_y_sin_no_son_el_mismo_producto(nombre_a, nombre_b, umbral):
+    indice = coincidenciaNombres.IndiceNombres(umbral)
+    indice.agregar('catalogo', nombre_a)
+    assert indice.buscar(nombre_b) is None
+
+
+def test_umbral_1_solo_acepta_nombres_iguales_tras_normalizar():
+    indice = coincidenciaNombres.IndiceNombres(1)
+    indice.agregar('aceite', 'ACEITE EL GALLEGO DE SOBRE')
+    indice.agregar('azucar', 'Azúcar Morena')
+
+    assert indice.buscar('Aceite El Gallego Sobre') == ('aceite', 1.0)
+    assert indice.buscar('azucar  morena.') == ('azucar', 1.0)
+    assert indice.buscar('Aceite Galego Sobre') is None
+    assert indice.buscar('Azúcar Morena 1kg') is None
+
+
+def test_umbral_sugerido_acepta_errores_de_tipeo():
+    indice = coincidenciaNombres.IndiceNombres(coincidenciaNombres.UMBRAL_SUGERIDO)
+    indice.agregar('aceite', 'ACEITE EL GALLEGO DE SOBRE')
+    assert indice.buscar('Aceite Galego Sobre')[0] == 'aceite'
@@ -0,0 +1,94 @@
+# backend-sqlite/test_importController.py
+"""
+Pruebas de la importación diferencial del endpoint FastAPI (src/controllers/importController.py)
+contra una base SQLite nueva en cada prueba.
+
+Uso (desde backend-sqlite):
+    python -m pytest test_importController.py
+"""
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from src import models
+from src.controllers import importController
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'inventario.db'}")
+    models.Base.metadata.create_all(engine)
+    sesion = sessionmaker(bind=engine)()
+    try:
+        yield sesion
+    finally:
+        sesion.close()
+        engine.dispose()
+
+
+def _fila(nombre, precio=1.0):
+    return {'nombre': nombre, 'categoria': 'General', 'precio': precio, 'stock': 1}
+
+
+def _importar_diferencial(db, lotes):
+    indice = importController.IndiceCatalogo.cargar(db, con_valores=True)
+    cambios = importController.ResumenCambios()
+    for _ in importController._importar_por_lotes(db, lotes, indice, cambios, desactivar_ausentes=True):
+        pass
+    return cambios
+
+
+def _activos(db):
+    return dict(db.execute(select(models.Producto.nombre, models.Producto.activo)).all())
+
+
+def test_desactivar_ausentes_no_desactiva_los_productos_creados(db):
+    db.add(models.Producto(nombre='Viejo', categoria='General', precio=1.0, activo=True))
+    db.commit()
+
+    cambios = _importar_diferencial(db, [[_fila('Nuevo')]])
+
+    assert _activos(db) == {'Viejo': False, 'Nuevo': True}
+    assert cambios.insertados == 1
+    assert cambios.desactivados == 1
+
+
+def test_desactivar_ausentes_con_varios_lotes(db):
+    db.add_all([
+        models.Producto(nombre='Viejo', categoria='General', precio=1.0, activo=True),
+        models.Producto(nombre='Presente', categoria='General', precio=1.0, activo=True),
+    ])
+    db.commit()
+
+    # 'Nuevo' se crea en el primer lote y se actualiza en el segundo
+    cambios = _importar_diferencial(db, [
+        [_fila('Nuevo'), _fila('Otro nuevo')],
+        [_fila('Presente', 2.0), _fila('Nuevo', 3.0)],
+    ])
+
+    assert _activos(db) == {'Viejo': False, 'Presente': True, 'Nuevo': True, 'Otro nuevo': True}
+    assert cambios.desactivados == 1
+
+
+def test_sin_umbral_solo_coinciden_nombres_iguales(monkeypatch):
+    monkeypatch.setattr(importController.coincidenciaNombres, 'UMBRAL_SIMILITUD', None)
+    indice = importController.IndiceCatalogo()
+    indice.registrar(1, 'Pan con sal', None)
+    indice.registrar(2, 'ACEITE EL GALLEGO DE SOBRE', None)
+
+    assert indice.ubicar('pan  con SAL', None) == (1, False)
+    assert indice.ubicar('Pan sin sal', None) == (None, False)
+    assert indice.ubicar('Aceite El Gallego Sobre', None) == (None, False)
+
+
+def test_similitud_1_no_une_con_y_sin(db):
+    db.add_all([
+        models.Producto(nombre='Pan con sal', categoria='General', precio=1.0, activo=True),
+        models.Producto(nombre='Leche sin lactosa', categoria='General', precio=1.0, activo=True),
+    ])
+    db.commit()
+
+    indice = importController.IndiceCatalogo.cargar(db, similitud_nombres=1)
+    assert indice.ubicar('Pan sin sal', None) == (None, False)
+    assert indice.ubicar('Leche con lactosa', None) == (None, False)
+    assert indice.ubicar('Leche  sin lactosa.', None) == (2, True)